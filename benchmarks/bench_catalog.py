@@ -0,0 +1,98 @@
+"""
+Exercise catalog lookups at catalog scale.
+
+Builds a CatalogIndex of synthetic exercise names (movement, equipment,
+variant and a number, in Persian, so words repeat the way real names do) and
+times the lookups the bot makes: the inline search for every prefix of a name
+as it is typed, "did you mean" for a name with one letter changed, and the
+exact lookup by normalized key.
+
+    python benchmarks/bench_catalog.py --entries 100000 --queries 2000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from catalog import CatalogIndex  # noqa: E402
+
+MOVEMENTS = ['پرس', 'اسکوات', 'ددلیفت', 'جلو بازو', 'پشت بازو', 'زیر بغل', 'نشر', 'فلای', 'لانج', 'ساق',
+             'کرانچ', 'پلانک', 'شراگ', 'هیپ تراست', 'پول اور', 'کشش', 'شنا', 'بارفیکس', 'دیپ', 'زیر سینه']
+EQUIPMENT = ['هالتر', 'دمبل', 'سیم کش', 'دستگاه', 'اسمیت', 'کتل بل', 'کش', 'وزن بدن']
+VARIANTS = ['سینه', 'بالا سینه', 'پایین سینه', 'خوابیده', 'نشسته', 'ایستاده', 'تک دست', 'جفت', 'از جلو',
+            'از پشت', 'سوپر', 'دراپ', 'لاری', 'چکشی', 'معکوس', 'عریض', 'جمع', 'پا']
+LETTERS = 'ابپتثجچحخدذرزسشصضطظعغفقکگلمنوهی'
+
+
+def synthetic_names(count: int, rng: random.Random):
+    names = set()
+    while len(names) < count:
+        names.add(f"{rng.choice(MOVEMENTS)} {rng.choice(EQUIPMENT)} {rng.choice(VARIANTS)} {rng.randint(1, 400)}")
+    return sorted(names)
+
+
+def misspell(name: str, rng: random.Random) -> str:
+    positions = [i for i, ch in enumerate(name) if ch in LETTERS]
+    i = rng.choice(positions)
+    return name[:i] + rng.choice(LETTERS) + name[i + 1:]
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return (samples[len(samples) // 2] * 1e6, samples[int(len(samples) * 0.99)] * 1e6, samples[-1] * 1e6)
+
+
+def timed(func, queries):
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        func(query)
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--entries', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--budget-us', type=float, default=0,
+                        help="exit with status 1 when a p99 is above this many microseconds")
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    names = synthetic_names(args.entries, rng)
+    index = CatalogIndex()
+    start = time.perf_counter()
+    index.load(enumerate(names, 1))
+    load_seconds = time.perf_counter() - start
+
+    picked = [rng.choice(names) for _ in range(args.queries)]
+    typed = [name[:n] for name in picked[:args.queries // 10] for n in range(1, len(name) + 1)]
+    typos = [misspell(name, rng) for name in picked]
+    results = {
+        'inline search (every prefix)': timed(lambda q: index.prefix(q, 20), typed),
+        'did you mean (one typo)': timed(lambda q: index.similar(q, 3), typos),
+        'exact lookup': timed(index.lookup, picked),
+    }
+    # a typo can turn a word into another known word, so this stays a little under 100%
+    ids = {name: catalog_id for catalog_id, name in enumerate(names, 1)}
+    found = sum(bool(best) and best[0][0] == ids[name]
+                for name, best in zip(picked, (index.similar(q, 1) for q in typos)))
+
+    print(f"{len(index)} entries loaded in {load_seconds * 1000:.0f} ms")
+    print(f"{'lookup':32} {'p50 us':>8} {'p99 us':>8} {'max us':>8}")
+    for name, (p50, p99, worst) in results.items():
+        print(f"{name:32} {p50:8.1f} {p99:8.1f} {worst:8.1f}")
+    print(f"did you mean found the intended name first for {found / len(picked):.1%} of the typos")
+    if args.budget_us and any(p99 > args.budget_us for _, p99, _ in results.values()):
+        print(f"p99 above the budget of {args.budget_us:.0f} us")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Lookup latency before and after the index migration.
+
+Builds a database with the baseline schema (version 1), fills it with
+synthetic users, programs and exercises, times the hot lookups, then applies
+the remaining migrations and times them again.
+
+    python benchmarks/bench_indexes.py --exercises 1000000
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import migrations  # noqa: E402
+from ui import DAYS_PERSIAN  # noqa: E402
+
+QUERIES = {
+    'get_exercises': ("SELECT id, name, reps, sets, weight, gif, position FROM exercises "
+                      "WHERE program_id = ? ORDER BY position ASC, id ASC", 'program'),
+    'get_program_by_user_day': ("SELECT id, day_name FROM programs WHERE user_id = ? AND day_name = ?", 'user_day'),
+    'get_user_programs': ("SELECT id, day_name FROM programs WHERE user_id = ?", 'user'),
+    'active_session': ("SELECT id FROM sessions WHERE user_id = ? AND closed = 0 ORDER BY id DESC LIMIT 1", 'user'),
+}
+
+
+def populate(conn, exercises: int, per_program: int = 8):
+    programs = exercises // per_program
+    users = max(1, programs // len(DAYS_PERSIAN))
+    cur = conn.cursor()
+    cur.executemany("INSERT INTO programs (id, user_id, day_name, created_at) VALUES (?, ?, ?, '')",
+                    ((pid, pid // len(DAYS_PERSIAN), DAYS_PERSIAN[pid % len(DAYS_PERSIAN)]) for pid in range(1, programs + 1)))
+    cur.executemany("INSERT INTO exercises (program_id, name, reps, sets, weight, position) VALUES (?, ?, 10, 3, 40, ?)",
+                    ((1 + i // per_program, f"exercise {i % 50}", i % per_program) for i in range(exercises)))
+    cur.executemany("INSERT INTO sessions (user_id, program_id, started_at, closed) VALUES (?, ?, '', ?)",
+                    ((uid, 1 + uid * len(DAYS_PERSIAN), int(uid % 3 != 0)) for uid in range(users)))
+    conn.commit()
+    return programs, users
+
+
+def run_queries(conn, programs: int, users: int, samples: int):
+    rnd = random.Random(42)
+    results = {}
+    for name, (sql, kind) in QUERIES.items():
+        params = []
+        for _ in range(samples):
+            if kind == 'program':
+                params.append((rnd.randint(1, programs),))
+            elif kind == 'user_day':
+                params.append((rnd.randrange(users), rnd.choice(DAYS_PERSIAN)))
+            else:
+                params.append((rnd.randrange(users),))
+        start = time.perf_counter()
+        for p in params:
+            conn.execute(sql, p).fetchall()
+        results[name] = (time.perf_counter() - start) / samples * 1e6
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--exercises', type=int, default=1_000_000)
+    parser.add_argument('--samples', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'bench.db'))
+        migrations.migrate(conn, target=1)
+        programs, users = populate(conn, args.exercises)
+        before = run_queries(conn, programs, users, args.samples)
+        start = time.perf_counter()
+        migrations.migrate(conn)
+        migrate_seconds = time.perf_counter() - start
+        after = run_queries(conn, programs, users, args.samples)
+        conn.close()
+
+    print(f"{args.exercises} exercises, {programs} programs, {users} users "
+          f"(migration took {migrate_seconds:.1f}s)")
+    print(f"{'lookup':<26}{'before (us)':>14}{'after (us)':>14}{'speedup':>10}")
+    for name in QUERIES:
+        print(f"{name:<26}{before[name]:>14.1f}{after[name]:>14.1f}{before[name] / after[name]:>9.0f}x")
+
+
+if __name__ == '__main__':
+    main()
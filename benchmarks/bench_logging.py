@@ -0,0 +1,79 @@
+"""
+Time a log call costs the event loop thread.
+
+Compares ``logging.basicConfig``-style synchronous writes (format and write
+on the calling thread) with the queue pipeline from logging_setup, where the
+caller only resolves the message and enqueues it. ``--sink-latency-ms``
+makes every write that slow, as a stalled terminal, pipe or disk would.
+
+    python benchmarks/bench_logging.py --records 100000
+    python benchmarks/bench_logging.py --records 2000 --sink-latency-ms 1
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import logging_setup  # noqa: E402
+from logging_setup import TEXT_FORMAT, make_formatter  # noqa: E402
+
+
+class SlowFileHandler(logging.FileHandler):
+    def __init__(self, path: str, latency: float):
+        super().__init__(path, encoding="utf-8")
+        self.latency = latency
+
+    def emit(self, record):
+        if self.latency:
+            time.sleep(self.latency)
+        super().emit(record)
+
+
+def timed(logger: logging.Logger, records: int) -> float:
+    start = time.perf_counter()
+    for i in range(records):
+        logger.info("user %d pressed %s", i, "exercise_done")
+    return (time.perf_counter() - start) / records * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--sink-latency-ms', type=float, default=0.0)
+    args = parser.parse_args()
+    logger = logging.getLogger("bench")
+    root = logging.getLogger()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        latency = args.sink_latency_ms / 1000
+        handler = SlowFileHandler(os.path.join(tmp, "sync.log"), latency)
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+        sync = timed(logger, args.records)
+        root.removeHandler(handler)
+        handler.close()
+
+        results = {}
+        for fmt in ("text", "json"):
+            writer = SlowFileHandler(os.path.join(tmp, f"queued-{fmt}.log"), latency)
+            writer.setFormatter(make_formatter(fmt))
+            logging_setup.setup_logging("INFO", writer=writer, sample="", queue_size=args.records)
+            results[fmt] = timed(logger, args.records)
+            # waits for the writer thread; the callers above did not
+            logging_setup.stop_logging()
+            writer.close()
+
+    print(f"{args.records} records, time on the calling thread per log call:")
+    print(f"  synchronous file handler   {sync:6.2f} us")
+    print(f"  queue pipeline, text       {results['text']:6.2f} us")
+    print(f"  queue pipeline, json       {results['json']:6.2f} us")
+
+
+if __name__ == '__main__':
+    main()
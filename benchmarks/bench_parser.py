@@ -0,0 +1,113 @@
+"""
+Exercise line parser throughput.
+
+Parses a corpus of typed lines (ASCII and Persian digits, decimal commas,
+sets x reps, gifs, and a share of bad lines) with exercise_parser and with
+the split-based parser it replaced, whose rules are copied below as the
+baseline. Also times parse_lines on one message of many lines.
+
+    python benchmarks/bench_parser.py --lines 50000 --bad 0.1
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from exercise_parser import ExerciseParseError, parse_line, parse_lines  # noqa: E402
+
+NAMES = ['پرس سینه', 'اسکوات', 'زیر بغل سیم‌کش', 'جلو بازو دمبل', 'Deadlift', 'ساق ۲']
+PERSIAN = str.maketrans('0123456789', '۰۱۲۳۴۵۶۷۸۹')
+
+
+def legacy_parse(text):
+    # the split-based parser program_io used before exercise_parser
+    tokens = text.split()
+    if len(tokens) < 3:
+        raise ValueError(text)
+    gif = None
+    if tokens[-1].startswith('http') or tokens[-1].endswith('.gif'):
+        gif = tokens[-1]
+        tokens = tokens[:-1]
+    weight = float(tokens[-1])
+    sets = int(tokens[-2])
+    reps = int(tokens[-3])
+    if len(tokens) < 4:
+        raise ValueError(text)
+    return ' '.join(tokens[:-3]), reps, sets, weight, gif
+
+
+def corpus(count: int, bad: float, rng: random.Random):
+    lines = []
+    for _ in range(count):
+        name = rng.choice(NAMES)
+        reps, sets, weight = rng.randint(5, 20), rng.randint(1, 6), rng.randint(0, 200)
+        kind = rng.random()
+        if kind < bad:
+            line = rng.choice([f"{name} {reps}", f"{name} ده {sets} {weight}", f"{name} {reps} {sets} {weight}o"])
+        elif kind < 0.5:
+            line = f"{name} {reps} {sets} {weight}"
+        elif kind < 0.7:
+            line = f"{name} {reps} {sets} {weight}".translate(PERSIAN)
+        elif kind < 0.85:
+            line = f"{name} {sets}x{reps} {weight},5"
+        else:
+            line = f"{name} {reps} {sets} {weight} https://example.com/{reps}.gif"
+        lines.append(line)
+    return lines
+
+
+def throughput(func, lines):
+    accepted = 0
+    start = time.perf_counter()
+    for line in lines:
+        try:
+            func(line)
+            accepted += 1
+        except ValueError:
+            pass
+    elapsed = time.perf_counter() - start
+    return len(lines) / elapsed, accepted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--lines', type=int, default=50000)
+    parser.add_argument('--bad', type=float, default=0.1, help="share of lines with a mistake")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    lines = corpus(args.lines, args.bad, random.Random(args.seed))
+
+    print(f"{len(lines)} lines, {args.bad:.0%} with a mistake")
+    for name, func in (('split-based (before)', legacy_parse), ('exercise_parser', parse_line)):
+        rate, accepted = throughput(func, lines)
+        print(f"  {name:22} {rate:10.0f} lines/s  {accepted / len(lines):6.1%} accepted")
+
+    good = [line for line in lines if not _fails(line)]
+    rate, _ = throughput(parse_line, good)
+    print(f"  {'valid lines only':22} {rate:10.0f} lines/s")
+    bad = [line for line in lines if _fails(line)]
+    if bad:
+        rate, _ = throughput(parse_line, bad)
+        print(f"  {'bad lines (diagnosed)':22} {rate:10.0f} lines/s")
+
+    message = '\n'.join(lines[:1000])
+    start = time.perf_counter()
+    results = parse_lines(message)
+    elapsed = time.perf_counter() - start
+    print(f"parse_lines: {len(results)} lines in one message in {elapsed * 1000:.1f} ms")
+
+
+def _fails(line: str) -> bool:
+    try:
+        parse_line(line)
+    except ExerciseParseError:
+        return True
+    return False
+
+
+if __name__ == '__main__':
+    main()
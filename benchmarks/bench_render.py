@@ -0,0 +1,79 @@
+"""
+Render cost per update, with and without the render cache.
+
+Times what a program view, an edit screen and a workout step cost to build
+(strings and InlineKeyboardMarkup objects) when rendered from scratch on
+every tap versus served from ProgramRenderer. The exercise lists come from
+an in-memory CachedDatabase, so the cached path includes its version lookup.
+
+    python benchmarks/bench_render.py --exercises 8 --iterations 20000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from telegram import InlineKeyboardMarkup
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from cache import CachedDatabase  # noqa: E402
+from database import AsyncDatabase  # noqa: E402
+from render import (  # noqa: E402
+    ProgramRenderer, render_edit_keyboard, render_step, render_summary, render_view_keyboard
+)
+from ui import dynamic_main_menu, main_menu_base  # noqa: E402
+
+
+async def run(exercises: int, iterations: int):
+    db = CachedDatabase(AsyncDatabase(":memory:"))
+    pid = await db.create_workout_program(1, "شنبه")
+    for i in range(exercises):
+        await db.add_exercise(pid, f"حرکت شماره {i}", 10, 3, 40.0 + i, None, i)
+    renderer = ProgramRenderer(db)
+    exercise_list = await db.get_exercises(pid)
+    session = {'session_id': 1, 'program_id': pid, 'version': await db.get_program_version(pid),
+               'exercises': exercise_list, 'current_index': 0}
+
+    async def per_tap_uncached():
+        items = await db.get_exercises(pid)
+        render_summary(items)
+        render_view_keyboard(pid, 1)
+        render_edit_keyboard(pid, items, 1)
+        render_step(items, 0)
+        InlineKeyboardMarkup(main_menu_base())
+
+    async def per_tap_cached():
+        await renderer.summary(pid)
+        await renderer.view_keyboard(pid, 1)
+        await renderer.edit_keyboard(pid, 1)
+        renderer.step(session)
+        dynamic_main_menu()
+
+    results = {}
+    for name, func in (('uncached', per_tap_uncached), ('cached', per_tap_cached)):
+        await func()
+        start = time.perf_counter()
+        for _ in range(iterations):
+            await func()
+        results[name] = (time.perf_counter() - start) / iterations * 1e6
+    await db.close()
+
+    print(f"{exercises} exercises per program, {iterations} iterations")
+    print("render per update (summary + view/edit keyboards + workout step + main menu):")
+    print(f"  from scratch   {results['uncached']:8.1f} us")
+    print(f"  render cache   {results['cached']:8.1f} us  ({results['uncached'] / results['cached']:.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--exercises', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(run(args.exercises, args.iterations))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Cold start of ``bot.main()``: from process spawn until the bot polls for updates.
+
+Runs the real entry point in a fresh interpreter, against the fake Bot API
+of fake_telegram.py, and times when it first calls getMe (imports done, the
+application built and initialized) and getUpdates (post_init done, polling).
+Each run uses a new database, an already migrated one, or memory://.
+Exits with status 1 when the median time to polling is over the budget.
+
+    python benchmarks/bench_startup.py --runs 5 --budget-ms 2000
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from database import Database  # noqa: E402
+from fake_telegram import BOT_TOKEN, FakeBotAPI  # noqa: E402
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+STORAGE_MODES = ('new', 'existing', 'memory')
+
+
+class StartupAPI(FakeBotAPI):
+    """Notes when the bot first calls each method; getUpdates returns no updates."""
+
+    def __init__(self):
+        super().__init__()
+        self.first_call = {}
+        self.polling = asyncio.Event()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.first_call.setdefault(method, time.perf_counter())
+        if method == "getUpdates":
+            self.polling.set()
+            await asyncio.sleep(0.1)
+            return web.json_response({"ok": True, "result": []})
+        return await super().handle(request)
+
+
+async def start_once(port: int, storage: str, workdir: str, run: int) -> dict:
+    api = StartupAPI()
+    runner = web.AppRunner(api.app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+
+    if storage == 'memory':
+        url = "memory://"
+    else:
+        path = os.path.join(workdir, f"{storage}-{run}.db")
+        if storage == 'existing':
+            Database(path).close()
+        url = f"sqlite:///{path}"
+    env = dict(os.environ, TELEGRAM_BOT_TOKEN=BOT_TOKEN, BOT_MODE="polling", STORAGE_URL=url,
+               TELEGRAM_API_BASE_URL=f"http://127.0.0.1:{port}/bot", METRICS_PORT="0", LOG_LEVEL="WARNING")
+    env.pop("PERSISTENCE_PATH", None)
+    start = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-c", "import bot; bot.main()", cwd=ROOT, env=env,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+    try:
+        await asyncio.wait_for(api.polling.wait(), timeout=60)
+    except asyncio.TimeoutError:
+        process.kill()
+        _, stderr = await process.communicate()
+        await runner.cleanup()
+        raise RuntimeError(f"bot did not start polling:\n{stderr.decode(errors='replace')}")
+    process.terminate()
+    await process.communicate()
+    await runner.cleanup()
+    return {
+        'initialized': api.first_call["getMe"] - start,
+        'polling': api.first_call["getUpdates"] - start,
+    }
+
+
+def _ms(values) -> str:
+    return f"median {statistics.median(values) * 1000:7.1f}  max {max(values) * 1000:7.1f} ms"
+
+
+async def run(runs: int, port: int, modes, budget: float) -> bool:
+    within = True
+    with tempfile.TemporaryDirectory() as workdir:
+        for storage in modes:
+            results = [await start_once(port, storage, workdir, i) for i in range(runs)]
+            polling = [r['polling'] for r in results]
+            print(f"{storage:9s} initialized  {_ms([r['initialized'] for r in results])}")
+            print(f"{'':9s} polling      {_ms(polling)}")
+            if statistics.median(polling) > budget:
+                print(f"{'':9s} over the {budget * 1000:.0f} ms budget")
+                within = False
+    return within
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--api-port", type=int, default=18082)
+    parser.add_argument("--storage", choices=STORAGE_MODES, action="append",
+                        help="database to start with (repeatable; default: all)")
+    parser.add_argument("--budget-ms", type=float, default=2000.0,
+                        help="allowed median time from spawn to the first getUpdates")
+    args = parser.parse_args()
+    within = asyncio.run(run(args.runs, args.api_port, args.storage or STORAGE_MODES, args.budget_ms / 1000))
+    sys.exit(0 if within else 1)
+
+
+if __name__ == "__main__":
+    main()
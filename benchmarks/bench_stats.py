@@ -0,0 +1,73 @@
+"""
+/stats latency against history length.
+
+Logs years of workouts for one user through Database.log_exercise, then
+compares the aggregate reads /stats uses with the equivalent full scans of
+workout_log, at several history sizes.
+
+    python benchmarks/bench_stats.py --years 1 3 10
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from database import Database  # noqa: E402
+from stats import week_start  # noqa: E402
+
+SCANS = {
+    'weekly volume': ("SELECT strftime('%Y-%W', logged_at, 'unixepoch') AS w, SUM(reps * sets * weight) "
+                      "FROM workout_log WHERE user_id = ? GROUP BY w ORDER BY w DESC LIMIT 4"),
+    'records': ("SELECT exercise_name, MAX(weight) FROM workout_log WHERE user_id = ? "
+                "GROUP BY exercise_name ORDER BY 2 DESC LIMIT 5"),
+}
+
+
+def fill(db: Database, user_id: int, start: date, days: int, per_day: int = 6):
+    for d in range(days):
+        day = start + timedelta(days=d)
+        if day.weekday() in (1, 3, 6):  # three sessions a week
+            continue
+        week = week_start(day)
+        ts = time.mktime(day.timetuple()) + 18 * 3600
+        for i in range(per_day):
+            db.log_exercise(user_id, None, f"exercise {i}", 10, 3, 40 + d % 20, ts + i * 300,
+                            day.isoformat(), week.isoformat(), (week - timedelta(days=7)).isoformat())
+    db.flush()
+
+
+def timed(func, samples: int) -> float:
+    start = time.perf_counter()
+    for _ in range(samples):
+        func()
+    return (time.perf_counter() - start) / samples * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--years', type=int, nargs='+', default=[1, 3, 10])
+    parser.add_argument('--samples', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'history':<12}{'rows':>8}{'/stats (us)':>14}" + "".join(f"{'scan ' + n + ' (us)':>28}" for n in SCANS))
+    for years in args.years:
+        with tempfile.TemporaryDirectory() as tmp:
+            # a thousand commits per second would dominate the fill; batch them
+            db = Database(os.path.join(tmp, 'bench.db'), commit_every=1000, commit_interval=60)
+            fill(db, 1, date(2015, 1, 3), years * 365)
+            rows = db.conn.execute("SELECT COUNT(*) FROM workout_log").fetchone()[0]
+            aggregate = timed(lambda: (db.get_streak(1), db.get_weekly_volume(1, 4), db.get_personal_records(1, 5)),
+                              args.samples)
+            scans = [timed(lambda: db.conn.execute(sql, (1,)).fetchall(), max(1, args.samples // 10))
+                     for sql in SCANS.values()]
+            db.close()
+        print(f"{str(years) + 'y':<12}{rows:>8}{aggregate:>14.1f}" + "".join(f"{s:>28.1f}" for s in scans))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+Offline webhook throughput harness.
+
+Starts a fake Telegram Bot API server, runs the bot in webhook mode against
+it and POSTs synthetic updates from many users to the webhook endpoint, the
+same way Telegram would. Nothing leaves the machine.
+
+    python benchmarks/fake_telegram.py --users 200 --rounds 5
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+
+from aiohttp import ClientSession, TCPConnector, web
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from callbacks import encode  # noqa: E402
+
+BOT_TOKEN = "123456:FAKE"
+SECRET = "harness-secret"
+
+
+class FakeBotAPI:
+    """Answers Bot API methods with minimal but valid payloads."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = {}
+        self._message_ids = itertools.count(1000)
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self.handle)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency:
+            # round trip to the real Bot API
+            await asyncio.sleep(self.latency)
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot",
+                      "can_join_groups": False, "can_read_all_group_messages": False,
+                      "supports_inline_queries": False}
+        elif method in ("sendMessage", "sendAnimation", "editMessageText", "sendDocument"):
+            chat_id = int(params.get("chat_id", 1))
+            result = {"message_id": next(self._message_ids), "date": int(time.time()),
+                      "chat": {"id": chat_id, "type": "private"}, "text": params.get("text", "")}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+
+def make_updates(users: int, rounds: int):
+    ids = itertools.count(1)
+    flow = ["/start", encode("menu_settings"), encode("set_rest", 60), encode("menu_my"), encode("menu_back")]
+    for _ in range(rounds):
+        for step in flow:
+            for uid in range(1, users + 1):
+                user = {"id": uid, "is_bot": False, "first_name": f"user{uid}"}
+                chat = {"id": uid, "type": "private"}
+                if step.startswith("/"):
+                    yield {"update_id": next(ids), "message": {
+                        "message_id": 1, "date": int(time.time()), "chat": chat, "from": user,
+                        "text": step, "entities": [{"type": "bot_command", "offset": 0, "length": len(step)}]}}
+                else:
+                    yield {"update_id": next(ids), "callback_query": {
+                        "id": str(next(ids)), "from": user, "chat_instance": str(uid), "data": step,
+                        "message": {"message_id": 1, "date": int(time.time()), "chat": chat, "text": "menu"}}}
+
+
+async def run(users: int, rounds: int, concurrency: int, api_port: int, hook_port: int, api_latency: float):
+    fake = FakeBotAPI(api_latency)
+    runner = web.AppRunner(fake.app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", api_port).start()
+
+    os.environ["TELEGRAM_API_BASE_URL"] = f"http://127.0.0.1:{api_port}/bot"
+    import bot
+    import handlers
+    from cache import CachedDatabase
+    from database import AsyncDatabase
+    from webhook import WebhookConfig, serve
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["PERSISTENCE_PATH"] = os.path.join(tmp.name, "bench.db")
+    handlers.use_database(CachedDatabase(AsyncDatabase(os.path.join(tmp.name, "bench.db"))))
+    application = bot.build_application(BOT_TOKEN)
+    config = WebhookConfig(listen="127.0.0.1", port=hook_port, path="/telegram", secret=SECRET)
+    stop = asyncio.Event()
+    server_task = asyncio.create_task(serve(application, config, stop))
+    url = f"http://127.0.0.1:{hook_port}/telegram"
+
+    async with ClientSession(connector=TCPConnector(limit=concurrency)) as session:
+        for _ in range(100):
+            try:
+                async with session.get(f"http://127.0.0.1:{hook_port}/readyz") as resp:
+                    if resp.status == 200:
+                        break
+            except OSError:
+                pass
+            await asyncio.sleep(0.05)
+
+        updates = list(make_updates(users, rounds))
+        latencies = []
+        sem = asyncio.Semaphore(concurrency)
+
+        async def post(update):
+            async with sem:
+                start = time.perf_counter()
+                async with session.post(url, data=json.dumps(update),
+                                        headers={"Content-Type": "application/json",
+                                                 "X-Telegram-Bot-Api-Secret-Token": SECRET}) as resp:
+                    assert resp.status == 200, resp.status
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(post(u) for u in updates))
+        accepted = time.perf_counter() - start
+        await application.update_queue.join()
+        processed = time.perf_counter() - start
+
+    stop.set()
+    await server_task
+    await runner.cleanup()
+    tmp.cleanup()
+
+    latencies.sort()
+    print(f"{len(updates)} updates from {users} users")
+    print(f"accepted in {accepted:.2f}s ({len(updates) / accepted:.0f} updates/s), "
+          f"webhook p50 {latencies[len(latencies) // 2] * 1000:.1f}ms "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms")
+    print(f"processed in {processed:.2f}s ({len(updates) / processed:.0f} updates/s)")
+    print("Bot API calls:", dict(sorted(fake.calls.items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--api-port", type=int, default=18081)
+    parser.add_argument("--webhook-port", type=int, default=18080)
+    parser.add_argument("--api-latency-ms", type=float, default=0.0,
+                        help="simulated Bot API round-trip time")
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.rounds, args.concurrency, args.api_port, args.webhook_port,
+                    args.api_latency_ms / 1000))
+
+
+if __name__ == "__main__":
+    main()
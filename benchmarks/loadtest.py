@@ -0,0 +1,364 @@
+"""
+Offline load test: synthetic users driving the bot's handler graph.
+
+Builds the application with ``bot.build_application`` on top of an
+in-process fake Bot API (no sockets, nothing leaves the machine) and a
+temporary database, then lets thousands of simulated users go through the
+main flows at the same time:
+
+    /start → new program → pick a day → add exercises → "تمام" → save
+           → start workout → pick the program → exercise_done × N
+
+Users press the buttons of the last message the bot sent them, so a broken
+keyboard shows up as a flow error. Every update goes through
+``Application.process_update`` (handlers, conversation state, persistence,
+outbound scheduler) and the run reports throughput, per-update latency
+percentiles (overall and per step), time spent in the database and the
+event-loop lag. Runs with the same arguments replay the same updates.
+
+    python benchmarks/loadtest.py --users 2000 --exercises 4
+    python benchmarks/loadtest.py --users 500 --think-ms 200 --json result.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from telegram import Update
+from telegram.request import BaseRequest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from database import AsyncDatabase  # noqa: E402
+
+BOT_TOKEN = "123456:LOADTEST"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Load", "username": "loadtest_bot",
+            "can_join_groups": False, "can_read_all_group_messages": False, "supports_inline_queries": False}
+SEND_METHODS = frozenset({'sendMessage', 'sendAnimation', 'sendDocument', 'sendPhoto'})
+EDIT_METHODS = frozenset({'editMessageText', 'editMessageCaption', 'editMessageReplyMarkup'})
+STEPS = ('start', 'menu_new', 'day', 'exercise', 'finish', 'menu_back', 'menu_start', 'program',
+         'exercise_done')
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class FakeBotRequest(BaseRequest):
+    """Answers Bot API calls in-process and remembers the last message of every chat."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.chats: Dict[int, dict] = {}
+        self._message_ids = itertools.count(1_000_000)
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit('/', 1)[-1]
+        self.calls[endpoint] += 1
+        if self.latency:
+            # round trip to the real Bot API
+            await asyncio.sleep(self.latency)
+        params = request_data.parameters if request_data is not None else {}
+        if endpoint == 'getMe':
+            result = BOT_USER
+        elif endpoint in SEND_METHODS or (endpoint in EDIT_METHODS and 'chat_id' in params):
+            chat_id = int(params['chat_id'])
+            message_id = params.get('message_id') or next(self._message_ids)
+            result = {"message_id": message_id, "date": int(time.time()), "from": BOT_USER,
+                      "chat": {"id": chat_id, "type": "private"},
+                      "text": params.get('text') or params.get('caption') or ""}
+            if 'reply_markup' in params:
+                result['reply_markup'] = params['reply_markup']
+            self.chats[chat_id] = result
+        elif endpoint == 'getUpdates':
+            result = []
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+    def buttons(self, chat_id: int) -> List[str]:
+        """callback_data of the inline buttons under the last message in ``chat_id``."""
+        markup = self.chats.get(chat_id, {}).get('reply_markup') or {}
+        return [button.get('callback_data') for row in markup.get('inline_keyboard', []) for button in row]
+
+
+class TimedAsyncDatabase(AsyncDatabase):
+    """AsyncDatabase that records how long calls wait for and run on the database threads."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_times: List[float] = []
+        self.busy_times: List[float] = []
+
+    async def _run(self, executor, func, *args, **kwargs):
+        busy = self.busy_times
+
+        def timed(*a, **kw):
+            start = time.perf_counter()
+            try:
+                return func(*a, **kw)
+            finally:
+                busy.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        try:
+            return await super()._run(executor, timed, *args, **kwargs)
+        finally:
+            self.wait_times.append(time.perf_counter() - start)
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up a task that sleeps ``interval`` seconds."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+    def start(self) -> None:
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+class SyntheticUser:
+    """One simulated user: builds its updates, feeds them to the application and checks the replies."""
+
+    def __init__(self, harness: 'LoadTest', user_id: int, rng: random.Random):
+        self.harness = harness
+        self.user_id = user_id
+        self.rng = rng
+        self.user = {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+        self.chat = {"id": user_id, "type": "private"}
+
+    async def _process(self, step: str, data: dict) -> None:
+        harness = self.harness
+        if harness.think:
+            await asyncio.sleep(self.rng.uniform(0, 2 * harness.think))
+        update = Update.de_json(dict(data, update_id=next(harness.update_ids)), harness.application.bot)
+        start = time.perf_counter()
+        await harness.application.process_update(update)
+        harness.latencies[step].append(time.perf_counter() - start)
+
+    async def send(self, step: str, text: str) -> None:
+        message = {"message_id": next(self.harness.message_ids), "date": int(time.time()),
+                   "chat": self.chat, "from": self.user, "text": text}
+        if text.startswith('/'):
+            message['entities'] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        await self._process(step, {"message": message})
+
+    async def press(self, step: str, data: str, check: bool = True) -> None:
+        harness = self.harness
+        if check and data not in harness.api.buttons(self.user_id):
+            harness.flow_errors[step] += 1
+        last = harness.api.chats.get(self.user_id, {"message_id": 1, "date": 0, "chat": self.chat, "text": ""})
+        query = {"id": str(next(harness.update_ids)), "from": self.user, "chat_instance": str(self.user_id),
+                 "data": data, "message": last}
+        await self._process(step, {"callback_query": query})
+
+    def pick(self, predicate) -> Optional[str]:
+        choices = [data for data in self.harness.api.buttons(self.user_id) if data and predicate(data)]
+        return self.rng.choice(choices) if choices else None
+
+    async def run(self) -> None:
+        from callbacks import encode, pattern
+        harness = self.harness
+        await self.send('start', '/start')
+        await self.press('menu_new', encode('menu_new'))
+        day = self.pick(pattern('day'))
+        if day is None:
+            harness.flow_errors['day'] += 1
+            return
+        await self.press('day', day)
+        for i in range(harness.exercises):
+            await self.send('exercise', f"حرکت {i + 1} {self.rng.randint(6, 15)} {self.rng.randint(2, 5)} "
+                                        f"{self.rng.randrange(20, 100, 5)}")
+        await self.send('finish', 'تمام')
+        await self.press('menu_back', encode('menu_back'))
+        await self.press('menu_start', encode('menu_start'))
+        program = self.pick(pattern('start'))
+        if program is None:
+            harness.flow_errors['program'] += 1
+            return
+        await self.press('program', program)
+        for _ in range(harness.exercises):
+            # the button stays under the exercise while the rest notice is shown
+            await self.press('exercise_done', encode('exercise_done'), check=False)
+        if 'تبریک' in harness.api.chats.get(self.user_id, {}).get('text', ''):
+            harness.completed += 1
+
+
+class LoadTest:
+    def __init__(self, users: int, concurrency: int, exercises: int, seed: int = 1,
+                 think: float = 0.0, api_latency: float = 0.0, telegram_limits: bool = False):
+        self.users = users
+        self.concurrency = concurrency or users
+        self.exercises = exercises
+        self.seed = seed
+        self.think = think
+        self.api = FakeBotRequest(api_latency)
+        self.telegram_limits = telegram_limits
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.latencies: Dict[str, List[float]] = {step: [] for step in STEPS}
+        self.flow_errors: Dict[str, int] = defaultdict(int)
+        self.handler_errors = 0
+        self.completed = 0
+        self.application = None
+        self.db: Optional[TimedAsyncDatabase] = None
+
+    async def _on_error(self, update, context) -> None:
+        self.handler_errors += 1
+        if self.handler_errors <= 5:
+            print(f"handler error: {context.error!r}", file=sys.stderr)
+
+    async def run(self, workdir: str) -> dict:
+        import bot
+        import handlers
+        from cache import CachedDatabase
+        from outbound import OutboundScheduler
+        from persistence import SQLitePersistence
+        from timers import rest_timers
+
+        path = os.path.join(workdir, "loadtest.db")
+        self.db = TimedAsyncDatabase(path)
+        handlers.use_database(CachedDatabase(self.db))
+        # without Telegram's per-chat limits the run measures the bot, not the throttle
+        limiter = None if self.telegram_limits else OutboundScheduler(1e6, 1e6, 1e6)
+        application = bot.build_application(BOT_TOKEN, request=self.api, rate_limiter=limiter,
+                                            persistence=SQLitePersistence(path))
+        application.add_error_handler(self._on_error)
+        self.application = application
+
+        await application.initialize()
+        await application.post_init(application)
+        await application.start()
+        monitor = LoopLagMonitor()
+        monitor.start()
+        sem = asyncio.Semaphore(self.concurrency)
+
+        async def run_user(user_id: int) -> None:
+            async with sem:
+                await SyntheticUser(self, user_id, random.Random(self.seed * 1_000_003 + user_id)).run()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(run_user(user_id) for user_id in range(1, self.users + 1)))
+        elapsed = time.perf_counter() - start
+        await monitor.stop()
+
+        rest_timers.cancel_all()
+        await application.stop()
+        await application.shutdown()
+        await application.post_shutdown(application)
+        return self.report(elapsed, monitor.samples)
+
+    def report(self, elapsed: float, lag: List[float]) -> dict:
+        def summary(values: List[float]) -> dict:
+            return {"count": len(values), "p50_ms": percentile(values, 0.5) * 1000,
+                    "p90_ms": percentile(values, 0.9) * 1000, "p99_ms": percentile(values, 0.99) * 1000,
+                    "max_ms": max(values, default=0.0) * 1000}
+
+        everything = [value for values in self.latencies.values() for value in values]
+        return {
+            "users": self.users, "concurrency": self.concurrency, "exercises": self.exercises,
+            "seed": self.seed, "think_ms": self.think * 1000,
+            "updates": len(everything), "seconds": elapsed,
+            "updates_per_second": len(everything) / elapsed if elapsed else 0.0,
+            "latency": summary(everything),
+            "steps": {step: summary(values) for step, values in self.latencies.items()},
+            "db": {"calls": len(self.db.wait_times), "wait": summary(self.db.wait_times),
+                   "busy_seconds": sum(self.db.busy_times)},
+            "loop_lag": summary(lag),
+            "api_calls": dict(sorted(self.api.calls.items())),
+            "completed": self.completed,
+            "flow_errors": dict(self.flow_errors),
+            "handler_errors": self.handler_errors,
+        }
+
+
+def print_report(result: dict) -> None:
+    def row(name: str, s: dict) -> str:
+        return (f"  {name:<14} {s['count']:>8}  p50 {s['p50_ms']:7.2f}  p90 {s['p90_ms']:7.2f}  "
+                f"p99 {s['p99_ms']:7.2f}  max {s['max_ms']:8.2f} ms")
+
+    print(f"{result['users']} users (concurrency {result['concurrency']}), {result['exercises']} exercises, "
+          f"seed {result['seed']}, think {result['think_ms']:.0f} ms")
+    print(f"{result['updates']} updates in {result['seconds']:.2f}s "
+          f"({result['updates_per_second']:.0f} updates/s), {result['completed']} workouts completed")
+    print("latency per update:")
+    print(row('all', result['latency']))
+    for step, s in result['steps'].items():
+        print(row(step, s))
+    db = result['db']
+    print(f"database: {db['calls']} calls, {db['busy_seconds']:.2f}s busy "
+          f"({db['busy_seconds'] / result['seconds'] * 100:.0f}% of the run)")
+    print(row('db wait', db['wait']))
+    print(row('loop lag', result['loop_lag']))
+    print("Bot API calls:", result['api_calls'])
+    print(f"errors: {result['handler_errors']} in handlers, flow {result['flow_errors'] or 0}")
+
+
+async def run(args) -> dict:
+    test = LoadTest(args.users, args.concurrency, args.exercises, args.seed, args.think_ms / 1000,
+                    args.api_latency_ms / 1000, args.telegram_limits)
+    with tempfile.TemporaryDirectory() as workdir:
+        return await test.run(workdir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=0, help="users active at once (default: all)")
+    parser.add_argument('--exercises', type=int, default=4, help="exercises per program")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--think-ms', type=float, default=0.0, help="mean pause between a user's actions")
+    parser.add_argument('--api-latency-ms', type=float, default=0.0, help="simulated Bot API round-trip time")
+    parser.add_argument('--telegram-limits', action='store_true',
+                        help="keep the outbound scheduler's real rate limits")
+    parser.add_argument('--json', metavar='PATH', help="also write the results as JSON")
+    args = parser.parse_args()
+    result = asyncio.run(run(args))
+    print_report(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,38 +2,113 @@ import os
 import logging
 from dotenv import load_dotenv
 from telegram import Update
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ConversationHandler, MessageHandler, filters
+from telegram.ext import (
+    Application, CommandHandler, CallbackQueryHandler, ConversationHandler, InlineQueryHandler, MessageHandler,
+    TypeHandler, filters
+)
 
 load_dotenv()
-logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def main() -> None:
-    token = os.getenv("TELEGRAM_BOT_TOKEN")
-    if not token:
-        logger.error("TELEGRAM_BOT_TOKEN not found in environment variables!")
-        return
 
-    application = Application.builder().token(token).build()
+_metrics_server = None
+
+
+def register_metrics(application: Application, router=None) -> None:
+    """Gauges over the bot's in-memory state, read when /metrics is scraped."""
+    import handlers
+    from metrics import REGISTRY
+    from timers import rest_timers
+    REGISTRY.gauge('gymbot_active_sessions', 'Open workout sessions held in memory',
+                   lambda: handlers.sessions.active_count())
+    REGISTRY.gauge('gymbot_rest_timers_pending', 'Rest timers waiting to fire', lambda: len(rest_timers))
+    REGISTRY.stats('gymbot_db_cache', 'Read-through database cache', lambda: handlers.db.stats())
+    REGISTRY.stats('gymbot_render_cache', 'Rendered views cache', lambda: handlers.renderer.stats())
+    REGISTRY.stats('gymbot_media', 'GIF file_id cache', lambda: handlers.media.stats())
+    REGISTRY.stats('gymbot_reminders', 'Daily reminders', lambda: handlers.reminders.stats())
+    REGISTRY.stats('gymbot_versions', 'Superseded exercise rows collected', lambda: handlers.versions.stats())
+    REGISTRY.stats('gymbot_catalog', 'Exercise catalog index', lambda: handlers.catalog.stats())
+    if router is not None:
+        REGISTRY.stats('gymbot_callbacks', 'Callback router', router.stats)
+    REGISTRY.stats('gymbot_outbound', 'Outbound Bot API scheduler', lambda: application.bot.rate_limiter.stats())
+    if hasattr(application.persistence, 'stats'):
+        REGISTRY.stats('gymbot_persistence', 'user_data persistence', application.persistence.stats)
+    import logging_setup
+    REGISTRY.stats('gymbot_logging', 'Log records queued, dropped and sampled out', logging_setup.stats)
+    if hasattr(application.update_processor, 'stats'):
+        REGISTRY.stats('gymbot_updates', 'Concurrent update processing', application.update_processor.stats)
+
+
+async def post_init(application: Application) -> None:
+    global _metrics_server
+    from handlers import reminders, versions
+    reminders.start(application.bot)
+    versions.start()
+    from metrics import METRICS_LISTEN, METRICS_PORT, MetricsServer
+    if METRICS_PORT:
+        from storage import shard_index
+        _metrics_server = MetricsServer()
+        # each shard process gets its own port
+        await _metrics_server.start(METRICS_LISTEN, METRICS_PORT + (shard_index() or 0))
+
+
+async def post_shutdown(application: Application) -> None:
+    global _metrics_server
+    from timers import rest_timers
+    from handlers import db, reminders, versions
+    rest_timers.cancel_all()
+    await reminders.stop()
+    await versions.stop()
+    await db.close()
+    if _metrics_server is not None:
+        await _metrics_server.stop()
+        _metrics_server = None
+
+
+def build_application(token: str, request=None, persistence=None, rate_limiter=None) -> Application:
+    """Build the bot. ``request``, ``persistence`` and ``rate_limiter`` replace the defaults (offline harnesses)."""
+    builder = Application.builder().token(token).post_init(post_init).post_shutdown(post_shutdown)
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    base_url = os.getenv("TELEGRAM_API_BASE_URL")
+    if base_url:
+        # e.g. a local Bot API server or the fake server in benchmarks/fake_telegram.py
+        builder = builder.base_url(base_url)
+    workers = int(os.getenv("UPDATE_WORKERS", "0"))
+    if workers > 0:
+        from dispatch import PerUserUpdateProcessor
+        max_pending = int(os.getenv("UPDATE_MAX_PENDING", "1024"))
+        builder = builder.concurrent_updates(PerUserUpdateProcessor(workers, max_pending))
+        if request is None:
+            # one HTTP connection per worker, otherwise the workers queue on the Bot API pool
+            builder = builder.connection_pool_size(workers).pool_timeout(30)
+    if rate_limiter is None:
+        from outbound import OutboundScheduler
+        rate_limiter = OutboundScheduler()
+    builder = builder.rate_limiter(rate_limiter)
+    if persistence is None:
+        from persistence import SQLitePersistence
+        persistence = SQLitePersistence()
+    builder = builder.persistence(persistence)
+    application = builder.build()
 
     # import handlers late to avoid circular imports
+    import handlers
+    from callbacks import CallbackRouter, pattern
     from handlers import (
-        start, help_command, menu_callback, set_rest_callback,
-        new_program, day_selected, add_exercise, cancel,
-        my_programs, start_workout, workout_selected,
-        exercise_done, session_back,
-        program_action, exercise_action,
-        start_add_from_menu
+        start, help_command, new_program, day_selected, add_exercise, cancel,
+        my_programs, start_workout, start_add_from_menu,
+        import_command, import_document, export_command, stats_command
     )
 
     conv_handler = ConversationHandler(
         entry_points=[
             CommandHandler('newprogram', new_program),
-            CallbackQueryHandler(new_program, pattern=r'^menu_new$'),
-            CallbackQueryHandler(start_add_from_menu, pattern=r'^menu_new_add$'),
+            CallbackQueryHandler(new_program, pattern=pattern('menu_new')),
+            CallbackQueryHandler(start_add_from_menu, pattern=pattern('menu_new_add')),
         ],
         states={
-            0: [CallbackQueryHandler(day_selected)],
+            0: [CallbackQueryHandler(day_selected, pattern=pattern('day'))],
             1: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, add_exercise),
                 MessageHandler(filters.ANIMATION, add_exercise),
@@ -41,24 +116,83 @@ def main() -> None:
         },
         fallbacks=[CommandHandler('cancel', cancel), CommandHandler('back', cancel)],
         allow_reentry=True,
+        name='program_builder',
+        persistent=True,
     )
 
+    # every other button: one decode and one dict lookup (see callbacks.py)
+    router = CallbackRouter({
+        'menu_my': handlers.menu_my,
+        'menu_start': handlers.menu_start,
+        'menu_help': handlers.menu_help,
+        'menu_stats': handlers.menu_stats,
+        'menu_settings': handlers.menu_settings,
+        'menu_reminder': handlers.menu_reminder,
+        'menu_back': handlers.menu_back,
+        'set_rest': handlers.set_rest_callback,
+        'set_remind': handlers.set_reminder_callback,
+        'remind_off': handlers.set_reminder_callback,
+        'start': handlers.workout_selected,
+        'exercise_done': handlers.exercise_done,
+        'session_back': handlers.session_back,
+        'session_resume': handlers.session_resume,
+        'program_view': handlers.program_view,
+        'program_edit': handlers.program_edit,
+        'program_delete': handlers.program_delete,
+        'program_overwrite': handlers.program_overwrite,
+        'ex_edit': handlers.exercise_edit,
+        'ex_delete': handlers.exercise_delete,
+        'ex_add': handlers.exercise_add,
+        'ex_move': handlers.exercise_move,
+        'ex_place': handlers.exercise_place,
+        'ex_rename': handlers.exercise_rename,
+    }, on_invalid=handlers.invalid_callback)
+
     application.add_handler(CommandHandler('start', start))
     application.add_handler(CommandHandler('help', help_command))
     application.add_handler(conv_handler)
     application.add_handler(CommandHandler('myprograms', my_programs))
     application.add_handler(CommandHandler('start_workout', start_workout))
-    application.add_handler(CallbackQueryHandler(workout_selected, pattern=r'^start_\d+$'))
-    application.add_handler(CallbackQueryHandler(exercise_done, pattern=r'^exercise_done$'))
-    application.add_handler(CallbackQueryHandler(session_back, pattern=r'^session_back$'))
-    # register program/exercise routers so program_* and ex_* buttons work
-    application.add_handler(CallbackQueryHandler(program_action, pattern=r'^program_'))
-    application.add_handler(CallbackQueryHandler(exercise_action, pattern=r'^ex_'))
-    application.add_handler(CallbackQueryHandler(menu_callback, pattern=r'^menu_'))
-    application.add_handler(CallbackQueryHandler(set_rest_callback, pattern=r'^set_rest_\d+$'))
-
-    logger.info("Bot started!")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    application.add_handler(CommandHandler('import', import_command))
+    application.add_handler(CommandHandler('export', export_command))
+    application.add_handler(CommandHandler('stats', stats_command))
+    application.add_handler(MessageHandler(
+        filters.Document.FileExtension('csv') | filters.Document.FileExtension('json'), import_document))
+    application.add_handler(CallbackQueryHandler(router.dispatch))
+    application.add_handler(InlineQueryHandler(handlers.inline_exercise_search))
+
+    from metrics import instrument_application
+    instrument_application(application)
+    register_metrics(application, router)
+    # runs before every other handler and tags the update's log records
+    from logging_setup import bind_update_handler
+    application.add_handler(TypeHandler(Update, bind_update_handler), group=-1)
+    return application
+
+
+def main() -> None:
+    from logging_setup import setup_logging
+    setup_logging()
+    token = os.getenv("TELEGRAM_BOT_TOKEN")
+    if not token:
+        logger.error("TELEGRAM_BOT_TOKEN not found in environment variables!")
+        return
+
+    mode = os.getenv("BOT_MODE", "polling")
+    if mode == "sharded":
+        # front dispatcher here, the bot itself runs in the shard processes
+        from sharding import SHARD_COUNT, run_sharded
+        logger.info("Bot started! (sharded mode, %d shards)", SHARD_COUNT)
+        run_sharded(token, SHARD_COUNT, os.getenv("SHARD_INGRESS", "webhook"))
+        return
+
+    application = build_application(token)
+    logger.info("Bot started! (%s mode)", mode)
+    if mode == "webhook":
+        from webhook import WebhookConfig, run_webhook
+        run_webhook(application, WebhookConfig.from_env())
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,235 @@
+"""
+Read-through cache in front of the async database.
+
+Programs, exercise lists and user settings change rarely but are read on
+almost every tap. CachedDatabase keeps them in a bounded LRU with a TTL,
+keyed per user and per program, and every mutator drops exactly the entries
+it affects.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '20000'))
+CACHE_TTL_SECONDS = float(os.getenv('CACHE_TTL_SECONDS', '600'))
+
+_MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, maxsize: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL_SECONDS,
+                 on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            self.pop(key)
+        self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            old_key, (_, old_value) = self._data.popitem(last=False)
+            self.evictions += 1
+            if self.on_evict:
+                self.on_evict(old_key, old_value)
+
+    def pop(self, key: Hashable) -> Any:
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return None
+        if self.on_evict:
+            self.on_evict(key, entry[1])
+        return entry[1]
+
+    def values(self) -> List[Any]:
+        """Every stored value, expired or not, oldest first."""
+        return [value for _, value in self._data.values()]
+
+    def clear(self) -> None:
+        for key in list(self._data):
+            self.pop(key)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'entries': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+def _exercise_keys(program_id: int):
+    # entries that change with a program's exercises
+    return ('exercises', program_id), ('version', program_id)
+
+
+class CachedDatabase:
+    """
+    Wraps an AsyncDatabase. Cached reads return shallow copies; everything
+    not listed here is passed straight through.
+    """
+
+    def __init__(self, db, maxsize: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL_SECONDS):
+        self.db = db
+        self.cache = LRUCache(maxsize, ttl, on_evict=self._forget)
+        # exercise id -> program id, for every exercise in a cached exercise list
+        self._exercise_program: Dict[int, int] = {}
+        # bumped on every invalidation; a read that raced with a write is not stored
+        self._generation = 0
+
+    def __getattr__(self, name: str):
+        return getattr(self.db, name)
+
+    def stats(self) -> Dict[str, int]:
+        return self.cache.stats()
+
+    def _forget(self, key, value):
+        if key[0] == 'exercises':
+            for ex in value:
+                self._exercise_program.pop(ex['id'], None)
+
+    def _invalidate(self, *keys):
+        self._generation += 1
+        for key in keys:
+            self.cache.pop(key)
+
+    async def _read(self, key, loader, *args):
+        value = self.cache.get(key, _MISSING)
+        if value is _MISSING:
+            generation = self._generation
+            value = await loader(*args)
+            if generation == self._generation:
+                self.cache.set(key, value)
+                if key[0] == 'exercises':
+                    for ex in value:
+                        self._exercise_program[ex['id']] = key[1]
+        return list(value) if isinstance(value, list) else value
+
+    # --- cached reads ---
+
+    async def get_exercises(self, program_id: int, version: Optional[int] = None):
+        if version is None:
+            return await self._read(('exercises', program_id), self.db.get_exercises, program_id)
+        # a past version never changes, so it is never invalidated
+        return await self._read(('exercises', program_id, version), self.db.get_exercises, program_id, version)
+
+    async def get_user_programs(self, user_id: int):
+        return await self._read(('programs', user_id), self.db.get_user_programs, user_id)
+
+    async def get_program(self, program_id: int):
+        return await self._read(('program', program_id), self.db.get_program, program_id)
+
+    async def get_program_by_user_day(self, user_id: int, day_name: str):
+        return await self._read(('day', user_id, day_name), self.db.get_program_by_user_day, user_id, day_name)
+
+    async def get_rest_seconds(self, user_id: int):
+        return await self._read(('rest', user_id), self.db.get_rest_seconds, user_id)
+
+    async def get_program_version(self, program_id: int):
+        return await self._read(('version', program_id), self.db.get_program_version, program_id)
+
+    # --- mutators with invalidation ---
+
+    async def create_workout_program(self, user_id: int, day_name: str):
+        result = await self.db.create_workout_program(user_id, day_name)
+        self._invalidate(('programs', user_id), ('day', user_id, day_name))
+        return result
+
+    async def delete_program(self, program_id: int):
+        program = await self.get_program(program_id)
+        result = await self.db.delete_program(program_id)
+        keys = [('program', program_id), *_exercise_keys(program_id)]
+        if program:
+            keys += [('programs', program['user_id']), ('day', program['user_id'], program['day_name'])]
+        self._invalidate(*keys)
+        return result
+
+    async def delete_exercises(self, program_id: int):
+        result = await self.db.delete_exercises(program_id)
+        self._invalidate(*_exercise_keys(program_id))
+        return result
+
+    async def add_exercise(self, program_id: int, *args, **kwargs):
+        result = await self.db.add_exercise(program_id, *args, **kwargs)
+        self._invalidate(*_exercise_keys(program_id))
+        return result
+
+    async def add_exercises(self, program_id: int, exercises):
+        result = await self.db.add_exercises(program_id, exercises)
+        self._invalidate(*_exercise_keys(program_id))
+        return result
+
+    async def delete_last_exercise(self, program_id: int):
+        result = await self.db.delete_last_exercise(program_id)
+        self._invalidate(*_exercise_keys(program_id))
+        return result
+
+    async def update_exercise(self, exercise_id: int, *args, **kwargs):
+        program_id = await self._program_of_exercise(exercise_id)
+        result = await self.db.update_exercise(exercise_id, *args, **kwargs)
+        self._invalidate_program(program_id)
+        return result
+
+    async def move_exercise(self, exercise_id: int, index: int):
+        program_id = await self._program_of_exercise(exercise_id)
+        result = await self.db.move_exercise(exercise_id, index)
+        self._invalidate_program(program_id)
+        return result
+
+    async def rename_exercise(self, exercise_id: int, catalog_id: int):
+        program_id = await self._program_of_exercise(exercise_id)
+        result = await self.db.rename_exercise(exercise_id, catalog_id)
+        self._invalidate_program(program_id)
+        return result
+
+    async def delete_exercise_by_id(self, exercise_id: int):
+        program_id = await self._program_of_exercise(exercise_id)
+        result = await self.db.delete_exercise_by_id(exercise_id)
+        self._invalidate_program(program_id)
+        return result
+
+    async def import_exercises(self, user_id: int, rows):
+        result = await self.db.import_exercises(user_id, rows)
+        keys = [('programs', user_id)]
+        for day_name, info in result.items():
+            keys += [('day', user_id, day_name), *_exercise_keys(info['program_id'])]
+        self._invalidate(*keys)
+        return result
+
+    async def _program_of_exercise(self, exercise_id: int):
+        # looked up before the write, a deleted exercise no longer knows its program
+        program_id = self._exercise_program.get(exercise_id)
+        if program_id is None:
+            program_id = await self.db.get_exercise_program_id(exercise_id)
+        return program_id
+
+    def _invalidate_program(self, program_id):
+        if program_id is None:
+            self._generation += 1
+        else:
+            self._invalidate(*_exercise_keys(program_id))
+
+    async def set_rest_seconds(self, user_id: int, seconds: int):
+        result = await self.db.set_rest_seconds(user_id, seconds)
+        self._invalidate(('rest', user_id))
+        return result
@@ -0,0 +1,184 @@
+"""
+Callback data of inline buttons: a compact codec and a dict-based router.
+
+Every button carries ``<version><code>[:<arg>...][:<tag>]``, for example
+``1mb`` (back to the main menu) or ``1pv:12:Qx3vL0aZ`` (view program 12).
+Buttons that name a program or exercise are signed: the tag is an HMAC of
+the payload and the id of the user the button was made for, so a payload
+edited to point at another user's program, or pressed by anyone else, is
+rejected before any database access. Arguments are plain ASCII digits, and
+actions with a fixed set of values (rest times, reminder minutes, week days)
+reject anything else the same way. Payloads of another version (buttons
+of messages sent before an upgrade) are reported as stale.
+
+The key is CALLBACK_SECRET, or derived from the bot token when it is unset;
+changing it turns all signed buttons stale.
+
+``CallbackRouter`` decodes a query once, looks its action up in a dict and
+calls the route with the decoded arguments in ``context.args``. Handlers
+inside a ConversationHandler match with ``pattern(action)``.
+"""
+
+import base64
+import hashlib
+import hmac
+import logging
+import os
+from typing import Awaitable, Callable, Container, Dict, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CALLBACK_VERSION = '1'
+CALLBACK_SECRET = os.getenv('CALLBACK_SECRET') or os.getenv('TELEGRAM_BOT_TOKEN', '')
+
+_SEP = ':'
+_TAG_LENGTH = 8
+_KEY = hashlib.sha256(b'gym-bot callbacks:' + CALLBACK_SECRET.encode()).digest()
+
+
+class InvalidCallbackData(ValueError):
+    """Malformed, unknown or forged callback data."""
+
+
+class StaleCallbackData(InvalidCallbackData):
+    """Callback data of another codec version, e.g. a button sent before an upgrade."""
+
+
+class Action(NamedTuple):
+    name: str
+    code: str
+    args: int = 0
+    # bound to the user the button was sent to
+    signed: bool = False
+    # allowed values of each argument, when not just any id
+    values: Optional[Tuple[Container[int], ...]] = None
+
+
+# rest times offered in the settings, in seconds
+REST_CHOICES = (30, 60, 90)
+MINUTES_OF_DAY = range(24 * 60)
+WEEK_DAYS = range(7)
+
+
+ACTIONS = (
+    Action('menu_new', 'mn'),
+    Action('menu_new_add', 'ma'),
+    Action('menu_my', 'mm'),
+    Action('menu_start', 'ms'),
+    Action('menu_stats', 'mt'),
+    Action('menu_help', 'mh'),
+    Action('menu_settings', 'mg'),
+    Action('menu_reminder', 'mr'),
+    Action('menu_back', 'mb'),
+    Action('day', 'd', 1, values=(WEEK_DAYS,)),
+    Action('set_rest', 'sr', 1, values=(REST_CHOICES,)),
+    Action('set_remind', 'sm', 1, values=(MINUTES_OF_DAY,)),
+    Action('remind_off', 'so'),
+    Action('exercise_done', 'xd'),
+    Action('session_back', 'xb'),
+    Action('session_resume', 'xr'),
+    Action('start', 'w', 1, signed=True),
+    Action('program_view', 'pv', 1, signed=True),
+    Action('program_edit', 'pe', 1, signed=True),
+    Action('program_delete', 'pd', 1, signed=True),
+    Action('program_overwrite', 'po', 1, signed=True),
+    Action('ex_edit', 'ee', 1, signed=True),
+    Action('ex_delete', 'ed', 1, signed=True),
+    Action('ex_add', 'ea', 1, signed=True),
+    # exercise id (and the index to move it to)
+    Action('ex_move', 'em', 1, signed=True),
+    Action('ex_place', 'ep', 2, signed=True),
+    # exercise id and the catalog entry it is renamed to
+    Action('ex_rename', 'en', 2, signed=True),
+)
+_BY_NAME: Dict[str, Action] = {action.name: action for action in ACTIONS}
+_BY_CODE: Dict[str, Action] = {action.code: action for action in ACTIONS}
+
+
+class Callback(NamedTuple):
+    action: str
+    args: Tuple[int, ...]
+
+
+def _tag(body: str, user_id: int) -> str:
+    digest = hmac.new(_KEY, f'{user_id}{_SEP}{body}'.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode()[:_TAG_LENGTH]
+
+
+def encode(name: str, *args: int, user_id: Optional[int] = None) -> str:
+    """Callback data for ``name`` with integer ``args``; signed actions need the recipient's ``user_id``."""
+    action = _BY_NAME[name]
+    if len(args) != action.args:
+        raise ValueError(f"{name} takes {action.args} argument(s), got {len(args)}")
+    body = CALLBACK_VERSION + action.code + ''.join(f'{_SEP}{int(arg)}' for arg in args)
+    if action.signed:
+        if user_id is None:
+            raise ValueError(f"{name} buttons are signed and need the recipient's user_id")
+        return body + _SEP + _tag(body, user_id)
+    return body
+
+
+def decode(data: Optional[str], user_id: int) -> Callback:
+    """Parse and verify callback data pressed by ``user_id``."""
+    if not data or data[0] != CALLBACK_VERSION:
+        raise StaleCallbackData(data)
+    parts = data[1:].split(_SEP)
+    action = _BY_CODE.get(parts[0])
+    if action is None:
+        raise InvalidCallbackData(data)
+    expected = 1 + action.args + (1 if action.signed else 0)
+    if len(parts) != expected:
+        raise InvalidCallbackData(data)
+    if action.signed:
+        body = data[:data.rindex(_SEP)]
+        if not hmac.compare_digest(parts[-1], _tag(body, user_id)):
+            raise InvalidCallbackData(data)
+    raw = parts[1:1 + action.args]
+    # int() alone would also take a sign, spaces or other scripts' digits
+    if not all(arg.isascii() and arg.isdigit() for arg in raw):
+        raise InvalidCallbackData(data)
+    args = tuple(int(arg) for arg in raw)
+    if action.values is not None and not all(arg in allowed for arg, allowed in zip(args, action.values)):
+        raise InvalidCallbackData(data)
+    return Callback(action.name, args)
+
+
+def pattern(name: str) -> Callable[[object], bool]:
+    """A CallbackQueryHandler ``pattern`` matching ``name`` (signatures are checked by ``decode``)."""
+    action = _BY_NAME[name]
+    prefix = CALLBACK_VERSION + action.code
+    if action.args == 0 and not action.signed:
+        return lambda data: data == prefix
+    prefix += _SEP
+    return lambda data: isinstance(data, str) and data.startswith(prefix)
+
+
+Route = Callable[..., Awaitable[object]]
+
+
+class CallbackRouter:
+    """Dispatches callback queries to ``routes[action]``; unknown, stale and forged data go to ``on_invalid``."""
+
+    def __init__(self, routes: Dict[str, Route], on_invalid: Route):
+        unknown = set(routes) - set(_BY_NAME)
+        if unknown:
+            raise ValueError(f"Unknown callback actions: {sorted(unknown)}")
+        self.routes = dict(routes)
+        self.on_invalid = on_invalid
+        self.rejected = 0
+
+    async def dispatch(self, update, context):
+        query = update.callback_query
+        try:
+            callback = decode(query.data, query.from_user.id)
+            route = self.routes[callback.action]
+        except (InvalidCallbackData, KeyError) as exc:
+            self.rejected += 1
+            if not isinstance(exc, StaleCallbackData):
+                logger.warning("Rejected callback data %r from user %s", query.data, query.from_user.id)
+            return await self.on_invalid(update, context)
+        context.args = list(callback.args)
+        return await route(update, context)
+
+    def stats(self) -> Dict[str, int]:
+        return {'routes': len(self.routes), 'rejected': self.rejected}
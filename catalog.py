@@ -0,0 +1,244 @@
+"""
+Shared exercise catalog.
+
+Every exercise name is reduced to a key (``normalize``): Arabic letter forms
+become their Persian equivalents (ي → ی, ك → ک, ...), diacritics, tatweel
+and zero-width joiners are dropped, a zero-width non-joiner counts as a space
+(``سیم‌کش`` is ``سیم کش``, not ``سیمکش``), digits become ASCII and runs of
+spaces and punctuation become one space. Names with the same key are one catalog
+entry, stored once in ``exercise_catalog`` with its GIF; exercises reference
+it by ``catalog_id``.
+
+``CatalogIndex`` keeps every entry in memory for autocomplete. Names share
+their words (a catalog of 100k names has far fewer distinct words), so the
+index is built over words: each word maps to the set of entries using it.
+
+- The inline search while the user types finds the words starting with each
+  typed word with a bisect of the sorted vocabulary and intersects their
+  entry sets;
+- "did you mean" replaces each unknown word by the known word sharing the
+  most letter triples (a trigram index over the vocabulary), then ranks the
+  entries with all the corrected words by trigram similarity to the query.
+
+Both stop after a fixed number of entries, so a lookup costs about the same
+with 1k or 100k entries.
+"""
+
+import asyncio
+import os
+import time
+from bisect import bisect_left, insort
+from collections import Counter
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Tuple
+
+CATALOG_REFRESH_SECONDS = float(os.getenv('CATALOG_REFRESH_SECONDS', '60'))
+
+# entries looked at per lookup, and the least trigram overlap worth suggesting
+# for a whole name and for a single misspelled word
+_MAX_CANDIDATES = 50
+_MIN_SIMILARITY = 0.3
+_MIN_WORD_SIMILARITY = 0.2
+
+_FOLD = {
+    'ي': 'ی', 'ى': 'ی', 'ئ': 'ی', 'ك': 'ک', 'ة': 'ه', 'ۀ': 'ه', 'ؤ': 'و',
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    # ZWNJ separates words, ZWJ and tatweel only change how letters join
+    '\u200c': ' ', '\u200d': None, 'ـ': None,
+}
+_FOLD.update({chr(0x06F0 + d): str(d) for d in range(10)})  # Persian digits
+_FOLD.update({chr(0x0660 + d): str(d) for d in range(10)})  # Arabic-Indic digits
+_FOLD.update({chr(c): None for c in range(0x064B, 0x0660)})  # harakat
+_FOLD[chr(0x0670)] = None  # superscript alef
+_FOLD_TABLE = str.maketrans(_FOLD)
+
+
+def normalize(name: str) -> str:
+    """The catalog key of an exercise name."""
+    folded = name.translate(_FOLD_TABLE).casefold()
+    key = ' '.join(''.join(ch if ch.isalnum() else ' ' for ch in folded).split())
+    # a name of only punctuation keeps it, rather than sharing the empty key
+    return key or ' '.join(folded.split())
+
+
+def trigrams(key: str) -> set:
+    padded = f' {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CatalogIndex:
+    def __init__(self):
+        self.names: Dict[int, str] = {}
+        self.by_key: Dict[str, int] = {}
+        self._keys: Dict[int, str] = {}
+        # word -> ids of the entries with that word, the words in order, and trigram -> words
+        self._entries: Dict[str, set] = {}
+        self._vocab: List[str] = []
+        self._word_grams: Dict[str, List[str]] = {}
+        self._gram_counts: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, catalog_id: int, name: str) -> None:
+        self.load([(catalog_id, name)])
+
+    def load(self, entries: Iterable[Tuple[int, str]]) -> None:
+        new_words = []
+        for catalog_id, name in entries:
+            if catalog_id in self.names:
+                continue
+            key = normalize(name)
+            self.names[catalog_id] = name
+            self._keys[catalog_id] = key
+            self.by_key.setdefault(key, catalog_id)
+            for word in key.split():
+                ids = self._entries.get(word)
+                if ids is None:
+                    ids = self._entries[word] = set()
+                    new_words.append(word)
+                ids.add(catalog_id)
+        for word in new_words:
+            grams = trigrams(word)
+            self._gram_counts[word] = len(grams)
+            for gram in grams:
+                self._word_grams.setdefault(gram, []).append(word)
+        if len(new_words) > 16:
+            self._vocab = sorted(self._entries)
+        else:
+            for word in new_words:
+                insort(self._vocab, word)
+
+    def lookup(self, name: str) -> Optional[int]:
+        return self.by_key.get(normalize(name))
+
+    def _words_starting(self, prefix: str) -> List[str]:
+        start = bisect_left(self._vocab, prefix)
+        words = []
+        for word in self._vocab[start:start + _MAX_CANDIDATES]:
+            if not word.startswith(prefix):
+                break
+            words.append(word)
+        return words
+
+    def prefix(self, query: str, limit: int = 10) -> List[int]:
+        """Entries with a word starting with each word of ``query``, shortest first."""
+        groups = [self._words_starting(word) for word in normalize(query).split()]
+        if not groups or not all(groups):
+            return []
+        # walk the entries of the rarest query word; a complete word narrows them with a set intersection
+        groups.sort(key=lambda words: sum(len(self._entries[w]) for w in words))
+        exact = [self._entries[words[0]] for words in groups[1:] if len(words) == 1]
+        loose = [[self._entries[w] for w in words] for words in groups[1:] if len(words) > 1]
+        found: List[int] = []
+        scanned = 0
+        for word in groups[0]:
+            ids = self._entries[word].intersection(*exact) if exact else self._entries[word]
+            for catalog_id in ids:
+                scanned += 1
+                if catalog_id not in found and all(any(catalog_id in s for s in sets) for sets in loose):
+                    found.append(catalog_id)
+                if len(found) >= limit or scanned >= _MAX_CANDIDATES:
+                    break
+            if len(found) >= limit or scanned >= _MAX_CANDIDATES:
+                break
+        found.sort(key=lambda cid: (len(self._keys[cid]), self._keys[cid]))
+        return found
+
+    def _closest_word(self, word: str) -> Optional[str]:
+        # the known word sharing the most trigrams; ties go to the more common word
+        grams = trigrams(word)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._word_grams.get(gram, ()))
+        best, best_score = None, (_MIN_WORD_SIMILARITY, 0)
+        for other, count in shared.items():
+            score = (count / (len(grams) + self._gram_counts[other] - count), len(self._entries[other]))
+            if score >= best_score:
+                best, best_score = other, score
+        return best
+
+    def similar(self, query: str, limit: int = 5, min_similarity: float = _MIN_SIMILARITY) -> List[Tuple[int, float]]:
+        """Entries closest to a possibly misspelled ``query``, as (id, similarity) best first."""
+        key = normalize(query)
+        words = [w if w in self._entries else self._closest_word(w) for w in key.split()]
+        words = [w for w in words if w]
+        if not words:
+            return []
+        sets = sorted((self._entries[w] for w in words), key=len)
+        # entries with every corrected word, or failing that with the rarest one
+        ids = sets[0].intersection(*sets[1:]) or sets[0]
+        candidates = set(islice(ids, _MAX_CANDIDATES))
+        corrected = self.by_key.get(' '.join(words))
+        if corrected is not None:
+            candidates.add(corrected)
+        grams = trigrams(key)
+        scored = []
+        for catalog_id in candidates:
+            other = trigrams(self._keys[catalog_id])
+            similarity = len(grams & other) / len(grams | other)
+            if similarity >= min_similarity:
+                scored.append((catalog_id, similarity))
+        scored.sort(key=lambda item: (-item[1], len(self._keys[item[0]])))
+        return scored[:limit]
+
+
+class ExerciseCatalog:
+    """The catalog index, loaded from the database on first use and topped up with new entries."""
+
+    def __init__(self, db, refresh_interval: float = CATALOG_REFRESH_SECONDS, page_size: int = 5000):
+        self.db = db
+        self.index = CatalogIndex()
+        self.refresh_interval = refresh_interval
+        self.page_size = page_size
+        self._last_id = 0
+        self._refreshed_at: Optional[float] = None
+        self._stale = True
+        self._lock = asyncio.Lock()
+
+    def note_added(self) -> None:
+        """An exercise was written; its name may be a new entry."""
+        self._stale = True
+
+    async def refresh(self) -> None:
+        # entries are never removed or renamed, so only ids past the last one are loaded
+        if (not self._stale and self._refreshed_at is not None
+                and time.monotonic() - self._refreshed_at < self.refresh_interval):
+            return
+        async with self._lock:
+            self._stale = False
+            while True:
+                rows = await self.db.get_catalog_page(self._last_id, self.page_size)
+                self.index.load((row['id'], row['name']) for row in rows)
+                if rows:
+                    self._last_id = rows[-1]['id']
+                if len(rows) < self.page_size:
+                    break
+            self._refreshed_at = time.monotonic()
+
+    async def search(self, query: str, limit: int = 10) -> List[Tuple[int, str]]:
+        """Autocomplete: word-prefix matches, then close spellings."""
+        await self.refresh()
+        ids = self.index.prefix(query, limit)
+        if len(ids) < limit:
+            ids += [cid for cid, _ in self.index.similar(query, limit) if cid not in ids][:limit - len(ids)]
+        return [(cid, self.index.names[cid]) for cid in ids]
+
+    async def lookup(self, name: str) -> Optional[Tuple[int, str]]:
+        await self.refresh()
+        catalog_id = self.index.lookup(name)
+        return (catalog_id, self.index.names[catalog_id]) if catalog_id is not None else None
+
+    async def suggest(self, name: str, limit: int = 3) -> List[Tuple[int, str]]:
+        """"Did you mean": close catalog entries, or nothing when ``name`` is one already."""
+        await self.refresh()
+        if self.index.lookup(name) is not None:
+            return []
+        return [(cid, self.index.names[cid]) for cid, _ in self.index.similar(name, limit)]
+
+    async def name_of(self, catalog_id: int) -> Optional[str]:
+        await self.refresh()
+        return self.index.names.get(catalog_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {'entries': len(self.index)}
@@ -3,82 +3,116 @@ Database module for gym reminder bot.
 Handles storage and retrieval of workout programs and exercises.
 """
 
+import asyncio
+import json
 import sqlite3
-from typing import List, Optional, Dict
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import List, Optional, Dict, Tuple
 import os
 from datetime import datetime
 
+import migrations
+from catalog import normalize
+from metrics import observe_db
+
 DB_PATH = os.path.join(os.path.dirname(__file__), 'gym.db')
 
+# exercises are spaced this far apart, so a move only rewrites the moved row's
+# position (the midpoint of its new neighbours); see move_exercise
+POSITION_GAP = 1024
+
+
+def is_memory(path: str) -> bool:
+    """``:memory:`` or a ``file:`` URI with ``mode=memory`` (shared between connections with ``cache=shared``)."""
+    return path == ':memory:' or (path.startswith('file:') and 'mode=memory' in path)
+
+
+def _readonly_uri(path: str) -> str:
+    if path.startswith('file:'):
+        return path + ('&' if '?' in path else '?') + 'mode=ro'
+    return f"file:{path}?mode=ro"
+
+# "full" commits every statement; "batched" groups writes into one transaction
+# that is committed every DB_COMMIT_EVERY statements or DB_COMMIT_INTERVAL_MS,
+# whichever comes first (a crash can lose at most that window of writes).
+DB_DURABILITY = os.getenv('DB_DURABILITY', 'full')
+DB_COMMIT_EVERY = int(os.getenv('DB_COMMIT_EVERY', '50'))
+DB_COMMIT_INTERVAL_MS = int(os.getenv('DB_COMMIT_INTERVAL_MS', '200'))
+
 
 class Database:
-    def __init__(self):
-        self.conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    def __init__(self, path: str = DB_PATH, readonly: bool = False,
+                 commit_every: int = 1, commit_interval: float = 0.0):
+        self.path = path
+        self.commit_every = max(1, commit_every)
+        self.commit_interval = commit_interval
+        self.pending = 0
+        self._first_pending_at = 0.0
+        if readonly and not is_memory(path):
+            self.conn = sqlite3.connect(_readonly_uri(path), uri=True, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(path, uri=path.startswith('file:'), check_same_thread=False)
         self.conn.row_factory = sqlite3.Row
-        self._ensure_tables()
+        self._configure(readonly)
+        if not readonly:
+            self._ensure_tables()
 
-    def _ensure_tables(self):
-        cur = self.conn.cursor()
-        # users
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY,
-            username TEXT
-        )
-        """)
-        # programs
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS programs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            day_name TEXT,
-            created_at TEXT
-        )
-        """)
-        # exercises
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS exercises (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            program_id INTEGER,
-            name TEXT,
-            reps INTEGER DEFAULT 0,
-            sets INTEGER DEFAULT 0,
-            weight REAL DEFAULT 0,
-            gif TEXT,
-            position INTEGER DEFAULT 0
-        )
-        """)
-        # sessions
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS sessions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            program_id INTEGER,
-            started_at TEXT,
-            current_index INTEGER DEFAULT 0,
-            closed INTEGER DEFAULT 0
-        )
-        """)
-        # user settings
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS user_settings (
-            user_id INTEGER PRIMARY KEY,
-            rest_seconds INTEGER DEFAULT 60
-        )
-        """)
+    def close(self):
+        if self.pending:
+            self.flush()
+        self.conn.close()
+
+    def _commit(self):
+        """Commit now, or leave the write pending when group commit is enabled."""
+        self.pending += 1
+        if self.pending == 1:
+            self._first_pending_at = time.monotonic()
+        if (self.pending >= self.commit_every
+                or time.monotonic() - self._first_pending_at >= self.commit_interval):
+            self.flush()
+
+    def flush(self):
+        """Commit all pending writes in one transaction."""
         self.conn.commit()
+        self.pending = 0
+
+    def _configure(self, readonly: bool):
+        cur = self.conn.cursor()
+        cur.execute("PRAGMA busy_timeout = 5000")
+        cur.execute("PRAGMA temp_store = MEMORY")
+        cur.execute("PRAGMA cache_size = -16000")
+        if readonly:
+            return
+        cur.execute("PRAGMA foreign_keys = ON")
+        if not is_memory(self.path):
+            cur.execute("PRAGMA journal_mode = WAL")
+            # WAL with synchronous=NORMAL only fsyncs at checkpoints; keep FULL when
+            # every write is expected to be durable on its own
+            cur.execute("PRAGMA synchronous = %s" % ("FULL" if self.commit_every == 1 else "NORMAL"))
+
+    def _ensure_tables(self):
+        migrations.migrate(self.conn)
 
     def add_user(self, user_id: int, username: Optional[str]):
         cur = self.conn.cursor()
         cur.execute("INSERT OR IGNORE INTO users (id, username) VALUES (?, ?)", (user_id, username))
-        self.conn.commit()
+        self._commit()
 
     def create_workout_program(self, user_id: int, day_name: str) -> int:
+        """The id of the user's program for ``day_name``, created if there is none (one per day)."""
         cur = self.conn.cursor()
-        cur.execute("INSERT INTO programs (user_id, day_name, created_at) VALUES (?, ?, ?)",
+        cur.execute("INSERT OR IGNORE INTO programs (user_id, day_name, created_at) VALUES (?, ?, ?)",
                     (user_id, day_name, datetime.utcnow().isoformat()))
-        self.conn.commit()
-        return cur.lastrowid
+        if cur.rowcount:
+            program_id = cur.lastrowid
+        else:
+            cur.execute("SELECT id FROM programs WHERE user_id = ? AND day_name = ?", (user_id, day_name))
+            program_id = cur.fetchone()['id']
+        self._commit()
+        return program_id
 
     def get_program_by_user_day(self, user_id: int, day_name: str) -> Optional[Dict]:
         cur = self.conn.cursor()
@@ -87,82 +121,426 @@ class Database:
         row = cur.fetchone()
         return dict(row) if row else None
 
+    def get_program(self, program_id: int) -> Optional[Dict]:
+        cur = self.conn.cursor()
+        cur.execute("SELECT id, user_id, day_name FROM programs WHERE id = ?", (program_id,))
+        row = cur.fetchone()
+        return dict(row) if row else None
+
+    def get_program_version(self, program_id: int) -> Optional[int]:
+        cur = self.conn.cursor()
+        cur.execute("SELECT version FROM programs WHERE id = ?", (program_id,))
+        row = cur.fetchone()
+        return row['version'] if row else None
+
+    def get_exercise_program_id(self, exercise_id: int) -> Optional[int]:
+        cur = self.conn.cursor()
+        cur.execute("SELECT program_id FROM exercises WHERE id = ?", (exercise_id,))
+        row = cur.fetchone()
+        return row['program_id'] if row else None
+
+    def _next_version(self, cur: sqlite3.Cursor, program_id: int) -> int:
+        # every edit of a program's exercises is one new version: rows it adds start
+        # at that version, rows it changes or removes end there
+        cur.execute("UPDATE programs SET version = version + 1 WHERE id = ?", (program_id,))
+        cur.execute("SELECT version FROM programs WHERE id = ?", (program_id,))
+        row = cur.fetchone()
+        return row['version'] if row else 0
+
+    def delete_program(self, program_id: int):
+        cur = self.conn.cursor()
+        cur.execute("DELETE FROM exercises WHERE program_id = ?", (program_id,))
+        cur.execute("DELETE FROM programs WHERE id = ?", (program_id,))
+        self._commit()
+
     def get_user_programs(self, user_id: int) -> List[Dict]:
         cur = self.conn.cursor()
         cur.execute("SELECT id, day_name FROM programs WHERE user_id = ?", (user_id,))
         rows = cur.fetchall()
         return [dict(r) for r in rows]
 
+    def _retire(self, cur: sqlite3.Cursor, program_id: int, version: int, where: str, params: tuple):
+        # rows an open session may still read end at ``version``; the others go right away
+        cur.execute(f"""
+            UPDATE exercises SET valid_to = ?
+            WHERE program_id = ? AND valid_to IS NULL AND {where}
+              AND EXISTS (SELECT 1 FROM sessions s
+                          WHERE s.program_id = exercises.program_id AND s.closed = 0 AND s.version >= exercises.valid_from)
+        """, (version, program_id, *params))
+        cur.execute(f"DELETE FROM exercises WHERE program_id = ? AND valid_to IS NULL AND {where}", (program_id, *params))
+
     def delete_exercises(self, program_id: int):
+        """Start a new, empty version of the program; sessions running an older one keep it."""
         cur = self.conn.cursor()
-        cur.execute("DELETE FROM exercises WHERE program_id = ?", (program_id,))
-        self.conn.commit()
+        version = self._next_version(cur, program_id)
+        self._retire(cur, program_id, version, "1", ())
+        self._commit()
 
-    def add_exercise(self, program_id: int, name: str, reps: int, sets: int, weight: float = 0.0, gif: Optional[str] = None, position: int = 0):
+    def add_exercise(self, program_id: int, name: str, reps: int, sets: int, weight: float = 0.0, gif: Optional[str] = None,
+                     position: Optional[int] = None):
+        """Add an exercise at ``position``, or after the last one."""
         cur = self.conn.cursor()
+        version = self._next_version(cur, program_id)
+        if position is None:
+            position = self._next_position(cur, program_id)
+        catalog_id, gif, catalog_gif = self._catalog_entry(cur, name, gif)
         cur.execute("""
-            INSERT INTO exercises (program_id, name, reps, sets, weight, gif, position)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (program_id, name, reps, sets, weight, gif, position))
-        self.conn.commit()
+            INSERT INTO exercises (program_id, name, reps, sets, weight, gif, position, valid_from, catalog_id,
+                                   catalog_gif)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (program_id, name, reps, sets, weight, gif, position, version, catalog_id, catalog_gif))
+        self._commit()
         return cur.lastrowid
 
+    def add_exercises(self, program_id: int, exercises: List[tuple]) -> List[int]:
+        """
+        Append (name, reps, sets, weight, gif) rows after the program's last
+        exercise, as one new version and one commit. Returns their ids.
+        """
+        cur = self.conn.cursor()
+        ids = self._append_exercises(cur, program_id, exercises)
+        self._commit()
+        return ids
+
+    def _append_exercises(self, cur: sqlite3.Cursor, program_id: int, exercises: List[tuple]) -> List[int]:
+        version = self._next_version(cur, program_id)
+        start = self._next_position(cur, program_id)
+        ids = []
+        for i, (name, reps, sets, weight, gif) in enumerate(exercises):
+            catalog_id, gif, catalog_gif = self._catalog_entry(cur, name, gif)
+            cur.execute("""
+                INSERT INTO exercises (program_id, name, reps, sets, weight, gif, position, valid_from, catalog_id,
+                                       catalog_gif)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (program_id, name, reps, sets, weight, gif, start + i * POSITION_GAP, version, catalog_id,
+                  catalog_gif))
+            ids.append(cur.lastrowid)
+        return ids
+
+    def _catalog_entry(self, cur: sqlite3.Cursor, name: str, gif: Optional[str]) -> Tuple[int, Optional[str], int]:
+        """
+        The catalog id of ``name``, added if new, the gif to store on the
+        exercise and its catalog_gif flag. A gif equal to the entry's (a new
+        entry takes the first one) is stored once, on the entry, and the flag
+        makes the exercise show it; without the flag an exercise never shows
+        the entry's gif, which another user attached.
+        """
+        key = normalize(name)
+        cur.execute("SELECT id, gif FROM exercise_catalog WHERE name_key = ?", (key,))
+        row = cur.fetchone()
+        if row is None:
+            # looked up first: a conflicting insert would still use up an id.
+            # Another shard process may have added the key since the lookup.
+            cur.execute("INSERT OR IGNORE INTO exercise_catalog (name, name_key, gif) VALUES (?, ?, ?)",
+                        (name, key, gif))
+            if cur.rowcount:
+                return cur.lastrowid, None, int(gif is not None)
+            cur.execute("SELECT id, gif FROM exercise_catalog WHERE name_key = ?", (key,))
+            row = cur.fetchone()
+        catalog_id, shared = row
+        if gif and shared is None:
+            cur.execute("UPDATE exercise_catalog SET gif = ? WHERE id = ?", (gif, catalog_id))
+            shared = gif
+        if gif is not None and gif == shared:
+            return catalog_id, None, 1
+        return catalog_id, gif, 0
+
+    def _next_position(self, cur: sqlite3.Cursor, program_id: int) -> int:
+        cur.execute("SELECT MAX(position) FROM exercises WHERE program_id = ? AND valid_to IS NULL", (program_id,))
+        last = cur.fetchone()[0]
+        return POSITION_GAP if last is None else last + POSITION_GAP
+
+    def _current_exercise(self, cur: sqlite3.Cursor, exercise_id: int) -> Optional[sqlite3.Row]:
+        cur.execute("SELECT id, program_id, position, valid_from FROM exercises WHERE id = ? AND valid_to IS NULL",
+                    (exercise_id,))
+        return cur.fetchone()
+
     def update_exercise(self, exercise_id: int, name: str, reps: int, sets: int, weight: float = 0.0, gif: Optional[str] = None):
+        """
+        Change the exercise in a new program version. The row keeps its id; if an
+        open session can see the old values they are first copied to a row that
+        ends at the new version.
+        """
         cur = self.conn.cursor()
+        row = self._current_exercise(cur, exercise_id)
+        if not row:
+            return False
+        version = self._next_version(cur, row['program_id'])
+        self._preserve(cur, row, version)
+        catalog_id, gif, catalog_gif = self._catalog_entry(cur, name, gif)
         cur.execute("""
-            UPDATE exercises SET name = ?, reps = ?, sets = ?, weight = ?, gif = ? WHERE id = ?
-        """, (name, reps, sets, weight, gif, exercise_id))
-        self.conn.commit()
-        return cur.rowcount > 0
+            UPDATE exercises SET name = ?, reps = ?, sets = ?, weight = ?, gif = ?, catalog_id = ?, catalog_gif = ?,
+                                 valid_from = ?
+            WHERE id = ?
+        """, (name, reps, sets, weight, gif, catalog_id, catalog_gif, version, exercise_id))
+        self._commit()
+        return True
+
+    def rename_exercise(self, exercise_id: int, catalog_id: int) -> bool:
+        """Give the exercise the name of catalog entry ``catalog_id`` (a "did you mean" pick)."""
+        cur = self.conn.cursor()
+        cur.execute("SELECT name FROM exercise_catalog WHERE id = ?", (catalog_id,))
+        entry = cur.fetchone()
+        row = self._current_exercise(cur, exercise_id)
+        if not entry or not row:
+            return False
+        version = self._next_version(cur, row['program_id'])
+        self._preserve(cur, row, version)
+        # a gif shared with the old entry is copied onto the row, it stays the exercise's own
+        cur.execute("""
+            UPDATE exercises SET name = ?, catalog_id = ?, valid_from = ?, catalog_gif = 0,
+                gif = CASE WHEN catalog_gif THEN (SELECT gif FROM exercise_catalog WHERE id = exercises.catalog_id)
+                           ELSE gif END
+            WHERE id = ?
+        """, (entry['name'], catalog_id, version, exercise_id))
+        self._commit()
+        return True
+
+    def _preserve(self, cur: sqlite3.Cursor, row: sqlite3.Row, version: int):
+        # before a current row is changed in place: copy it for the open sessions that can see it
+        cur.execute("""
+            INSERT INTO exercises (program_id, name, reps, sets, weight, gif, position, valid_from, valid_to, catalog_id,
+                                   catalog_gif)
+            SELECT program_id, name, reps, sets, weight, gif, position, valid_from, ?, catalog_id, catalog_gif
+            FROM exercises WHERE id = ?
+              AND EXISTS (SELECT 1 FROM sessions s WHERE s.program_id = ? AND s.closed = 0 AND s.version >= ?)
+        """, (version, row['id'], row['program_id'], row['valid_from']))
+
+    def move_exercise(self, exercise_id: int, index: int) -> Optional[int]:
+        """
+        Move the exercise to ``index`` (0-based) of the program's current order in
+        a new version. Only its own position changes, to the midpoint of its new
+        neighbours; when they are adjacent the program is respaced first.
+        Returns the program id, or None if the exercise is gone.
+        """
+        cur = self.conn.cursor()
+        row = self._current_exercise(cur, exercise_id)
+        if not row:
+            return None
+        program_id = row['program_id']
+        position = self._position_at(cur, program_id, exercise_id, index)
+        if position is None:
+            self._respace(cur, program_id)
+            position = self._position_at(cur, program_id, exercise_id, index)
+        if position != row['position']:
+            version = self._next_version(cur, program_id)
+            self._preserve(cur, row, version)
+            cur.execute("UPDATE exercises SET position = ?, valid_from = ? WHERE id = ?", (position, version, exercise_id))
+        self._commit()
+        return program_id
+
+    def _position_at(self, cur: sqlite3.Cursor, program_id: int, exercise_id: int, index: int) -> Optional[int]:
+        # a free position that puts the exercise at ``index``, its current one if it is already there
+        cur.execute("""
+            SELECT id, position FROM exercises WHERE program_id = ? AND valid_to IS NULL ORDER BY position, id
+        """, (program_id,))
+        rows = cur.fetchall()
+        current = next(i for i, r in enumerate(rows) if r['id'] == exercise_id)
+        others = [r['position'] for r in rows if r['id'] != exercise_id]
+        index = max(0, min(index, len(others)))
+        if index == current:
+            return rows[current]['position']
+        before = others[index - 1] if index > 0 else None
+        after = others[index] if index < len(others) else None
+        if before is None:
+            return POSITION_GAP if after is None else after - POSITION_GAP
+        if after is None:
+            return before + POSITION_GAP
+        if after - before < 2:
+            return None
+        return (before + after) // 2
+
+    def _respace(self, cur: sqlite3.Cursor, program_id: int):
+        # every row of every version, in (position, id) order: each version keeps its order
+        cur.execute("SELECT id FROM exercises WHERE program_id = ? ORDER BY position, id", (program_id,))
+        cur.executemany("UPDATE exercises SET position = ? WHERE id = ?",
+                        [((i + 1) * POSITION_GAP, r['id']) for i, r in enumerate(cur.fetchall())])
+
+    def respace_exercises(self, min_gap: int = POSITION_GAP // 64, limit: int = 100) -> int:
+        """Respace up to ``limit`` programs whose current exercises are closer than ``min_gap``."""
+        cur = self.conn.cursor()
+        cur.execute("""
+            SELECT program_id FROM (
+                SELECT program_id, position - LAG(position) OVER (PARTITION BY program_id ORDER BY position, id) AS gap
+                FROM exercises WHERE valid_to IS NULL)
+            WHERE gap < ? GROUP BY program_id LIMIT ?
+        """, (min_gap, limit))
+        programs = [r['program_id'] for r in cur.fetchall()]
+        for program_id in programs:
+            self._respace(cur, program_id)
+        if programs:
+            self._commit()
+        return len(programs)
 
     def delete_exercise_by_id(self, exercise_id: int) -> bool:
         cur = self.conn.cursor()
-        cur.execute("DELETE FROM exercises WHERE id = ?", (exercise_id,))
-        self.conn.commit()
-        return cur.rowcount > 0
+        row = self._current_exercise(cur, exercise_id)
+        if not row:
+            return False
+        version = self._next_version(cur, row['program_id'])
+        self._retire(cur, row['program_id'], version, "id = ?", (exercise_id,))
+        self._commit()
+        return True
 
     def delete_last_exercise(self, program_id: int) -> bool:
         cur = self.conn.cursor()
-        cur.execute("SELECT id FROM exercises WHERE program_id = ? ORDER BY position DESC, id DESC LIMIT 1", (program_id,))
+        cur.execute("""
+            SELECT id FROM exercises WHERE program_id = ? AND valid_to IS NULL
+            ORDER BY position DESC, id DESC LIMIT 1
+        """, (program_id,))
         row = cur.fetchone()
         if not row:
             return False
-        cur.execute("DELETE FROM exercises WHERE id = ?", (row['id'],))
-        self.conn.commit()
+        version = self._next_version(cur, program_id)
+        self._retire(cur, program_id, version, "id = ?", (row['id'],))
+        self._commit()
         return True
 
-    def get_exercises(self, program_id: int) -> List[Dict]:
+    def get_exercises(self, program_id: int, version: Optional[int] = None) -> List[Dict]:
+        """
+        The program's exercises now, or as they were at ``version``. An
+        exercise flagged catalog_gif shows its catalog entry's gif.
+        """
         cur = self.conn.cursor()
-        cur.execute("SELECT id, name, reps, sets, weight, gif, position FROM exercises WHERE program_id = ? ORDER BY position ASC, id ASC", (program_id,))
+        if version is None:
+            cur.execute("""
+                SELECT e.id, e.name, e.reps, e.sets, e.weight, CASE WHEN e.catalog_gif THEN c.gif ELSE e.gif END AS gif, e.position
+                FROM exercises e LEFT JOIN exercise_catalog c ON c.id = e.catalog_id
+                WHERE e.program_id = ? AND e.valid_to IS NULL ORDER BY e.position ASC, e.id ASC
+            """, (program_id,))
+        else:
+            cur.execute("""
+                SELECT e.id, e.name, e.reps, e.sets, e.weight, CASE WHEN e.catalog_gif THEN c.gif ELSE e.gif END AS gif, e.position
+                FROM exercises e LEFT JOIN exercise_catalog c ON c.id = e.catalog_id
+                WHERE e.program_id = ? AND e.valid_from <= ? AND (e.valid_to IS NULL OR e.valid_to > ?)
+                ORDER BY e.position ASC, e.id ASC
+            """, (program_id, version, version))
         rows = cur.fetchall()
         return [dict(r) for r in rows]
 
-    def create_workout_session(self, user_id: int, program_id: int) -> int:
+    def collect_exercise_versions(self, limit: int = 1000) -> int:
+        """
+        Delete up to ``limit`` superseded exercise rows that no open session's
+        pinned version can see. Returns how many were deleted.
+        """
         cur = self.conn.cursor()
-        cur.execute("INSERT INTO sessions (user_id, program_id, started_at, current_index) VALUES (?, ?, ?, ?)",
-                    (user_id, program_id, datetime.utcnow().isoformat(), 0))
-        self.conn.commit()
+        cur.execute("""
+            DELETE FROM exercises WHERE id IN (
+                SELECT e.id FROM exercises e
+                WHERE e.valid_to IS NOT NULL AND NOT EXISTS (
+                    SELECT 1 FROM sessions s
+                    WHERE s.program_id = e.program_id AND s.closed = 0
+                      AND s.version >= e.valid_from AND s.version < e.valid_to)
+                LIMIT ?)
+        """, (limit,))
+        self._commit()
+        return cur.rowcount
+
+    def import_exercises(self, user_id: int, rows: List[tuple]) -> Dict[str, Dict]:
+        """
+        Append (day_name, name, reps, sets, weight, gif) rows to the user's
+        programs, creating missing days, all in one transaction. Returns
+        {day_name: {'program_id': ..., 'added': ...}}.
+        """
+        by_day: Dict[str, List[tuple]] = {}
+        for day_name, *exercise in rows:
+            by_day.setdefault(day_name, []).append(tuple(exercise))
+        result = {}
+        cur = self.conn.cursor()
+        # a savepoint keeps the import atomic without committing other batched writes early
+        cur.execute("SAVEPOINT import_exercises")
+        try:
+            for day_name, exercises in by_day.items():
+                cur.execute("SELECT id FROM programs WHERE user_id = ? AND day_name = ?", (user_id, day_name))
+                row = cur.fetchone()
+                if row:
+                    program_id = row['id']
+                else:
+                    cur.execute("INSERT INTO programs (user_id, day_name, created_at) VALUES (?, ?, ?)",
+                                (user_id, day_name, datetime.utcnow().isoformat()))
+                    program_id = cur.lastrowid
+                # the whole day's import is one new version
+                self._append_exercises(cur, program_id, exercises)
+                result[day_name] = {'program_id': program_id, 'added': len(exercises)}
+            cur.execute("RELEASE import_exercises")
+        except Exception:
+            cur.execute("ROLLBACK TO import_exercises")
+            cur.execute("RELEASE import_exercises")
+            raise
+        self._commit()
+        return result
+
+    def get_export_page(self, user_id: int, after: Optional[tuple] = None, limit: int = 500) -> List[Dict]:
+        """
+        One page of the user's exercises with their day, in program order.
+        Pass the (program_id, position, id) of the last row as ``after`` to
+        get the next page.
+        """
+        after = after or (0, -1, 0)
+        cur = self.conn.cursor()
+        cur.execute("""
+            SELECT p.day_name, e.name, e.reps, e.sets, e.weight, CASE WHEN e.catalog_gif THEN c.gif ELSE e.gif END AS gif,
+                   e.program_id, e.position, e.id
+            FROM programs p JOIN exercises e ON e.program_id = p.id
+            LEFT JOIN exercise_catalog c ON c.id = e.catalog_id
+            WHERE p.user_id = ? AND e.valid_to IS NULL AND (e.program_id, e.position, e.id) > (?, ?, ?)
+            ORDER BY e.program_id, e.position, e.id
+            LIMIT ?
+        """, (user_id, *after, limit))
+        return [dict(r) for r in cur.fetchall()]
+
+    def get_catalog_page(self, after_id: int = 0, limit: int = 5000) -> List[Dict]:
+        """Catalog entries with ids above ``after_id``, in id order."""
+        cur = self.conn.cursor()
+        cur.execute("SELECT id, name FROM exercise_catalog WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit))
+        return [dict(r) for r in cur.fetchall()]
+
+    def create_workout_session(self, user_id: int, program_id: int, version: Optional[int] = None) -> int:
+        """Open a session on ``version`` of the program (default: the current one), which it keeps seeing."""
+        cur = self.conn.cursor()
+        # a user has at most one open session; starting a new one closes the old one
+        cur.execute("UPDATE sessions SET closed = 1 WHERE user_id = ? AND closed = 0", (user_id,))
+        cur.execute("""
+            INSERT INTO sessions (user_id, program_id, started_at, current_index, version)
+            VALUES (?, ?, ?, 0, COALESCE(?, (SELECT version FROM programs WHERE id = ?)))
+        """, (user_id, program_id, datetime.utcnow().isoformat(), version, program_id))
+        self._commit()
         return cur.lastrowid
 
+    def get_active_session(self, user_id: int) -> Optional[Dict]:
+        cur = self.conn.cursor()
+        cur.execute("""
+            SELECT id, program_id, current_index, version, exercises_json FROM sessions
+            WHERE user_id = ? AND closed = 0
+        """, (user_id,))
+        row = cur.fetchone()
+        if not row:
+            return None
+        return {
+            'session_id': row['id'],
+            'program_id': row['program_id'],
+            'current_exercise_index': row['current_index'],
+            'version': row['version'],
+            # sessions started before versions were pinned carry a copy of their exercises
+            'exercises': json.loads(row['exercises_json']) if row['exercises_json'] else None,
+        }
+
     def update_session_exercise_index(self, session_id: int, index: int):
         cur = self.conn.cursor()
         cur.execute("UPDATE sessions SET current_index = ? WHERE id = ?", (index, session_id))
-        self.conn.commit()
+        self._commit()
 
     def close_session(self, session_id: int):
         cur = self.conn.cursor()
         cur.execute("UPDATE sessions SET closed = 1 WHERE id = ?", (session_id,))
-        self.conn.commit()
+        self._commit()
 
     def get_rest_seconds(self, user_id: int) -> int:
         cur = self.conn.cursor()
         cur.execute("SELECT rest_seconds FROM user_settings WHERE user_id = ?", (user_id,))
         row = cur.fetchone()
-        if row:
-            return int(row['rest_seconds'])
-        cur.execute("INSERT OR IGNORE INTO user_settings (user_id, rest_seconds) VALUES (?, ?)", (user_id, 60))
-        self.conn.commit()
-        return 60
+        # users without a settings row get the default; set_rest_seconds upserts the row
+        return int(row['rest_seconds']) if row else 60
 
     def set_rest_seconds(self, user_id: int, seconds: int):
         cur = self.conn.cursor()
@@ -171,4 +549,346 @@ class Database:
             INSERT INTO user_settings (user_id, rest_seconds) VALUES (?, ?)
             ON CONFLICT(user_id) DO UPDATE SET rest_seconds=excluded.rest_seconds
         """, (user_id, seconds))
-        self.conn.commit()
+        self._commit()
+
+    def get_persisted_user_data(self, user_id: int) -> Optional[str]:
+        cur = self.conn.cursor()
+        cur.execute("SELECT data FROM persisted_user_data WHERE user_id = ?", (user_id,))
+        row = cur.fetchone()
+        return row['data'] if row else None
+
+    def save_persisted_user_data(self, rows: List[tuple]):
+        """Upsert (user_id, json) pairs in one transaction."""
+        now = datetime.utcnow().isoformat()
+        cur = self.conn.cursor()
+        cur.executemany("""
+            INSERT INTO persisted_user_data (user_id, data, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET data=excluded.data, updated_at=excluded.updated_at
+        """, [(user_id, data, now) for user_id, data in rows])
+        self._commit()
+
+    def delete_persisted_user_data(self, user_id: int):
+        cur = self.conn.cursor()
+        cur.execute("DELETE FROM persisted_user_data WHERE user_id = ?", (user_id,))
+        self._commit()
+
+    def get_persisted_conversations(self, name: str) -> List[Dict]:
+        cur = self.conn.cursor()
+        cur.execute("SELECT key, state FROM persisted_conversations WHERE name = ?", (name,))
+        return [dict(r) for r in cur.fetchall()]
+
+    def save_persisted_conversations(self, rows: List[tuple]):
+        """Store (name, key, state) rows in one transaction; a state of None ends the conversation."""
+        cur = self.conn.cursor()
+        cur.executemany("DELETE FROM persisted_conversations WHERE name = ? AND key = ?",
+                        [(name, key) for name, key, state in rows if state is None])
+        cur.executemany("""
+            INSERT INTO persisted_conversations (name, key, state) VALUES (?, ?, ?)
+            ON CONFLICT(name, key) DO UPDATE SET state=excluded.state
+        """, [row for row in rows if row[2] is not None])
+        self._commit()
+
+    def get_media_file_ids(self, urls: List[str]) -> Dict[str, str]:
+        if not urls:
+            return {}
+        cur = self.conn.cursor()
+        cur.execute("SELECT url, file_id FROM media_cache WHERE url IN (%s)" % ",".join("?" * len(urls)), urls)
+        return {r['url']: r['file_id'] for r in cur.fetchall()}
+
+    def save_media_file_id(self, url: str, file_id: str):
+        cur = self.conn.cursor()
+        cur.execute("""
+            INSERT INTO media_cache (url, file_id, created_at) VALUES (?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET file_id=excluded.file_id, created_at=excluded.created_at
+        """, (url, file_id, datetime.utcnow().isoformat()))
+        self._commit()
+
+    def delete_media_file_id(self, url: str):
+        cur = self.conn.cursor()
+        cur.execute("DELETE FROM media_cache WHERE url = ?", (url,))
+        self._commit()
+
+    def log_exercise(self, user_id: int, session_id: Optional[int], name: str, reps: int, sets: int,
+                     weight: float, logged_at: float, day: str, week_start: str, previous_week: str):
+        """
+        Append a completed exercise to workout_log and fold it into the
+        weekly, record and streak aggregates. ``day``, ``week_start`` and
+        ``previous_week`` are ISO dates in the user's local calendar.
+        Returns the id of the workout_log row.
+        """
+        reps, sets, weight = int(reps or 0), int(sets or 0), float(weight or 0)
+        cur = self.conn.cursor()
+        cur.execute("""
+            INSERT INTO workout_log (user_id, session_id, exercise_name, reps, sets, weight, logged_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (user_id, session_id, name, reps, sets, weight, logged_at))
+        log_id = cur.lastrowid
+        cur.execute("""
+            INSERT INTO stats_weekly (user_id, week_start, volume, sets, exercises) VALUES (?, ?, ?, ?, 1)
+            ON CONFLICT(user_id, week_start) DO UPDATE SET
+                volume = volume + excluded.volume, sets = sets + excluded.sets, exercises = exercises + 1
+        """, (user_id, week_start, reps * sets * weight, sets))
+        if weight > 0:
+            cur.execute("""
+                INSERT INTO stats_records (user_id, exercise_name, weight, reps, achieved_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(user_id, exercise_name) DO UPDATE SET
+                    weight = excluded.weight, reps = excluded.reps, achieved_at = excluded.achieved_at
+                WHERE excluded.weight > stats_records.weight
+                   OR (excluded.weight = stats_records.weight AND excluded.reps > stats_records.reps)
+            """, (user_id, name, weight, reps, logged_at))
+        cur.execute("SELECT last_day, last_week, days, current_weeks, longest_weeks FROM stats_streaks WHERE user_id = ?",
+                    (user_id,))
+        row = cur.fetchone()
+        if row is None:
+            days, current = 1, 1
+            longest = 1
+        else:
+            days = row['days'] + (row['last_day'] != day)
+            if row['last_week'] == week_start:
+                current = row['current_weeks']
+            elif row['last_week'] == previous_week:
+                current = row['current_weeks'] + 1
+            else:
+                current = 1
+            longest = max(row['longest_weeks'], current)
+        cur.execute("""
+            INSERT INTO stats_streaks (user_id, last_day, last_week, days, current_weeks, longest_weeks)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET last_day=excluded.last_day, last_week=excluded.last_week,
+                days=excluded.days, current_weeks=excluded.current_weeks, longest_weeks=excluded.longest_weeks
+        """, (user_id, day, week_start, days, current, longest))
+        self._commit()
+        return log_id
+
+    def get_weekly_volume(self, user_id: int, weeks: int = 8) -> List[Dict]:
+        cur = self.conn.cursor()
+        cur.execute("""
+            SELECT week_start, volume, sets, exercises FROM stats_weekly
+            WHERE user_id = ? ORDER BY week_start DESC LIMIT ?
+        """, (user_id, weeks))
+        return [dict(r) for r in cur.fetchall()]
+
+    def get_personal_records(self, user_id: int, limit: int = 10) -> List[Dict]:
+        cur = self.conn.cursor()
+        cur.execute("""
+            SELECT exercise_name, weight, reps, achieved_at FROM stats_records
+            WHERE user_id = ? ORDER BY weight DESC LIMIT ?
+        """, (user_id, limit))
+        return [dict(r) for r in cur.fetchall()]
+
+    def get_streak(self, user_id: int) -> Optional[Dict]:
+        cur = self.conn.cursor()
+        cur.execute("SELECT last_day, last_week, days, current_weeks, longest_weeks FROM stats_streaks WHERE user_id = ?",
+                    (user_id,))
+        row = cur.fetchone()
+        return dict(row) if row else None
+
+    def get_reminder(self, user_id: int) -> Optional[Dict]:
+        cur = self.conn.cursor()
+        cur.execute("SELECT user_id, chat_id, minute_of_day, tz, next_fire_at FROM reminders WHERE user_id = ?",
+                    (user_id,))
+        row = cur.fetchone()
+        return dict(row) if row else None
+
+    def set_reminder(self, user_id: int, chat_id: int, minute_of_day: int, tz: str, next_fire_at: float):
+        cur = self.conn.cursor()
+        cur.execute("""
+            INSERT INTO reminders (user_id, chat_id, minute_of_day, tz, next_fire_at) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET chat_id=excluded.chat_id, minute_of_day=excluded.minute_of_day,
+                tz=excluded.tz, next_fire_at=excluded.next_fire_at
+        """, (user_id, chat_id, minute_of_day, tz, next_fire_at))
+        self._commit()
+
+    def delete_reminder(self, user_id: int):
+        cur = self.conn.cursor()
+        cur.execute("DELETE FROM reminders WHERE user_id = ?", (user_id,))
+        self._commit()
+
+    def next_reminder_at(self) -> Optional[float]:
+        cur = self.conn.cursor()
+        cur.execute("SELECT MIN(next_fire_at) FROM reminders")
+        return cur.fetchone()[0]
+
+    def get_due_reminders(self, now: float, limit: int = 500) -> List[Dict]:
+        cur = self.conn.cursor()
+        cur.execute("""
+            SELECT user_id, chat_id, minute_of_day, tz, next_fire_at FROM reminders
+            WHERE next_fire_at <= ? ORDER BY next_fire_at LIMIT ?
+        """, (now, limit))
+        return [dict(r) for r in cur.fetchall()]
+
+    def claim_reminders(self, claims: List[tuple], now: float) -> List[int]:
+        """
+        Move each (user_id, fire_at, next_fire_at) reminder on to its next
+        fire time, in one transaction, before anything is sent. A row only
+        moves if it is still at ``fire_at``, so a reminder is claimed once
+        even across restarts or several bot processes. Returns the claimed
+        user ids.
+        """
+        cur = self.conn.cursor()
+        claimed = []
+        for user_id, fire_at, next_fire_at in claims:
+            cur.execute("""
+                UPDATE reminders SET next_fire_at = ?, last_sent_at = ?
+                WHERE user_id = ? AND next_fire_at = ?
+            """, (next_fire_at, now, user_id, fire_at))
+            if cur.rowcount:
+                claimed.append(user_id)
+        self._commit()
+        return claimed
+
+
+class AsyncDatabase:
+    """
+    Async front-end for Database so handlers never run SQLite on the event loop.
+
+    All writes go through one dedicated writer thread that owns the read-write
+    connection. Reads run on a small pool of threads, each with its own
+    read-only connection. In-memory databases cannot be shared between
+    connections (a shared-cache one only under table locks), so there every
+    call goes to the writer.
+
+    Nothing is opened until the first call: importing the handlers does not
+    touch the disk, and the connection is opened and migrated on the writer
+    thread rather than on the event loop.
+
+    With ``durability='batched'`` the writer groups statements into one
+    transaction; a timer commits whatever is pending after
+    ``commit_interval`` and ``close()`` flushes before shutting down.
+    """
+
+    READ_METHODS = frozenset({
+        'get_program', 'get_program_by_user_day', 'get_user_programs',
+        'get_exercises', 'get_rest_seconds', 'get_active_session',
+        'get_persisted_user_data', 'get_persisted_conversations', 'get_media_file_ids',
+        'get_reminder', 'next_reminder_at', 'get_due_reminders', 'get_export_page',
+        'get_weekly_volume', 'get_personal_records', 'get_streak',
+        'get_program_version', 'get_exercise_program_id', 'get_catalog_page',
+    })
+    WRITE_METHODS = frozenset({
+        'add_user', 'create_workout_program', 'delete_program', 'delete_exercises',
+        'add_exercise', 'add_exercises', 'update_exercise', 'delete_exercise_by_id', 'delete_last_exercise',
+        'create_workout_session', 'update_session_exercise_index', 'close_session',
+        'set_rest_seconds',
+        'save_persisted_user_data', 'delete_persisted_user_data', 'save_persisted_conversations',
+        'save_media_file_id', 'delete_media_file_id',
+        'set_reminder', 'delete_reminder', 'claim_reminders', 'import_exercises',
+        'log_exercise', 'collect_exercise_versions', 'move_exercise', 'respace_exercises',
+        'rename_exercise',
+    })
+
+    def __init__(self, path: str = DB_PATH, readers: int = 4, durability: str = DB_DURABILITY):
+        self.path = path
+        self.durability = durability
+        self._db: Optional[Database] = None
+        self._open_lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._local = threading.local()
+        self._reader_dbs: List[Database] = []
+        self._readers = None
+        if readers > 0 and not is_memory(path):
+            self._readers = ThreadPoolExecutor(
+                max_workers=readers, thread_name_prefix='db-reader', initializer=self._init_reader)
+
+    @property
+    def db(self) -> Database:
+        """The writer's connection, opened (and the schema migrated) on first use."""
+        if self._db is None:
+            with self._open_lock:
+                if self._db is None:
+                    if self.durability == 'batched':
+                        self._db = Database(self.path, commit_every=DB_COMMIT_EVERY,
+                                            commit_interval=DB_COMMIT_INTERVAL_MS / 1000)
+                    else:
+                        self._db = Database(self.path)
+        return self._db
+
+    @property
+    def is_open(self) -> bool:
+        return self._db is not None
+
+    def _open(self) -> Database:
+        return self.db
+
+    def _init_reader(self):
+        reader = Database(self.path, readonly=True)
+        self._local.db = reader
+        self._reader_dbs.append(reader)
+
+    def _read(self, name: str, *args, **kwargs):
+        return getattr(self._local.db, name)(*args, **kwargs)
+
+    async def _run(self, executor, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, partial(func, *args, **kwargs))
+
+    async def _call_read(self, name: str, *args, **kwargs):
+        start = time.perf_counter()
+        failed = True
+        try:
+            if self._db is None:
+                # readers open read-only, so the file has to exist and be migrated first
+                await self._run(self._writer, self._open)
+            if self._readers is None or self.db.pending:
+                # uncommitted group-commit writes are only visible on the writer connection
+                result = await self._run(self._writer, getattr(self.db, name), *args, **kwargs)
+            else:
+                result = await self._run(self._readers, self._read, name, *args, **kwargs)
+            failed = False
+            return result
+        finally:
+            observe_db(name, time.perf_counter() - start, failed)
+
+    async def _call_write(self, name: str, *args, **kwargs):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = await self._run(self._writer, self._write, name, *args, **kwargs)
+            failed = False
+        finally:
+            observe_db(name, time.perf_counter() - start, failed)
+        if self.db.pending and self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.db.commit_interval, self._schedule_flush)
+        return result
+
+    def _write(self, name: str, *args, **kwargs):
+        return getattr(self.db, name)(*args, **kwargs)
+
+    def _schedule_flush(self):
+        self._flush_handle = None
+        if self.db.pending:
+            asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """Commit pending group-commit writes now."""
+        await self._run(self._writer, self._flush_pending)
+
+    def _flush_pending(self):
+        if self._db is not None and self._db.pending:
+            self.db.flush()
+
+    def __getattr__(self, name: str):
+        if name in self.READ_METHODS:
+            func = partial(self._call_read, name)
+        elif name in self.WRITE_METHODS:
+            func = partial(self._call_write, name)
+        else:
+            raise AttributeError(name)
+        # cache the bound coroutine function so later lookups skip __getattr__
+        setattr(self, name, func)
+        return func
+
+    async def close(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._readers is not None:
+            self._readers.shutdown(wait=True)
+            for reader in self._reader_dbs:
+                reader.close()
+        if self._db is not None:
+            await self._run(self._writer, self._db.close)
+            self._db = None
+        self._writer.shutdown(wait=True)
@@ -0,0 +1,115 @@
+"""
+Concurrent update processing with per-user ordering.
+
+PerUserUpdateProcessor plugs into ``ApplicationBuilder.concurrent_updates``.
+Updates of different users run concurrently on a bounded number of workers,
+while updates of the same user (or chat, for updates without a user) are
+processed strictly one after another in arrival order, so ``user_data``
+bookkeeping such as ``current_index`` never races with itself.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Any, Dict, Hashable, List, Tuple
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    ``max_pending`` bounds the updates accepted but not yet finished (the base
+    class semaphore); ``workers`` bounds how many of them run at the same time.
+    """
+
+    def __init__(self, workers: int = 32, max_pending: int = 1024):
+        super().__init__(max_pending)
+        self.workers = workers
+        self._worker_slots = asyncio.Semaphore(workers)
+        # key -> future of the last update queued for that key
+        self._tails: Dict[Hashable, asyncio.Future] = {}
+        # key -> arrival times of its updates that have not started yet
+        self._waiting: Dict[Hashable, deque] = {}
+        self._lags: deque = deque(maxlen=2048)
+        self.pending = 0
+        self.active = 0
+        self.processed = 0
+
+    @staticmethod
+    def key_for(update: object) -> Hashable:
+        if isinstance(update, Update):
+            if update.effective_user:
+                return ('user', update.effective_user.id)
+            if update.effective_chat:
+                return ('chat', update.effective_chat.id)
+        # nothing to order against
+        return object()
+
+    @property
+    def saturated(self) -> bool:
+        """True once ``max_pending`` updates are in flight; callers should push back."""
+        return self.pending >= self.max_concurrent_updates
+
+    async def do_process_update(self, update: object, coroutine: "Awaitable[Any]") -> None:
+        key = self.key_for(update)
+        arrived = time.monotonic()
+        previous = self._tails.get(key)
+        done = asyncio.get_running_loop().create_future()
+        self._tails[key] = done
+        self._waiting.setdefault(key, deque()).append(arrived)
+        self.pending += 1
+        started = False
+        try:
+            if previous is not None:
+                await previous
+            async with self._worker_slots:
+                self._start(key, arrived)
+                started = True
+                self.active += 1
+                try:
+                    await coroutine
+                finally:
+                    self.active -= 1
+                    self.processed += 1
+        finally:
+            if not started:
+                self._start(key, arrived)
+                coroutine.close()
+            done.set_result(None)
+            if self._tails.get(key) is done:
+                del self._tails[key]
+            self.pending -= 1
+
+    def _start(self, key: Hashable, arrived: float) -> None:
+        waiting = self._waiting[key]
+        waiting.popleft()
+        if not waiting:
+            del self._waiting[key]
+        self._lags.append(time.monotonic() - arrived)
+
+    def lag_by_user(self, limit: int = 10) -> List[Tuple[Hashable, float]]:
+        """Keys whose oldest waiting update has waited longest, with that wait in seconds."""
+        now = time.monotonic()
+        lags = [(key, now - waiting[0]) for key, waiting in self._waiting.items()]
+        lags.sort(key=lambda item: item[1], reverse=True)
+        return lags[:limit]
+
+    def stats(self) -> Dict[str, float]:
+        lags = sorted(self._lags)
+        waiting = self.lag_by_user(1)
+        return {
+            'queue_depth': self.pending - self.active,
+            'active': self.active,
+            'processed': self.processed,
+            'waiting_users': len(self._waiting),
+            'lag_p50': lags[len(lags) // 2] if lags else 0.0,
+            'lag_p99': lags[int(len(lags) * 0.99)] if lags else 0.0,
+            'max_waiting_lag': waiting[0][1] if waiting else 0.0,
+        }
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,162 @@
+"""
+Parser of exercise lines, shared by the add and edit flows and the imports.
+
+    name reps sets weight [gif]
+    name SETSxREPS [weight] [gif]
+
+for example ``پرس سینه 12 3 60``, ``پرس سینه ۱۲ ۳ ۶۲٫۵`` or ``اسکوات 4x10 80kg``.
+Persian and Arabic-Indic digits read as ASCII digits, a decimal comma or the
+Arabic decimal separator as a point, ``x``, ``×`` or ``*`` separate sets from
+reps, and the weight may be followed by ``kg`` or ``کیلو``. The gif is a
+trailing URL or ``.gif`` token.
+
+A line is matched by one precompiled expression, digits of any script
+included. Only a line that does not match is split into tokens again, to
+report which token could not be read and where
+(``ExerciseParseError.column``). ``parse_lines`` parses a multi-line message
+and returns a result or an error for every non-blank line.
+"""
+
+import re
+from typing import Iterable, List, NamedTuple, Optional, Union
+
+FORMAT_ERROR = "فرمت صحیح نیست"
+VALUE_ERROR = "خطا در خواندن مقادیر"
+
+MAX_REPS = 1000
+MAX_SETS = 100
+MAX_WEIGHT = 1000.0
+# longer lines are rejected before matching
+MAX_LINE_LENGTH = 300
+
+# ``\d`` matches Persian and Arabic-Indic digits as well, and int() and
+# float() read them; only the decimal separator needs replacing
+_DECIMAL = str.maketrans({',': '.', '٫': '.'})
+_NUMBER = r'\d+(?:[.,٫]\d+)?'
+_UNIT = r'(?:\s*(?:kg|کیلو(?:گرم)?))?'
+_GIF = r'http\S*|\S*\.gif'
+_LINE = re.compile(rf"""
+    \s*(?P<name>\S.*?)\s+
+    (?:
+        (?P<xsets>\d+)\s*[x×*]\s*(?P<xreps>\d+)(?:\s+(?P<xweight>{_NUMBER}){_UNIT})?
+      | (?P<reps>\d+)\s+(?P<sets>\d+)\s+(?P<weight>{_NUMBER}){_UNIT}
+    )
+    (?:\s+(?P<gif>{_GIF}))?
+    \s*""", re.VERBOSE | re.IGNORECASE)
+_TOKEN = re.compile(r'\S+')
+_GIF_TOKEN = re.compile(_GIF, re.IGNORECASE)
+_INT_TOKEN = re.compile(r'\d+')
+_WEIGHT_TOKEN = re.compile(_NUMBER + r'(?:kg|کیلو(?:گرم)?)?', re.IGNORECASE)
+_NUMBER_CELL = re.compile(_NUMBER)
+
+
+class ParsedExercise(NamedTuple):
+    name: str
+    reps: int
+    sets: int
+    weight: float
+    gif: Optional[str]
+
+
+class ExerciseParseError(ValueError):
+    """A line that is not an exercise; ``column`` (0-based) and ``token`` point at the problem."""
+
+    def __init__(self, message: str, column: int = 0, token: str = '', lineno: Optional[int] = None):
+        super().__init__(message)
+        self.message = message
+        self.column = column
+        self.token = token
+        self.lineno = lineno
+
+
+class LineResult(NamedTuple):
+    lineno: int
+    exercise: Optional[ParsedExercise]
+    error: Optional[ExerciseParseError]
+
+
+def _number(text: str) -> float:
+    return float(text.translate(_DECIMAL))
+
+
+def _cell(value) -> float:
+    # float() alone would also take "nan", "1e3" or "1_0"
+    text = str(value).strip()
+    if not _NUMBER_CELL.fullmatch(text):
+        raise ExerciseParseError(VALUE_ERROR)
+    return _number(text)
+
+
+def _value_error(line: str, start: int, end: int, reason: str = '') -> ExerciseParseError:
+    token = line[start:end]
+    return ExerciseParseError(f"{VALUE_ERROR}: «{token}»{reason}", column=start, token=token)
+
+
+def _diagnose(line: str) -> ExerciseParseError:
+    # the slow path: which of the last tokens is not a number
+    tokens = [m.span() for m in _TOKEN.finditer(line)]
+    if tokens and _GIF_TOKEN.fullmatch(line, *tokens[-1]):
+        tokens.pop()
+    if len(tokens) < 3:
+        return ExerciseParseError(FORMAT_ERROR, column=len(line.rstrip()))
+    checks = zip(tokens[-3:], (_INT_TOKEN, _INT_TOKEN, _WEIGHT_TOKEN))
+    for (start, end), pattern in reversed(list(checks)):
+        if not pattern.fullmatch(line, start, end):
+            return _value_error(line, start, end)
+    return ExerciseParseError(f"{VALUE_ERROR}: نام حرکت نوشته نشده", column=tokens[0][0])
+
+
+def parse_line(line: str) -> ParsedExercise:
+    """Parse one exercise line; raises ExerciseParseError with a user-facing message."""
+    if len(line) > MAX_LINE_LENGTH:
+        raise ExerciseParseError(FORMAT_ERROR, column=MAX_LINE_LENGTH)
+    match = _LINE.fullmatch(line)
+    if match is None:
+        raise _diagnose(line)
+    name, xsets, xreps, xweight, reps, sets, weight, gif = match.groups()
+    if xsets is not None:
+        reps, sets, weight = xreps, xsets, xweight
+        fields = ('xreps', 'xsets', 'xweight')
+    else:
+        fields = ('reps', 'sets', 'weight')
+    reps, sets = int(reps), int(sets)
+    weight = _number(weight) if weight is not None else 0.0
+    if not 1 <= reps <= MAX_REPS:
+        raise _value_error(line, *match.span(fields[0]), f" باید بین 1 و {MAX_REPS} باشد")
+    if not 1 <= sets <= MAX_SETS:
+        raise _value_error(line, *match.span(fields[1]), f" باید بین 1 و {MAX_SETS} باشد")
+    if weight > MAX_WEIGHT:
+        raise _value_error(line, *match.span(fields[2]), f" باید حداکثر {MAX_WEIGHT:g} باشد")
+    return ParsedExercise(' '.join(name.split()), reps, sets, weight, gif)
+
+
+def parse_lines(lines: Union[str, Iterable[str]], first_lineno: int = 1) -> List[LineResult]:
+    """Parse every non-blank line of a message (or of ``lines``); errors carry their line number."""
+    if isinstance(lines, str):
+        lines = lines.splitlines()
+    results = []
+    for lineno, line in enumerate(lines, first_lineno):
+        if not line.strip():
+            continue
+        try:
+            results.append(LineResult(lineno, parse_line(line), None))
+        except ExerciseParseError as exc:
+            exc.lineno = lineno
+            results.append(LineResult(lineno, None, exc))
+    return results
+
+
+def read_count(value, high: int) -> int:
+    """A reps or sets cell of an import document."""
+    number = _cell(value)
+    if number != int(number) or not 1 <= number <= high:
+        raise ExerciseParseError(VALUE_ERROR)
+    return int(number)
+
+
+def read_weight(value) -> float:
+    """A weight cell of an import document; empty is no weight."""
+    weight = _cell(value) if str(value or '').strip() else 0.0
+    if not 0 <= weight <= MAX_WEIGHT:
+        raise ExerciseParseError(VALUE_ERROR)
+    return weight
@@ -1,83 +1,164 @@
-import asyncio
+import io
+import logging
+from tempfile import SpooledTemporaryFile
 from typing import Optional
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import (
+    Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, InputTextMessageContent
+)
 from telegram.ext import ContextTypes, ConversationHandler
 
-from database import Database
-from ui import MAIN_MENU_INLINE, days_keyboard, dynamic_main_menu
-
-db = Database()
+from callbacks import decode, encode, InvalidCallbackData
+from catalog import ExerciseCatalog
+from exercise_parser import parse_line, parse_lines
+from media import MediaCache
+from outbound import PRIORITY_HIGH, priority_kwargs
+from program_io import (
+    IMPORT_MAX_BYTES, export_csv, parse_csv, parse_json, parse_text_lines
+)
+from reminders import ReminderScheduler, format_minute
+from render import ProgramRenderer, render_move_keyboard, render_suggestions
+from sessions import SessionStore, VersionCollector
+from stats import format_stats, log_exercise
+from storage import open_database
+from ui import (
+    CATALOG_SEARCH_KEYBOARD, DAYS_PERSIAN, MAIN_MENU_INLINE, SETTINGS_KEYBOARD, days_keyboard, dynamic_main_menu
+)
+from timers import rest_timers
+
+logger = logging.getLogger(__name__)
+
+db = open_database()
+sessions = SessionStore(db)
+media = MediaCache(db)
+reminders = ReminderScheduler(db)
+renderer = ProgramRenderer(db)
+versions = VersionCollector(db)
+catalog = ExerciseCatalog(db)
+
+
+def use_database(database) -> None:
+    """Point the handlers and the helpers built on ``db`` at another database (offline harnesses)."""
+    global db, sessions, media, reminders, renderer, versions, catalog
+    db = database
+    sessions = SessionStore(db)
+    media = MediaCache(db)
+    reminders = ReminderScheduler(db)
+    renderer = ProgramRenderer(db)
+    versions = VersionCollector(db)
+    catalog = ExerciseCatalog(db)
+
+# times offered in the reminder settings (minutes after local midnight)
+REMINDER_CHOICES = [6 * 60, 8 * 60, 12 * 60, 17 * 60, 19 * 60, 21 * 60]
+_reminder_times = [InlineKeyboardButton(format_minute(m), callback_data=encode('set_remind', m)) for m in REMINDER_CHOICES]
+REMINDER_KEYBOARD = InlineKeyboardMarkup([
+    _reminder_times[:3], _reminder_times[3:],
+    [InlineKeyboardButton("🔕 خاموش", callback_data=encode('remind_off'))],
+    [InlineKeyboardButton("بازگشت", callback_data=encode('menu_settings'))]
+])
+
+# catalog names offered per inline query
+INLINE_SEARCH_RESULTS = 20
 
 SELECTING_DAY = 0
 ADDING_EXERCISES = 1
 
 # utility to format program summary
-def format_program_summary(program_id: int) -> str:
-    exercises = db.get_exercises(program_id)
-    if not exercises:
-        return "این برنامه هنوز حرکتی ندارد."
-    lines = []
-    for i, ex in enumerate(exercises, 1):
-        weight = f"{ex.get('weight',0)} کیلوگرم" if ex.get('weight',0) and ex.get('weight',0) > 0 else "بدون وزنه"
-        lines.append(f"{i}. {ex['name']} — {ex.get('reps','?')} تکرار × {ex.get('sets','?')} ست — {weight}")
-    return "\n".join(lines)
+async def format_program_summary(program_id: int) -> str:
+    return await renderer.summary(program_id)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = update.effective_user
-    db.add_user(user.id, user.username)
+    await db.add_user(user.id, user.username)
+    resume = await sessions.get(user.id) is not None
     welcome_message = (
         "سلام! 👋\n\n"
         "این ربات برنامه‌های تمرینی تو رو مدیریت میکنه — ساخت، ویرایش و اجرای تمرینات با رابط کاربری ساده.\n"
         "برای شروع از دکمه‌ها استفاده کن یا /help را بزن."
     )
     if getattr(update, "message", None):
-        await update.message.reply_text(welcome_message, reply_markup=dynamic_main_menu(context))
+        await update.message.reply_text(welcome_message, reply_markup=dynamic_main_menu(context, resume))
     else:
         cb = getattr(update, "callback_query", None)
         if cb:
-            await cb.edit_message_text(welcome_message, reply_markup=dynamic_main_menu(context))
+            await cb.edit_message_text(welcome_message, reply_markup=dynamic_main_menu(context, resume))
+
+# main menu buttons, dispatched by the callback router in bot.py
+async def menu_my(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await update.callback_query.answer()
+    await my_programs(update, context)
 
-async def menu_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def menu_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await update.callback_query.answer()
+    await start_workout(update, context)
+
+async def menu_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await update.callback_query.answer()
+    await help_command(update, context)
+
+async def menu_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
-    data = query.data
-
-    if data == "menu_my":
-        await my_programs(update, context)
-    elif data == "menu_start":
-        await start_workout(update, context)
-    elif data == "menu_help":
-        await help_command(update, context)
-    elif data == "menu_settings":
-        user_id = query.from_user.id
-        cur_rest = db.get_rest_seconds(user_id)
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("⏱ 30s", callback_data="set_rest_30"),
-             InlineKeyboardButton("⏱ 60s", callback_data="set_rest_60"),
-             InlineKeyboardButton("⏱ 90s", callback_data="set_rest_90")],
-            [InlineKeyboardButton("بازگشت", callback_data="menu_back")]
-        ])
-        await query.edit_message_text(f"تنظیمات — زمان استراحت فعلی: {cur_rest} ثانیه\nیکی را انتخاب کنید:", reply_markup=keyboard)
-    elif data == "menu_back":
-        # پاک کردن حالت‌های موقتی تا منوی داینامیک به حالت عادی برگردد
-        for k in ('current_program_id', 'exercise_count', 'editing_exercise_id', 'current_day'):
-            context.user_data.pop(k, None)
-        await query.edit_message_text("بازگشت به منوی اصلی.", reply_markup=dynamic_main_menu(context))
-    else:
-        # دیگر منوهای menu_ که از قبل توسط handlers جدا هندل می‌شوند یا ورودی Conversation خواهند بود.
-        await query.answer()
+    text = await format_stats(db, query.from_user.id)
+    await query.edit_message_text(text, reply_markup=dynamic_main_menu(context))
+
+async def menu_settings(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    cur_rest = await db.get_rest_seconds(query.from_user.id)
+    await query.edit_message_text(f"تنظیمات — زمان استراحت فعلی: {cur_rest} ثانیه\nیکی را انتخاب کنید:", reply_markup=SETTINGS_KEYBOARD)
+
+async def menu_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    reminder = await db.get_reminder(query.from_user.id)
+    current = format_minute(reminder['minute_of_day']) if reminder else "خاموش"
+    await query.edit_message_text(
+        f"یادآوری روزانه — فعلی: {current}\nدر روزهایی که برنامه داری، این ساعت یادآوری می‌فرستم:",
+        reply_markup=REMINDER_KEYBOARD)
+
+async def menu_back(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    # پاک کردن حالت‌های موقتی تا منوی داینامیک به حالت عادی برگردد
+    for k in ('current_program_id', 'exercise_count', 'editing_exercise_id', 'current_day'):
+        context.user_data.pop(k, None)
+    resume = await sessions.get(query.from_user.id) is not None
+    await query.edit_message_text("بازگشت به منوی اصلی.", reply_markup=dynamic_main_menu(context, resume))
+
+async def invalid_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Buttons of old messages, and payloads that were tampered with."""
+    query = update.callback_query
+    await query.answer("این دکمه دیگر معتبر نیست.")
+    resume = await sessions.get(query.from_user.id) is not None
+    await query.edit_message_text("این دکمه قدیمی است — از منوی اصلی ادامه بده.",
+                                  reply_markup=dynamic_main_menu(context, resume))
 
 async def set_rest_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
-    try:
-        seconds = int(query.data.split('_')[-1])
-    except Exception:
-        seconds = 60
+    seconds = context.args[0]
     user_id = query.from_user.id
-    db.set_rest_seconds(user_id, seconds)
+    await db.set_rest_seconds(user_id, seconds)
     await query.edit_message_text(f"✅ زمان استراحت به {seconds} ثانیه تغییر کرد.", reply_markup=dynamic_main_menu(context))
 
+async def set_reminder_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    user_id = query.from_user.id
+    # set_remind carries the minute, remind_off nothing
+    if not context.args:
+        await reminders.clear(user_id)
+        text = "🔕 یادآوری خاموش شد."
+    else:
+        minute = context.args[0]
+        await reminders.set(user_id, query.message.chat_id, minute)
+        text = f"⏰ یادآوری روزانه برای ساعت {format_minute(minute)} تنظیم شد."
+    await query.edit_message_text(text, reply_markup=dynamic_main_menu(context))
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    text = await format_stats(db, update.effective_user.id)
+    await update.message.reply_text(text, reply_markup=dynamic_main_menu(context))
+
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     help_text = (
         "راهنما و نکات استفاده — خلاصه و سریع:\n\n"
@@ -85,6 +166,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "  فرمت ورود حرکت: نام حرکت تکرار تعداد_ست وزن(اختیاری) [مثال: پرس سینه 12 3 60]\n"
         "  یا گیف را ارسال کن با کپشنِ فرمت بالا.\n\n"
         "• ویرایش برنامه: وقتی برای روز برنامه‌ای داری، گزینه «ویرایش» ظاهر می‌شود — می‌توانی حرکت را ویرایش، حذف یا حرکت جدید اضافه کنی.\n\n"
+        "• آمار: /stats حجم هفتگی، رکوردها و هفته‌های پیاپی تمرین را نشان می‌دهد.\n\n"
+        "• ورود و خروج گروهی: /import شنبه و در خطوط بعد حرکات را بنویس، یا فایل CSV/JSON بفرست؛ /export همه برنامه‌ها را به صورت CSV می‌دهد.\n\n"
         "• حین تمرین: هر حرکت نمایش داده می‌شود (گیف اگر وجود داشته باشد)؛ دکمه «✅ انجام شد» برای رفتن به حرکت بعدی و زمان استراحت خودت اعمال می‌شود.\n\n"
         "دنبال قابلیت جدیدی هستی؟ بگو تا اضافه کنم — اشتراک‌گذاری ساده‌ترین راه برای حمایت از پروژه است 🙏"
     )
@@ -108,126 +191,139 @@ async def new_program(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
 async def day_selected(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
-    day_name = query.data
     user_id = query.from_user.id
+    try:
+        day_name = DAYS_PERSIAN[decode(query.data, user_id).args[0]]
+    except (InvalidCallbackData, IndexError):
+        await invalid_callback(update, context)
+        return ConversationHandler.END
 
-    existing = db.get_program_by_user_day(user_id, day_name)
+    existing = await db.get_program_by_user_day(user_id, day_name)
     if existing:
         # show choices: view / edit / delete / overwrite
         pid = existing['id']
         keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("📄 نمایش برنامه", callback_data=f"program_view_{pid}")],
-            [InlineKeyboardButton("✏️ ویرایش برنامه", callback_data=f"program_edit_{pid}")],
-            [InlineKeyboardButton("🗑 حذف برنامه", callback_data=f"program_delete_{pid}")],
-            [InlineKeyboardButton("🔁 بازنویسی (ایجاد جدید)", callback_data=f"program_overwrite_{pid}")],
-            [InlineKeyboardButton("بازگشت", callback_data="menu_back")]
+            [InlineKeyboardButton("📄 نمایش برنامه", callback_data=encode('program_view', pid, user_id=user_id))],
+            [InlineKeyboardButton("✏️ ویرایش برنامه", callback_data=encode('program_edit', pid, user_id=user_id))],
+            [InlineKeyboardButton("🗑 حذف برنامه", callback_data=encode('program_delete', pid, user_id=user_id))],
+            [InlineKeyboardButton("🔁 بازنویسی (ایجاد جدید)",
+                                  callback_data=encode('program_overwrite', pid, user_id=user_id))],
+            [InlineKeyboardButton("بازگشت", callback_data=encode('menu_back'))]
         ])
         await query.edit_message_text(f"برای روز {day_name} قبلاً برنامه‌ای ثبت شده — چه کاری می‌خواهی انجام بدی؟", reply_markup=keyboard)
         return ConversationHandler.END
     else:
-        program_id = db.create_workout_program(user_id, day_name)
-        db.delete_exercises(program_id)
+        program_id = await db.create_workout_program(user_id, day_name)
         context.user_data['current_program_id'] = program_id
         context.user_data['current_day'] = day_name
         context.user_data['exercise_count'] = 0
         await query.edit_message_text(
             f"برنامه جدید برای روز {day_name} ایجاد شد ✅\n\n"
             "حالا شروع کن به افزودن حرکت‌ها.\n"
-            "فرمت: نام حرکت تکرار تعداد_ست وزن(اختیاری)\nمثال: پرس سینه 12 3 60"
+            "فرمت: نام حرکت تکرار تعداد_ست وزن(اختیاری)\nمثال: پرس سینه 12 3 60",
+            reply_markup=CATALOG_SEARCH_KEYBOARD
         )
         return ADDING_EXERCISES
 
-# program_action router
-async def program_action(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+# program buttons; the router has checked that the program id was signed for this user
+async def program_view(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
-    data = query.data  # e.g., program_view_5
-    parts = data.split('_', 2)
-    if len(parts) < 3:
-        await query.edit_message_text("خطا: عملیات نامعتبر.", reply_markup=dynamic_main_menu(context))
-        return
+    pid = context.args[0]
+    summary = await format_program_summary(pid)
+    keyboard = await renderer.view_keyboard(pid, query.from_user.id)
+    await query.edit_message_text(f"📋 خلاصه برنامه:\n\n{summary}", reply_markup=keyboard)
 
-    action = parts[1]
-    pid = int(parts[2])
+async def program_edit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    await show_edit_screen(query, context.args[0])
 
-    if action == "view":
-        summary = format_program_summary(pid)
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("✏️ ویرایش", callback_data=f"program_edit_{pid}")],
-            [InlineKeyboardButton("🔁 بازنویسی", callback_data=f"program_overwrite_{pid}")],
-            [InlineKeyboardButton("بازگشت", callback_data="menu_back")]
-        ])
-        await query.edit_message_text(f"📋 خلاصه برنامه:\n\n{summary}", reply_markup=keyboard)
-    elif action == "edit":
-        # show exercises with edit/delete buttons and add-new
-        exercises = db.get_exercises(pid)
-        keyboard = []
-        for ex in exercises:
-            keyboard.append([InlineKeyboardButton(f"✏️ ویرایش: {ex['name']}", callback_data=f"ex_edit_{ex['id']}")])
-            keyboard.append([InlineKeyboardButton(f"🗑 حذف: {ex['name']}", callback_data=f"ex_delete_{ex['id']}")])
-        keyboard.append([InlineKeyboardButton("➕ اضافه کردن حرکت جدید", callback_data=f"ex_add_{pid}")])
-        keyboard.append([InlineKeyboardButton("بازگشت", callback_data="menu_back")])
-        await query.edit_message_text(f"ویرایش برنامه — انتخاب کنید:", reply_markup=InlineKeyboardMarkup(keyboard))
-    elif action == "delete":
-        # delete program and its exercises
-        db.delete_exercises(pid)
-        cur = db.conn.cursor()
-        cur.execute("DELETE FROM programs WHERE id = ?", (pid,))
-        db.conn.commit()
-        await query.edit_message_text("✅ برنامه حذف شد.", reply_markup=dynamic_main_menu(context))
-    elif action == "overwrite":
-        # overwrite: delete exercises then create new program entry
-        db.delete_exercises(pid)
-        # create new program row reusing day name
-        cur = db.conn.cursor()
-        cur.execute("SELECT day_name, user_id FROM programs WHERE id = ?", (pid,))
-        row = cur.fetchone()
-        if row:
-            day_name = row['day_name']
-            user_id = row['user_id']
-            # create new program record
-            new_pid = db.create_workout_program(user_id, day_name)
-            db.delete_exercises(new_pid)
-            context.user_data['current_program_id'] = new_pid
-            context.user_data['current_day'] = day_name
-            context.user_data['exercise_count'] = 0
-            await query.edit_message_text(f"برنامه جدید برای {day_name} آماده شد — اکنون حرکات را اضافه کنید.", reply_markup=None)
-            return ADDING_EXERCISES
-        else:
-            await query.edit_message_text("خطا — برنامه پیدا نشد.", reply_markup=dynamic_main_menu(context))
-    else:
-        await query.edit_message_text("عملیات نامشخص.", reply_markup=dynamic_main_menu(context))
+async def show_edit_screen(query, program_id: int) -> None:
+    # exercises with edit/move/delete buttons and add-new
+    keyboard = await renderer.edit_keyboard(program_id, query.from_user.id)
+    await query.edit_message_text(f"ویرایش برنامه — انتخاب کنید:", reply_markup=keyboard)
 
-# exercise callbacks router
-async def exercise_action(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def program_delete(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
-    data = query.data  # ex_edit_{id} / ex_delete_{id} / ex_add_{program_id}
-    if data.startswith("ex_edit_"):
-        ex_id = int(data.split('_')[-1])
-        # prompt user to send updated exercise line
-        context.user_data['editing_exercise_id'] = ex_id
-        await query.edit_message_text(
-            "✏️ ویرایش حرکت: لطفا مشخصات جدید حرکت را به همین فرمت ارسال کن:\n"
-            "نام حرکت تکرار تعداد_ست وزن(اختیاری)\nمثال: پرس سینه 10 3 60\nیا گیف با کپشن بفرست."
-        )
-        return ADDING_EXERCISES
-    elif data.startswith("ex_delete_"):
-        ex_id = int(data.split('_')[-1])
-        deleted = db.delete_exercise_by_id(ex_id)
-        if deleted:
-            await query.edit_message_text("✅ حرکت حذف شد.", reply_markup=dynamic_main_menu(context))
-        else:
-            await query.edit_message_text("خطا: حرکت پیدا نشد.", reply_markup=dynamic_main_menu(context))
-    elif data.startswith("ex_add_"):
-        pid = int(data.split('_')[-1])
+    # delete program and its exercises
+    await db.delete_program(context.args[0])
+    await query.edit_message_text("✅ برنامه حذف شد.", reply_markup=dynamic_main_menu(context))
+
+async def program_overwrite(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Optional[int]:
+    query = update.callback_query
+    await query.answer()
+    pid = context.args[0]
+    row = await db.get_program(pid)
+    if row:
+        day_name = row['day_name']
+        # overwrite: a new, empty version of the same program; a workout running on it keeps its version
+        await db.delete_exercises(pid)
         context.user_data['current_program_id'] = pid
-        context.user_data['current_day'] = None
-        context.user_data['exercise_count'] = len(db.get_exercises(pid))
-        await query.edit_message_text("➕ لطفا حرکت جدید را ارسال کنید (فرمت: نام حرکت تکرار تعداد_ست وزن(اختیاری)).")
+        context.user_data['current_day'] = day_name
+        context.user_data['exercise_count'] = 0
+        await query.edit_message_text(f"برنامه جدید برای {day_name} آماده شد — اکنون حرکات را اضافه کنید.",
+                                      reply_markup=CATALOG_SEARCH_KEYBOARD)
         return ADDING_EXERCISES
+    await query.edit_message_text("خطا — برنامه پیدا نشد.", reply_markup=dynamic_main_menu(context))
+
+# exercise buttons
+async def exercise_edit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await query.answer()
+    # prompt user to send updated exercise line
+    context.user_data['editing_exercise_id'] = context.args[0]
+    await query.edit_message_text(
+        "✏️ ویرایش حرکت: لطفا مشخصات جدید حرکت را به همین فرمت ارسال کن:\n"
+        "نام حرکت تکرار تعداد_ست وزن(اختیاری)\nمثال: پرس سینه 10 3 60\nیا گیف با کپشن بفرست.",
+        reply_markup=CATALOG_SEARCH_KEYBOARD
+    )
+    return ADDING_EXERCISES
+
+async def exercise_delete(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    deleted = await db.delete_exercise_by_id(context.args[0])
+    if deleted:
+        await query.edit_message_text("✅ حرکت حذف شد.", reply_markup=dynamic_main_menu(context))
     else:
-        await query.edit_message_text("عملیات نامعتبر.", reply_markup=dynamic_main_menu(context))
+        await query.edit_message_text("خطا: حرکت پیدا نشد.", reply_markup=dynamic_main_menu(context))
+
+async def exercise_move(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    exercise_id = context.args[0]
+    program_id = await db.get_exercise_program_id(exercise_id)
+    exercises = await db.get_exercises(program_id) if program_id else []
+    current = next((ex for ex in exercises if ex['id'] == exercise_id), None)
+    if current is None:
+        await query.edit_message_text("خطا: حرکت پیدا نشد.", reply_markup=dynamic_main_menu(context))
+        return
+    await query.edit_message_text(f"«{current['name']}» به کدام جایگاه برود؟",
+                                  reply_markup=render_move_keyboard(program_id, exercise_id, len(exercises),
+                                                                    query.from_user.id))
+
+async def exercise_place(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    exercise_id, index = context.args
+    program_id = await db.move_exercise(exercise_id, index)
+    if program_id is None:
+        await query.edit_message_text("خطا: حرکت پیدا نشد.", reply_markup=dynamic_main_menu(context))
+        return
+    await show_edit_screen(query, program_id)
+
+async def exercise_add(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await query.answer()
+    pid = context.args[0]
+    context.user_data['current_program_id'] = pid
+    context.user_data['current_day'] = None
+    context.user_data['exercise_count'] = len(await db.get_exercises(pid))
+    await query.edit_message_text("➕ لطفا حرکت جدید را ارسال کنید (فرمت: نام حرکت تکرار تعداد_ست وزن(اختیاری)).",
+                                  reply_markup=CATALOG_SEARCH_KEYBOARD)
+    return ADDING_EXERCISES
 
 # modify add_exercise to support edit flow
 async def add_exercise(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -253,6 +349,7 @@ async def add_exercise(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
                 await cb.edit_message_text(f"برنامه {day_name or ''} با {exercise_count} حرکت ذخیره شد! ✅", reply_markup=dynamic_main_menu(context))
         context.user_data.pop('editing_exercise_id', None)
         context.user_data.pop('current_program_id', None)
+        context.user_data.pop('pending_exercise_name', None)
         return ConversationHandler.END
 
     # undo
@@ -261,7 +358,7 @@ async def add_exercise(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
         if not program_id:
             await update.message.reply_text("هیچ برنامه‌ای در حال ساخت وجود ندارد.")
             return ADDING_EXERCISES
-        removed = db.delete_last_exercise(program_id)
+        removed = await db.delete_last_exercise(program_id)
         if removed:
             context.user_data['exercise_count'] = max(0, context.user_data.get('exercise_count', 1) - 1)
             await update.message.reply_text("آخرین حرکت حذف شد. میتوانید حرکت جدید اضافه کنید یا 'تمام' بنویسید.")
@@ -269,36 +366,39 @@ async def add_exercise(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
             await update.message.reply_text("هیچ حرکتی وجود ندارد که حذف شود.")
         return ADDING_EXERCISES
 
-    tokens = text.split()
-    if len(tokens) < 3:
-        await update.message.reply_text("❌ فرمت صحیح نیست! مثال: پرس سینه 12 3 60")
-        return ADDING_EXERCISES
-
-    gif_url = None
-    if tokens[-1].startswith('http') or tokens[-1].endswith('.gif'):
-        gif_url = tokens[-1]; tokens = tokens[:-1]
-
+    pending_name = context.user_data.pop('pending_exercise_name', None)
+    if '\n' in text and not gif_file and not context.user_data.get('editing_exercise_id'):
+        return await add_exercise_lines(update, context, text)
+    if pending_name and text[:1].isdigit():
+        # the numbers for a name picked in the inline search
+        text = f"{pending_name} {text}"
     try:
-        weight = float(tokens[-1])
-        sets = int(tokens[-2])
-        reps = int(tokens[-3])
-        name_tokens = tokens[:-3]
-        if not name_tokens:
-            raise ValueError()
-        exercise_name = ' '.join(name_tokens)
-    except Exception:
-        await update.message.reply_text("❌ خطا در خواندن مقادیر! مثال: پرس سینه 12 3 60")
+        exercise_name, reps, sets, weight, gif_url = parse_line(text)
+    except ValueError as exc:
+        entry = await catalog.lookup(text)
+        if entry:
+            # just a name, e.g. sent by picking an inline search result
+            context.user_data['pending_exercise_name'] = entry[1]
+            await update.message.reply_text(f"«{entry[1]}» — حالا تکرار، تعداد ست و وزن را بفرست.\nمثال: 12 3 60")
+            return ADDING_EXERCISES
+        await update.message.reply_text(f"❌ {exc}! مثال: پرس سینه 12 3 60 یا پرس سینه 3x12 60")
         return ADDING_EXERCISES
 
     gif_to_store = gif_file if gif_file else gif_url
     editing_ex_id = context.user_data.get('editing_exercise_id')
     program_id = context.user_data.get('current_program_id')
+    user_id = update.effective_user.id
+    # looked up before the write adds the name to the catalog
+    suggestions = await catalog.suggest(exercise_name)
 
     if editing_ex_id:
-        ok = db.update_exercise(editing_ex_id, exercise_name, reps, sets, weight, gif_to_store)
+        ok = await db.update_exercise(editing_ex_id, exercise_name, reps, sets, weight, gif_to_store)
         context.user_data.pop('editing_exercise_id', None)
         if ok:
-            await update.message.reply_text(f"✅ حرکت به‌روز شد: {exercise_name}", reply_markup=dynamic_main_menu(context))
+            catalog.note_added()
+            await update.message.reply_text(
+                f"✅ حرکت به‌روز شد: {exercise_name}",
+                reply_markup=render_suggestions(editing_ex_id, suggestions, user_id, dynamic_main_menu(context)))
         else:
             await update.message.reply_text("خطا: نتوانستم حرکت را بروزرسانی کنم.", reply_markup=dynamic_main_menu(context))
         return ADDING_EXERCISES
@@ -307,14 +407,70 @@ async def add_exercise(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
         await update.message.reply_text("خطا: شناسه برنامه مشخص نیست. اول یک برنامه بساز.", reply_markup=dynamic_main_menu(context))
         return ADDING_EXERCISES
 
-    position = context.user_data.get('exercise_count', 0)
-    db.add_exercise(program_id, exercise_name, reps, sets, weight, gif_to_store, position)
-    context.user_data['exercise_count'] = position + 1
+    # appended after the program's last exercise
+    exercise_id = await db.add_exercise(program_id, exercise_name, reps, sets, weight, gif_to_store)
+    context.user_data['exercise_count'] = context.user_data.get('exercise_count', 0) + 1
+    catalog.note_added()
 
-    await update.message.reply_text(f"✅ حرکت اضافه شد: {exercise_name}\nتکرار: {reps} - ست: {sets} - وزن: {weight if weight>0 else 'بدون وزنه'}", reply_markup=dynamic_main_menu(context))
+    await update.message.reply_text(
+        f"✅ حرکت اضافه شد: {exercise_name}\nتکرار: {reps} - ست: {sets} - وزن: {weight if weight>0 else 'بدون وزنه'}",
+        reply_markup=render_suggestions(exercise_id, suggestions, user_id, dynamic_main_menu(context)))
+    return ADDING_EXERCISES
+
+async def add_exercise_lines(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> int:
+    """Several exercises in one message: every line that parses is added, the others are listed."""
+    program_id = context.user_data.get('current_program_id')
+    if not program_id:
+        await update.message.reply_text("خطا: شناسه برنامه مشخص نیست. اول یک برنامه بساز.", reply_markup=dynamic_main_menu(context))
+        return ADDING_EXERCISES
+    results = parse_lines(text)
+    added = [r.exercise for r in results if r.exercise]
+    errors = [r for r in results if r.error]
+    markup = dynamic_main_menu(context)
+    lines = []
+    if added:
+        # looked up before the write adds the names to the catalog; one pick per line keeps the keyboard short
+        suggestions = [await catalog.suggest(exercise.name, limit=1) for exercise in added]
+        # the whole message is one program version
+        ids = await db.add_exercises(program_id, added)
+        context.user_data['exercise_count'] = context.user_data.get('exercise_count', 0) + len(added)
+        catalog.note_added()
+        lines.append(f"✅ {len(added)} حرکت اضافه شد: " + "، ".join(ex.name for ex in added))
+        user_id = update.effective_user.id
+        for exercise_id, suggested in reversed(list(zip(ids, suggestions))):
+            if suggested:
+                markup = render_suggestions(exercise_id, suggested, user_id, markup)
+    if errors:
+        lines += [f"❌ خط {r.lineno}، ستون {r.error.column + 1}: {r.error}" for r in errors]
+        lines.append("خطوط نادرست را اصلاح کن و دوباره بفرست. مثال: پرس سینه 12 3 60")
+    await update.message.reply_text("\n".join(lines), reply_markup=markup)
     return ADDING_EXERCISES
 
+async def exercise_rename(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """A "did you mean" button: use the catalog's name for the exercise."""
+    query = update.callback_query
+    await query.answer()
+    exercise_id, catalog_id = context.args
+    if await db.rename_exercise(exercise_id, catalog_id):
+        entry = await catalog.name_of(catalog_id)
+        await query.edit_message_text(f"✅ نام حرکت به «{entry}» تغییر کرد.", reply_markup=dynamic_main_menu(context))
+    else:
+        await query.edit_message_text("خطا: حرکت پیدا نشد.", reply_markup=dynamic_main_menu(context))
+
+async def inline_exercise_search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Inline mode: exercise names matching what the user has typed after the bot's username."""
+    inline_query = update.inline_query
+    matches = await catalog.search(inline_query.query, limit=INLINE_SEARCH_RESULTS)
+    results = [
+        InlineQueryResultArticle(id=str(catalog_id), title=name, description="بعد از انتخاب، تکرار/ست/وزن را بفرست",
+                                 input_message_content=InputTextMessageContent(name))
+        for catalog_id, name in matches
+    ]
+    await inline_query.answer(results, cache_time=60)
+
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    if update.effective_user:
+        rest_timers.cancel(update.effective_user.id)
     context.user_data.clear()
     if getattr(update, "message", None):
         await update.message.reply_text("عملیات لغو شد. ❌", reply_markup=dynamic_main_menu(context))
@@ -327,7 +483,7 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 async def my_programs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     callback = getattr(update, "callback_query", None)
     user_id = callback.from_user.id if callback else update.effective_user.id
-    programs = db.get_user_programs(user_id)
+    programs = await db.get_user_programs(user_id)
     if not programs:
         text = "شما هنوز هیچ برنامه ورزشی ندارید! برای ساخت برنامه جدید از ➕ برنامه جدید استفاده کنید."
         if callback:
@@ -340,9 +496,10 @@ async def my_programs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     keyboard = []
     for program in programs:
         message += f"🗓️ {program['day_name']}\n"
-        keyboard.append([InlineKeyboardButton(f"مشاهده / ویرایش {program['day_name']}", callback_data=f"program_view_{program['id']}")])
+        keyboard.append([InlineKeyboardButton(f"مشاهده / ویرایش {program['day_name']}",
+                                              callback_data=encode('program_view', program['id'], user_id=user_id))])
 
-    keyboard.append([InlineKeyboardButton("بازگشت", callback_data="menu_back")])
+    keyboard.append([InlineKeyboardButton("بازگشت", callback_data=encode('menu_back'))])
     if callback:
         await callback.edit_message_text(message, reply_markup=InlineKeyboardMarkup(keyboard))
     else:
@@ -352,7 +509,7 @@ async def my_programs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 async def start_workout(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     callback = getattr(update, "callback_query", None)
     user_id = callback.from_user.id if callback else update.effective_user.id
-    programs = db.get_user_programs(user_id)
+    programs = await db.get_user_programs(user_id)
 
     if not programs:
         text = "شما هنوز برنامه‌ای ندارید. برای ساخت برنامه از ➕ برنامه جدید استفاده کنید."
@@ -364,7 +521,7 @@ async def start_workout(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 
     keyboard = []
     for p in programs:
-        keyboard.append([InlineKeyboardButton(p['day_name'], callback_data=f"start_{p['id']}")])
+        keyboard.append([InlineKeyboardButton(p['day_name'], callback_data=encode('start', p['id'], user_id=user_id))])
     reply_markup = InlineKeyboardMarkup(keyboard)
     prompt = "کدام برنامه را می‌خواهید شروع کنید؟"
     if callback:
@@ -376,60 +533,36 @@ async def start_workout(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 async def workout_selected(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
-    try:
-        program_id = int(query.data.replace('start_', ''))
-    except Exception:
-        await query.edit_message_text("خطا: شناسه برنامه نامعتبر است.")
-        return
-
+    program_id = context.args[0]
     user_id = query.from_user.id
-    exercises = db.get_exercises(program_id)
+    rest_timers.cancel(user_id)
+    exercises = await db.get_exercises(program_id)
     if not exercises:
         await query.edit_message_text("این برنامه هیچ حرکتی ندارد. ابتدا حرکات را اضافه کنید.", reply_markup=MAIN_MENU_INLINE)
         return
 
-    session_id = db.create_workout_session(user_id, program_id)
-    context.user_data['session_id'] = session_id
-    context.user_data['program_id'] = program_id
-    context.user_data['exercises'] = exercises
-    context.user_data['current_index'] = 0
+    version = await db.get_program_version(program_id)
+    session = await sessions.start(user_id, program_id, exercises, version)
+    # resolve the program's GIF URLs to file_ids while the user does the first exercise
+    context.application.create_task(media.prewarm(context.bot, [ex.get('gif') for ex in exercises]))
+    await show_current_exercise(query, context, session)
 
-    await show_current_exercise(query, context)
 
-
-async def show_current_exercise(query_or_message, context: ContextTypes.DEFAULT_TYPE) -> None:
-    exercises = context.user_data.get('exercises', [])
-    idx = context.user_data.get('current_index', 0)
+async def show_current_exercise(query_or_message, context: ContextTypes.DEFAULT_TYPE, session: dict) -> None:
+    exercises = session['exercises']
+    idx = session['current_index']
 
     if idx >= len(exercises):
-        session_id = context.user_data.get('session_id')
-        if session_id:
-            db.close_session(session_id)
+        await sessions.close(session)
         done_msg = "🎉 تبریک — تمرین تمام شد! استراحت کن و روز خوبی داشته باشی 💪"
         if hasattr(query_or_message, 'edit_message_text'):
             await query_or_message.edit_message_text(done_msg, reply_markup=MAIN_MENU_INLINE)
         else:
             await query_or_message.reply_text(done_msg, reply_markup=MAIN_MENU_INLINE)
-        context.user_data.clear()
         return
 
     ex = exercises[idx]
-    weight_text = f"{ex.get('weight', 0)} کیلوگرم" if ex.get('weight') and ex.get('weight') > 0 else "بدون وزنه"
-    reps_text = f"{ex.get('reps','?')} تکرار"
-    message = (
-        f"💪 حرکت {idx+1} از {len(exercises)}\n\n"
-        f"📌 {ex['name']}\n"
-        f"🔁 {reps_text}\n"
-        f"🔢 ست: {ex.get('sets','?')}\n"
-        f"⚖️ {weight_text}\n\n"
-        "بعد از انجام حرکت، «✅ انجام شد» را بزن."
-    )
-
-    keyboard = [
-        [InlineKeyboardButton("✅ انجام شد", callback_data="exercise_done")],
-        [InlineKeyboardButton("🔙 بازگشت", callback_data="session_back")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    message, reply_markup = renderer.step(session, idx)
 
     gif = ex.get('gif')
     if gif:
@@ -439,15 +572,16 @@ async def show_current_exercise(query_or_message, context: ContextTypes.DEFAULT_
         else:
             chat_id = query_or_message.chat_id
         try:
-            await context.bot.send_animation(chat_id=chat_id, animation=gif, caption=message, reply_markup=reply_markup)
+            await media.send_animation(context.bot, chat_id, gif, caption=message, reply_markup=reply_markup)
             # optionally acknowledge previous inline message
             if hasattr(query_or_message, 'edit_message_text'):
                 try:
                     await query_or_message.edit_message_text("حرکت ارسال شد ✅")
                 except Exception:
-                    pass
+                    logger.warning("Could not acknowledge exercise %s", ex.get('id'), exc_info=True)
         except Exception:
             # fallback to plain text if animation fails
+            logger.warning("Sending GIF for exercise %s failed, falling back to text", ex.get('id'), exc_info=True)
             if hasattr(query_or_message, 'edit_message_text'):
                 await query_or_message.edit_message_text(message, reply_markup=reply_markup)
             else:
@@ -459,46 +593,82 @@ async def show_current_exercise(query_or_message, context: ContextTypes.DEFAULT_
             await query_or_message.reply_text(message, reply_markup=reply_markup)
 
 
+async def _no_active_session(query) -> None:
+    await query.edit_message_text("جلسه تمرین فعالی پیدا نشد. از ▶️ شروع تمرین استفاده کن.", reply_markup=MAIN_MENU_INLINE)
+
+
+async def send_rest_over(bot, chat_id: int, rest_seconds: int) -> None:
+    # fast lane: must not wait behind other users' menu edits. rate_limit_args is
+    # a parameter of the bot's methods only, not of the Message shortcuts
+    await bot.send_message(chat_id=chat_id, text=f"🔔 زمان استراحت ({rest_seconds}s) تمام شد! آماده حرکت بعدی؟",
+                           **priority_kwargs(bot, PRIORITY_HIGH))
+
+
 async def exercise_done(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
-    exercises = context.user_data.get('exercises', [])
-    current_index = context.user_data.get('current_index', 0)
+    user_id = query.from_user.id
+    session = await sessions.get(user_id)
+    if session is None:
+        await _no_active_session(query)
+        return
+    exercises = session['exercises']
+    current_index = session['current_index']
+
+    if current_index < len(exercises):
+        await log_exercise(db, user_id, session['session_id'], exercises[current_index])
 
     # advance index
-    context.user_data['current_index'] = current_index + 1
-    session_id = context.user_data.get('session_id')
-    if session_id is not None:
-        db.update_session_exercise_index(session_id, current_index + 1)
+    await sessions.set_index(session, current_index + 1)
 
     # if finished, show completion
     if current_index + 1 >= len(exercises):
-        await show_current_exercise(query, context)
+        await show_current_exercise(query, context, session)
         return
 
-    user_id = query.from_user.id
-    rest_seconds = db.get_rest_seconds(user_id) or 60
+    rest_seconds = await db.get_rest_seconds(user_id) or 60
     await query.edit_message_text(f"⏱️ زمان استراحت: {rest_seconds} ثانیه — استراحت کن.")
-    await asyncio.sleep(rest_seconds)
-    try:
-        await query.message.reply_text(f"🔔 زمان استراحت ({rest_seconds}s) تمام شد! آماده حرکت بعدی؟")
-    except Exception:
-        pass
-    await show_current_exercise(query.message, context)
+    message = query.message
+
+    async def rest_over() -> None:
+        try:
+            await send_rest_over(context.bot, message.chat_id, rest_seconds)
+        except Exception:
+            logger.warning("Rest-over notice for user %s failed", user_id, exc_info=True)
+        current = await sessions.get(user_id)
+        if current is not None:
+            await show_current_exercise(message, context, current)
+
+    # the handler returns right away; the timer fires later on the event loop
+    rest_timers.schedule(user_id, rest_seconds, rest_over)
 
 
 async def session_back(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
-    current_index = context.user_data.get('current_index', 0)
+    user_id = query.from_user.id
+    rest_timers.cancel(user_id)
+    session = await sessions.get(user_id)
+    if session is None:
+        await _no_active_session(query)
+        return
+    current_index = session['current_index']
     if current_index <= 0:
         await query.edit_message_text("شما در ابتدای جلسه هستید.", reply_markup=MAIN_MENU_INLINE)
         return
-    context.user_data['current_index'] = current_index - 1
-    session_id = context.user_data.get('session_id')
-    if session_id is not None:
-        db.update_session_exercise_index(session_id, current_index - 1)
-    await show_current_exercise(query, context)
+    await sessions.set_index(session, current_index - 1)
+    await show_current_exercise(query, context, session)
+
+
+async def session_resume(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Continue the open workout session, e.g. after a bot restart."""
+    query = update.callback_query
+    await query.answer()
+    session = await sessions.get(query.from_user.id)
+    if session is None:
+        await _no_active_session(query)
+        return
+    await show_current_exercise(query, context, session)
 # -- END: missing workout handlers --
 
 async def start_add_from_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -512,11 +682,82 @@ async def start_add_from_menu(update: Update, context: ContextTypes.DEFAULT_TYPE
         return ConversationHandler.END
 
     # prepare for adding exercises
-    context.user_data['exercise_count'] = len(db.get_exercises(program_id))
+    context.user_data['exercise_count'] = len(await db.get_exercises(program_id))
     await query.edit_message_text(
         "➕ لطفا حرکت جدید را ارسال کنید.\n\n"
         "فرمت: نام حرکت تکرار تعداد_ست وزن(اختیاری)\n"
         "مثال: پرس سینه 12 3 60\n\n"
-        "یا گیف را همراه با کپشنِ فرمت بالا ارسال کنید."
+        "یا گیف را همراه با کپشنِ فرمت بالا ارسال کنید.",
+        reply_markup=CATALOG_SEARCH_KEYBOARD
     )
-    return ADDING_EXERCISES
\ No newline at end of file
+    return ADDING_EXERCISES
+
+# bulk import / export
+IMPORT_USAGE = (
+    "📥 ورود گروهی حرکات:\n"
+    "/import شنبه\n"
+    "پرس سینه 12 3 60\n"
+    "اسکوات 10 4 80\n\n"
+    "یا یک فایل CSV/JSON با ستون‌های day,name,reps,sets,weight,gif بفرست (همان فرمت /export)."
+)
+
+
+async def _finish_import(update: Update, context: ContextTypes.DEFAULT_TYPE, batch) -> None:
+    if batch.errors:
+        lines = [f"خط {lineno}: {message}" for lineno, message in batch.errors[:20]]
+        if len(batch.errors) > 20:
+            lines.append(f"... و {len(batch.errors) - 20} خطای دیگر")
+        await update.message.reply_text("❌ چیزی وارد نشد، این خطوط را اصلاح کن:\n" + "\n".join(lines))
+        return
+    if not batch.rows:
+        await update.message.reply_text(IMPORT_USAGE)
+        return
+    user_id = update.effective_user.id
+    result = await db.import_exercises(user_id, batch.rows)
+    catalog.note_added()
+    summary = "\n".join(f"• {day}: {info['added']} حرکت" for day, info in result.items())
+    resume = await sessions.get(user_id) is not None
+    await update.message.reply_text(f"✅ {len(batch.rows)} حرکت وارد شد:\n{summary}",
+                                    reply_markup=dynamic_main_menu(context, resume))
+
+
+async def import_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    lines = (update.message.text or "").split('\n')
+    args = lines[0].split(maxsplit=1)
+    day = args[1] if len(args) > 1 else None
+    await _finish_import(update, context, parse_text_lines(lines[1:], day, first_lineno=2))
+
+
+async def import_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    document = update.message.document
+    if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+        await update.message.reply_text(f"❌ فایل بزرگ‌تر از {IMPORT_MAX_BYTES // 1024} کیلوبایت است.")
+        return
+    file = await document.get_file()
+    with SpooledTemporaryFile(max_size=IMPORT_MAX_BYTES) as buf:
+        await file.download_to_memory(buf)
+        buf.seek(0)
+        text = io.TextIOWrapper(buf, encoding='utf-8-sig', newline='')
+        try:
+            if (document.file_name or '').lower().endswith('.json'):
+                batch = parse_json(text)
+            else:
+                batch = parse_csv(text)
+        except UnicodeDecodeError:
+            await update.message.reply_text("❌ فایل باید UTF-8 باشد.")
+            return
+        finally:
+            text.detach()
+    await _finish_import(update, context, batch)
+
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # rows are paged out of the database into a spooled file, never all in memory at once
+    with SpooledTemporaryFile(max_size=IMPORT_MAX_BYTES) as buf:
+        count = await export_csv(db, update.effective_user.id, buf)
+        if not count:
+            await update.message.reply_text("هنوز برنامه‌ای نداری.", reply_markup=dynamic_main_menu(context))
+            return
+        buf.seek(0)
+        await update.message.reply_document(document=buf, filename="gym-programs.csv",
+                                            caption=f"📤 {count} حرکت — برای ورود دوباره همین فایل را بفرست.")
@@ -0,0 +1,239 @@
+"""
+Non-blocking, structured logging.
+
+Handlers on the event loop thread only put records on a bounded queue
+(``logging.handlers.QueueHandler``); a background thread
+(``QueueListener``) formats them and writes them to stderr or to a rotating
+file. When the queue is full records are dropped and counted rather than
+blocking an update.
+
+Every record carries the context of the update being handled (update id,
+user id, chat id, callback_data and handler), bound with a contextvar, so all
+lines of one update can be found by its ``update_id``. Noisy loggers can be
+sampled: ``LOG_SAMPLE="httpx=100"`` keeps one record in 100 below WARNING.
+
+    LOG_LEVEL=INFO
+    LOG_FORMAT=json                  json or text
+    LOG_FILE=                        empty = stderr; {shard} is replaced by the shard index
+    LOG_MAX_BYTES / LOG_BACKUP_COUNT rotation of LOG_FILE
+    LOG_SAMPLE=httpx=100             logger=N pairs, keep 1 record in N
+    LOG_QUEUE_SIZE=10000             records waiting for the writer thread
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+LOG_FILE = os.getenv('LOG_FILE', '')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+LOG_SAMPLE = os.getenv('LOG_SAMPLE', 'httpx=100')
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# fields of the update being handled, copied onto every record
+CONTEXT_FIELDS = ('update_id', 'user_id', 'chat_id', 'callback_data', 'handler')
+_log_context: contextvars.ContextVar[Dict[str, object]] = contextvars.ContextVar('log_context', default={})
+
+
+def bind(**fields) -> None:
+    """Add fields to the log context of the current update (and the tasks it starts)."""
+    context = dict(_log_context.get())
+    context.update(fields)
+    _log_context.set(context)
+
+
+def bind_update(update) -> None:
+    """Start a fresh log context for ``update``."""
+    user = update.effective_user
+    chat = update.effective_chat
+    query = update.callback_query
+    _log_context.set({
+        'update_id': update.update_id,
+        'user_id': user.id if user else None,
+        'chat_id': chat.id if chat else None,
+        'callback_data': query.data if query else None,
+    })
+
+
+async def bind_update_handler(update, context) -> None:
+    """TypeHandler callback run before every other handler (group -1)."""
+    bind_update(update)
+
+
+def parse_sample(spec: str) -> Dict[str, int]:
+    """``"httpx=100,telegram.ext=10"`` -> {'httpx': 100, 'telegram.ext': 10}."""
+    rates = {}
+    for item in spec.split(','):
+        name, sep, every = item.strip().partition('=')
+        if name and sep:
+            rates[name] = max(1, int(every))
+    return rates
+
+
+class ContextFilter(logging.Filter):
+    """Copies the update context onto the record; runs on the thread that logs."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _log_context.get()
+        for field in CONTEXT_FIELDS:
+            setattr(record, field, context.get(field))
+        return True
+
+
+_UNRESOLVED = object()
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps one record in N of the configured loggers (and their children) below WARNING."""
+
+    def __init__(self, rates: Dict[str, int]):
+        super().__init__()
+        self.rates = rates
+        self._seen: Dict[str, int] = {}
+        self._resolved: Dict[str, Optional[str]] = {}
+        self.sampled_out = 0
+
+    def _rule(self, name: str) -> Optional[str]:
+        rule = self._resolved.get(name, _UNRESOLVED)
+        if rule is _UNRESOLVED:
+            rule = None
+            for prefix in self.rates:
+                if (name == prefix or name.startswith(prefix + '.')) and (rule is None or len(prefix) > len(rule)):
+                    rule = prefix
+            self._resolved[name] = rule
+        return rule
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rule = self._rule(record.name)
+        if rule is None:
+            return True
+        seen = self._seen.get(rule, 0)
+        self._seen[rule] = seen + 1
+        if seen % self.rates[rule] == 0:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of waiting when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # only what cannot cross threads is resolved here; formatting happens on the writer thread.
+        # The root logger's handler runs last, so the record can be changed in place.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def make_formatter(fmt: str = LOG_FORMAT) -> logging.Formatter:
+    return JsonFormatter() if fmt == 'json' else logging.Formatter(TEXT_FORMAT)
+
+
+def make_writer(path: str = LOG_FILE, fmt: str = LOG_FORMAT, shard: Optional[int] = None) -> logging.Handler:
+    if path:
+        if '{shard}' in path:
+            path = path.replace('{shard}', str(shard if shard is not None else int(os.getenv('SHARD_INDEX') or 0)))
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        writer: logging.Handler = RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+                                                      encoding='utf-8')
+    else:
+        writer = logging.StreamHandler(sys.stderr)
+    writer.setFormatter(make_formatter(fmt))
+    return writer
+
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+_sampler: Optional[SamplingFilter] = None
+
+
+def setup_logging(level: str = LOG_LEVEL, writer: Optional[logging.Handler] = None,
+                  sample: str = LOG_SAMPLE, queue_size: int = LOG_QUEUE_SIZE) -> QueueListener:
+    """Route the root logger through the queue. Calling it again returns the running listener."""
+    global _listener, _queue_handler, _sampler
+    if _listener is not None:
+        return _listener
+    log_queue: queue.Queue = queue.Queue(queue_size)
+    _queue_handler = NonBlockingQueueHandler(log_queue)
+    _sampler = SamplingFilter(parse_sample(sample))
+    # sampling first, so dropped records skip the context lookup and the queue
+    _queue_handler.addFilter(_sampler)
+    _queue_handler.addFilter(ContextFilter())
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+    _listener = QueueListener(log_queue, writer or make_writer(), respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging() -> None:
+    """Write out what is queued and stop the writer thread."""
+    global _listener, _queue_handler, _sampler
+    if _listener is None:
+        return
+    _listener.stop()
+    logging.getLogger().removeHandler(_queue_handler)
+    _listener = _queue_handler = _sampler = None
+
+
+def stats() -> Dict[str, int]:
+    if _queue_handler is None:
+        return {}
+    return {
+        'queued': _queue_handler.queue.qsize(),
+        'dropped': _queue_handler.dropped,
+        'sampled_out': _sampler.sampled_out,
+    }
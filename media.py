@@ -0,0 +1,115 @@
+"""
+Exercise GIF delivery with a shared Telegram file_id cache.
+
+Exercises may store either a Telegram file_id (GIF sent to the bot) or a raw
+URL. Sending a URL makes Telegram download it again on every workout step,
+so the first successful send of a URL records the returned file_id in
+``media_cache`` and every later send, for any user, reuses it.
+"""
+
+import logging
+import os
+import time
+from collections import deque
+from typing import Dict, Iterable, Optional
+
+from telegram.error import BadRequest
+
+from cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# private chat/channel the bot can post to; lets prewarm upload URLs before anyone needs them
+MEDIA_WARMUP_CHAT_ID = os.getenv('MEDIA_WARMUP_CHAT_ID')
+
+
+def is_url(gif: Optional[str]) -> bool:
+    return bool(gif) and gif.startswith(('http://', 'https://'))
+
+
+def _percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class MediaCache:
+    def __init__(self, db, warmup_chat_id: Optional[str] = MEDIA_WARMUP_CHAT_ID, maxsize: int = 10000):
+        self.db = db
+        self.warmup_chat_id = warmup_chat_id
+        # url -> file_id; ttl is effectively unlimited, file_ids do not expire
+        self._file_ids = LRUCache(maxsize, ttl=float('inf'))
+        self.hits = 0
+        self.misses = 0
+        self.uploads = 0
+        self._latencies = deque(maxlen=1024)
+
+    async def file_id_for(self, url: str) -> Optional[str]:
+        file_id = self._file_ids.get(url)
+        if file_id is None:
+            file_id = (await self.db.get_media_file_ids([url])).get(url)
+            if file_id is not None:
+                self._file_ids.set(url, file_id)
+        return file_id
+
+    async def _remember(self, url: str, message) -> None:
+        media = message.animation or message.document if message else None
+        if media is None:
+            return
+        self._file_ids.set(url, media.file_id)
+        await self.db.save_media_file_id(url, media.file_id)
+        self.uploads += 1
+
+    async def send_animation(self, bot, chat_id: int, gif: str, **kwargs):
+        """send_animation that uploads each URL at most once."""
+        start = time.perf_counter()
+        try:
+            if not is_url(gif):
+                return await bot.send_animation(chat_id=chat_id, animation=gif, **kwargs)
+            file_id = await self.file_id_for(gif)
+            if file_id is not None:
+                self.hits += 1
+                try:
+                    return await bot.send_animation(chat_id=chat_id, animation=file_id, **kwargs)
+                except BadRequest:
+                    # file_ids are bot-specific; a new token invalidates them
+                    logger.warning("Cached file_id for %s was rejected, uploading again", gif)
+                    self._file_ids.pop(gif)
+                    await self.db.delete_media_file_id(gif)
+            self.misses += 1
+            message = await bot.send_animation(chat_id=chat_id, animation=gif, **kwargs)
+            await self._remember(gif, message)
+            return message
+        finally:
+            self._latencies.append(time.perf_counter() - start)
+
+    async def prewarm(self, bot, gifs: Iterable[Optional[str]]) -> None:
+        """Load cached file_ids for ``gifs`` and upload the missing URLs to the warm-up chat."""
+        urls = [g for g in dict.fromkeys(gifs) if is_url(g) and self._file_ids.get(g) is None]
+        if not urls:
+            return
+        known = await self.db.get_media_file_ids(urls)
+        for url, file_id in known.items():
+            self._file_ids.set(url, file_id)
+        if not self.warmup_chat_id:
+            return
+        for url in urls:
+            if url in known:
+                continue
+            try:
+                message = await bot.send_animation(chat_id=self.warmup_chat_id, animation=url,
+                                                   disable_notification=True)
+                await self._remember(url, message)
+                await bot.delete_message(chat_id=self.warmup_chat_id, message_id=message.message_id)
+            except Exception:
+                logger.warning("Could not pre-upload %s", url, exc_info=True)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'uploads': self.uploads,
+            'send_p50': _percentile(self._latencies, 0.5),
+            'send_p99': _percentile(self._latencies, 0.99),
+        }
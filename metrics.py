@@ -0,0 +1,318 @@
+"""
+Prometheus-style metrics.
+
+Counters, histograms and gauges are plain dicts keyed by label values and
+are only touched from the event loop, so recording a sample is a dict lookup,
+a bisect and a few additions. ``/metrics`` serves them in the Prometheus text
+format on METRICS_LISTEN:METRICS_PORT (off when the port is 0; in sharded
+mode shard i listens on METRICS_PORT + i).
+
+What is recorded:
+
+- every registered handler (``instrument_application``): calls, latency,
+  errors, and how much of its time went to database calls and to Bot API
+  calls;
+- every AsyncDatabase call by method and every Bot API call by endpoint;
+- gauges read when scraped, e.g. open sessions, pending rest timers and the
+  ``stats()`` of the caches, the outbound scheduler and the update processor.
+"""
+
+import contextvars
+import functools
+import logging
+import os
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from telegram.ext import ApplicationHandlerStop, ConversationHandler
+
+from logging_setup import bind
+
+logger = logging.getLogger(__name__)
+
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+
+# seconds; handlers, database calls and Bot API calls all land in this range
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def lines(self) -> Iterable[str]:
+        for labels, value in self._values.items():
+            yield f'{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}'
+
+
+class _Series:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, buckets: int):
+        self.counts = [0] * (buckets + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], _Series] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = _Series(len(self.buckets))
+        # counts are per bucket here and made cumulative when rendered
+        series.counts[bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return series.count if series else 0
+
+    def sum(self, *labels: str) -> float:
+        series = self._series.get(labels)
+        return series.sum if series else 0.0
+
+    def lines(self) -> Iterable[str]:
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series.counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f'{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}'
+            label_text = _format_labels(self.labels, labels)
+            yield f'{self.name}_sum{label_text} {_format_value(series.sum)}'
+            yield f'{self.name}_count{label_text} {series.count}'
+
+
+class Gauge:
+    """A value read from ``func`` at scrape time."""
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, func: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.func = func
+
+    def lines(self) -> Iterable[str]:
+        yield f'{self.name} {_format_value(self.func())}'
+
+
+class StatsGauges:
+    """One gauge per numeric key of a component's ``stats()`` dict, read at scrape time."""
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, func: Callable[[], Dict[str, object]]):
+        self.name = name
+        self.help = help
+        self.func = func
+
+    def lines(self) -> Iterable[str]:
+        for key, value in self.func().items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                yield f'{self.name}{{stat="{_escape(key)}"}} {_format_value(value)}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def _add(self, metric):
+        # re-registering a name (a rebuilt application, tests) replaces the old metric
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name: str, help: str, func: Callable[[], float]) -> Gauge:
+        return self._add(Gauge(name, help, func))
+
+    def stats(self, name: str, help: str, func: Callable[[], Dict[str, object]]) -> StatsGauges:
+        return self._add(StatsGauges(name, help, func))
+
+    def render(self) -> str:
+        out: List[str] = []
+        for metric in list(self._metrics.values()):
+            try:
+                lines = list(metric.lines())
+            except Exception:
+                # a broken gauge must not take the whole scrape down
+                logger.warning("Could not read metric %s", metric.name, exc_info=True)
+                continue
+            out.append(f'# HELP {metric.name} {metric.help}')
+            out.append(f'# TYPE {metric.name} {metric.kind}')
+            out.extend(lines)
+        return '\n'.join(out) + '\n'
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.histogram(
+    'gymbot_handler_seconds', 'Time to run an update handler', ('handler',))
+HANDLER_ERRORS = REGISTRY.counter(
+    'gymbot_handler_errors_total', 'Handlers that raised', ('handler',))
+HANDLER_DB_SECONDS = REGISTRY.counter(
+    'gymbot_handler_db_seconds_total', 'Time handlers spent waiting for database calls', ('handler',))
+HANDLER_API_SECONDS = REGISTRY.counter(
+    'gymbot_handler_api_seconds_total', 'Time handlers spent waiting for Bot API calls', ('handler',))
+DB_SECONDS = REGISTRY.histogram(
+    'gymbot_db_call_seconds', 'Database calls, including the wait for a database thread', ('method',))
+DB_ERRORS = REGISTRY.counter('gymbot_db_errors_total', 'Database calls that raised', ('method',))
+API_SECONDS = REGISTRY.histogram(
+    'gymbot_api_call_seconds', 'Bot API requests (after outbound queueing)', ('endpoint',))
+API_ERRORS = REGISTRY.counter('gymbot_api_errors_total', 'Bot API requests that failed', ('endpoint',))
+
+# [database seconds, Bot API seconds] of the handler running in this context
+_handler_time: contextvars.ContextVar[Optional[List[float]]] = contextvars.ContextVar('handler_time', default=None)
+
+
+def observe_db(method: str, seconds: float, failed: bool = False) -> None:
+    DB_SECONDS.observe(seconds, method)
+    if failed:
+        DB_ERRORS.inc(method)
+    spent = _handler_time.get()
+    if spent is not None:
+        spent[0] += seconds
+
+
+def observe_api(endpoint: str, seconds: float, failed: bool = False) -> None:
+    API_SECONDS.observe(seconds, endpoint)
+    if failed:
+        API_ERRORS.inc(endpoint)
+    spent = _handler_time.get()
+    if spent is not None:
+        spent[1] += seconds
+
+
+def instrument(callback, name: Optional[str] = None):
+    """Wrap a handler callback so its calls, latency, errors and DB/API time are recorded."""
+    if getattr(callback, '_metrics_name', None):
+        return callback
+    name = name or getattr(callback, '__name__', type(callback).__name__)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        bind(handler=name)
+        spent = [0.0, 0.0]
+        token = _handler_time.set(spent)
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            # flow control, not a failure
+            raise
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - start, name)
+            HANDLER_DB_SECONDS.inc(name, amount=spent[0])
+            HANDLER_API_SECONDS.inc(name, amount=spent[1])
+            _handler_time.reset(token)
+
+    wrapper._metrics_name = name
+    return wrapper
+
+
+def _handlers_of(handler) -> Iterable:
+    if isinstance(handler, ConversationHandler):
+        yield from handler.entry_points
+        for state_handlers in handler.states.values():
+            yield from state_handlers
+        yield from handler.fallbacks
+    else:
+        yield handler
+
+
+def instrument_application(application) -> int:
+    """Instrument every handler registered on ``application``. Returns how many were wrapped."""
+    wrapped = 0
+    for group in application.handlers.values():
+        for outer in group:
+            for handler in _handlers_of(outer):
+                callback = getattr(handler, 'callback', None)
+                router = getattr(callback, '__self__', None)
+                if isinstance(getattr(router, 'routes', None), dict):
+                    # a CallbackRouter: measure the routes, not the dispatcher
+                    for action, route in router.routes.items():
+                        if not getattr(route, '_metrics_name', None):
+                            router.routes[action] = instrument(route)
+                            wrapped += 1
+                    if not getattr(router.on_invalid, '_metrics_name', None):
+                        router.on_invalid = instrument(router.on_invalid)
+                        wrapped += 1
+                elif callback is not None and not getattr(callback, '_metrics_name', None):
+                    handler.callback = instrument(callback)
+                    wrapped += 1
+    return wrapped
+
+
+class MetricsServer:
+    """Serves ``GET /metrics`` from a registry."""
+
+    def __init__(self, registry: Registry = REGISTRY):
+        # imported here: aiohttp is a fifth of the bot's import time and /metrics is optional
+        from aiohttp import web
+        self.registry = registry
+        self.web_app = web.Application()
+        self.web_app.router.add_get('/metrics', self.handle_metrics)
+        self._runner = None
+
+    async def handle_metrics(self, request):
+        from aiohttp import web
+        return web.Response(text=self.registry.render(), content_type='text/plain', charset='utf-8')
+
+    async def start(self, listen: str = METRICS_LISTEN, port: int = METRICS_PORT) -> None:
+        from aiohttp import web
+        self._runner = web.AppRunner(self.web_app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, listen, port).start()
+        logger.info("Metrics on http://%s:%d/metrics", listen, port)
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,380 @@
+"""
+Versioned schema migrations for gym.db.
+
+The schema version is stored in SQLite's ``PRAGMA user_version``. Each
+migration runs in its own transaction and bumps the version, so existing
+databases are upgraded in place and a database that is already current only
+costs a single PRAGMA read on startup.
+"""
+
+import logging
+import sqlite3
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _baseline(cur: sqlite3.Cursor):
+    # the tables as they were created before migrations existed
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY,
+        username TEXT
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS programs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        day_name TEXT,
+        created_at TEXT
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS exercises (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        program_id INTEGER,
+        name TEXT,
+        reps INTEGER DEFAULT 0,
+        sets INTEGER DEFAULT 0,
+        weight REAL DEFAULT 0,
+        gif TEXT,
+        position INTEGER DEFAULT 0
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        program_id INTEGER,
+        started_at TEXT,
+        current_index INTEGER DEFAULT 0,
+        closed INTEGER DEFAULT 0
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS user_settings (
+        user_id INTEGER PRIMARY KEY,
+        rest_seconds INTEGER DEFAULT 60
+    )
+    """)
+
+
+def _foreign_keys_and_indexes(cur: sqlite3.Cursor):
+    # SQLite cannot add a foreign key to an existing table, so exercises and
+    # sessions are rebuilt; rows pointing at deleted programs are dropped.
+    cur.execute("""
+    CREATE TABLE exercises_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        program_id INTEGER NOT NULL REFERENCES programs(id) ON DELETE CASCADE,
+        name TEXT,
+        reps INTEGER DEFAULT 0,
+        sets INTEGER DEFAULT 0,
+        weight REAL DEFAULT 0,
+        gif TEXT,
+        position INTEGER DEFAULT 0
+    )
+    """)
+    cur.execute("""
+    INSERT INTO exercises_new (id, program_id, name, reps, sets, weight, gif, position)
+    SELECT id, program_id, name, reps, sets, weight, gif, position FROM exercises
+    WHERE program_id IN (SELECT id FROM programs)
+    """)
+    cur.execute("DROP TABLE exercises")
+    cur.execute("ALTER TABLE exercises_new RENAME TO exercises")
+
+    cur.execute("""
+    CREATE TABLE sessions_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        program_id INTEGER REFERENCES programs(id) ON DELETE CASCADE,
+        started_at TEXT,
+        current_index INTEGER DEFAULT 0,
+        closed INTEGER DEFAULT 0
+    )
+    """)
+    cur.execute("""
+    INSERT INTO sessions_new (id, user_id, program_id, started_at, current_index, closed)
+    SELECT id, user_id, program_id, started_at, current_index, closed FROM sessions
+    WHERE program_id IN (SELECT id FROM programs)
+    """)
+    cur.execute("DROP TABLE sessions")
+    cur.execute("ALTER TABLE sessions_new RENAME TO sessions")
+
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_programs_user_day ON programs (user_id, day_name)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_exercises_program_position ON exercises (program_id, position, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user_open ON sessions (user_id, closed, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sessions_program ON sessions (program_id)")
+
+
+def _session_snapshots(cur: sqlite3.Cursor):
+    # the exercise list a session was started with, so it can be resumed after a restart
+    cur.execute("ALTER TABLE sessions ADD COLUMN exercises_json TEXT")
+    # abandoned sessions were never closed; keep only the newest open one per user
+    cur.execute("""
+    UPDATE sessions SET closed = 1
+    WHERE closed = 0 AND id NOT IN (SELECT MAX(id) FROM sessions WHERE closed = 0 GROUP BY user_id)
+    """)
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_sessions_one_open ON sessions (user_id) WHERE closed = 0")
+
+
+def _persistence_tables(cur: sqlite3.Cursor):
+    # per-user user_data and in-progress conversation states (see persistence.py)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS persisted_user_data (
+        user_id INTEGER PRIMARY KEY,
+        data TEXT NOT NULL,
+        updated_at TEXT
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS persisted_conversations (
+        name TEXT NOT NULL,
+        key TEXT NOT NULL,
+        state TEXT NOT NULL,
+        PRIMARY KEY (name, key)
+    )
+    """)
+
+
+def _media_cache(cur: sqlite3.Cursor):
+    # Telegram file_id of every GIF URL already uploaded once, shared by all users
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS media_cache (
+        url TEXT PRIMARY KEY,
+        file_id TEXT NOT NULL,
+        created_at TEXT
+    )
+    """)
+
+
+def _reminders(cur: sqlite3.Cursor):
+    # one daily reminder per user; next_fire_at is a UTC unix timestamp and the
+    # index is the scheduler's time-ordered queue
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS reminders (
+        user_id INTEGER PRIMARY KEY,
+        chat_id INTEGER NOT NULL,
+        minute_of_day INTEGER NOT NULL,
+        tz TEXT NOT NULL,
+        next_fire_at REAL NOT NULL,
+        last_sent_at REAL
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_reminders_next_fire ON reminders (next_fire_at)")
+
+
+def _workout_log(cur: sqlite3.Cursor):
+    # append-only history: rowid order is time order, no secondary index to maintain
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS workout_log (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        session_id INTEGER,
+        exercise_name TEXT NOT NULL,
+        reps INTEGER,
+        sets INTEGER,
+        weight REAL,
+        logged_at REAL NOT NULL
+    )
+    """)
+    # aggregates updated in the same transaction as each log row, so /stats never scans the log
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS stats_weekly (
+        user_id INTEGER NOT NULL,
+        week_start TEXT NOT NULL,
+        volume REAL NOT NULL DEFAULT 0,
+        sets INTEGER NOT NULL DEFAULT 0,
+        exercises INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, week_start)
+    ) WITHOUT ROWID
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS stats_records (
+        user_id INTEGER NOT NULL,
+        exercise_name TEXT NOT NULL,
+        weight REAL NOT NULL,
+        reps INTEGER,
+        achieved_at REAL NOT NULL,
+        PRIMARY KEY (user_id, exercise_name)
+    ) WITHOUT ROWID
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS stats_streaks (
+        user_id INTEGER PRIMARY KEY,
+        last_day TEXT NOT NULL,
+        last_week TEXT NOT NULL,
+        days INTEGER NOT NULL DEFAULT 0,
+        current_weeks INTEGER NOT NULL DEFAULT 0,
+        longest_weeks INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+
+
+def _program_versions(cur: sqlite3.Cursor):
+    # bumped by every change to a program's exercises; rendered views are cached per version
+    cur.execute("ALTER TABLE programs ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+    for event, ref in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_exercises_version_{event.lower()} AFTER {event} ON exercises
+        BEGIN
+            UPDATE programs SET version = version + 1 WHERE id = {ref}.program_id;
+        END
+        """)
+    # an exercise moved to another program changes both
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_exercises_version_move AFTER UPDATE OF program_id ON exercises
+    WHEN OLD.program_id != NEW.program_id
+    BEGIN
+        UPDATE programs SET version = version + 1 WHERE id = OLD.program_id;
+    END
+    """)
+
+
+def _copy_on_write_exercises(cur: sqlite3.Cursor):
+    # an exercise row belongs to the program versions [valid_from, valid_to); an edit
+    # supersedes the rows it changes and inserts new ones, unchanged rows are shared.
+    # Version bumps move from the triggers into the write methods: one per edit, not per row.
+    for event in ("insert", "update", "delete", "move"):
+        cur.execute(f"DROP TRIGGER IF EXISTS trg_exercises_version_{event}")
+    cur.execute("ALTER TABLE exercises ADD COLUMN valid_from INTEGER NOT NULL DEFAULT 0")
+    cur.execute("ALTER TABLE exercises ADD COLUMN valid_to INTEGER")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_exercises_superseded ON exercises (valid_to) WHERE valid_to IS NOT NULL")
+    # sessions pin the version they run instead of storing a copy of its exercises
+    cur.execute("ALTER TABLE sessions ADD COLUMN version INTEGER")
+
+    # "overwrite" used to add a second program for the same day; fold each duplicate
+    # into the oldest one, appending its exercises
+    duplicates = cur.execute("""
+    SELECT user_id, day_name, MIN(id) FROM programs GROUP BY user_id, day_name HAVING COUNT(*) > 1
+    """).fetchall()
+    for user_id, day_name, keep in duplicates:
+        for (other,) in cur.execute("SELECT id FROM programs WHERE user_id = ? AND day_name = ? AND id != ? ORDER BY id",
+                                    (user_id, day_name, keep)).fetchall():
+            offset = cur.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM exercises WHERE program_id = ?",
+                                 (keep,)).fetchone()[0]
+            cur.execute("UPDATE exercises SET program_id = ?, position = position + ? WHERE program_id = ?",
+                        (keep, offset, other))
+            cur.execute("UPDATE sessions SET program_id = ? WHERE program_id = ?", (keep, other))
+            cur.execute("DELETE FROM programs WHERE id = ?", (other,))
+        cur.execute("UPDATE programs SET version = version + 1 WHERE id = ?", (keep,))
+    cur.execute("DROP INDEX IF EXISTS idx_programs_user_day")
+    cur.execute("CREATE UNIQUE INDEX idx_programs_user_day ON programs (user_id, day_name)")
+
+
+def _gapped_positions(cur: sqlite3.Cursor):
+    # positions were 0, 1, 2, ... (with holes after deletes); space them out so
+    # a move can take the midpoint of its new neighbours
+    gap = 1024  # database.POSITION_GAP
+    rows = cur.execute("SELECT id, program_id FROM exercises ORDER BY program_id, position, id").fetchall()
+    updates, program, index = [], None, 0
+    for exercise_id, program_id in rows:
+        index = index + 1 if program_id == program else 1
+        program = program_id
+        updates.append((index * gap, exercise_id))
+    cur.executemany("UPDATE exercises SET position = ? WHERE id = ?", updates)
+
+
+# catalog.normalize as of this migration, frozen so that a later change to it
+# cannot change the name_keys this migration wrote
+_CATALOG_FOLD = {
+    'ي': 'ی', 'ى': 'ی', 'ئ': 'ی', 'ك': 'ک', 'ة': 'ه', 'ۀ': 'ه', 'ؤ': 'و',
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    '\u200c': ' ', '\u200d': None, 'ـ': None,
+}
+_CATALOG_FOLD.update({chr(0x06F0 + d): str(d) for d in range(10)})
+_CATALOG_FOLD.update({chr(0x0660 + d): str(d) for d in range(10)})
+_CATALOG_FOLD.update({chr(c): None for c in range(0x064B, 0x0660)})
+_CATALOG_FOLD[chr(0x0670)] = None
+_CATALOG_FOLD_TABLE = str.maketrans(_CATALOG_FOLD)
+
+
+def _catalog_key(name: str) -> str:
+    folded = name.translate(_CATALOG_FOLD_TABLE).casefold()
+    key = ' '.join(''.join(ch if ch.isalnum() else ' ' for ch in folded).split())
+    return key or ' '.join(folded.split())
+
+
+def _exercise_catalog(cur: sqlite3.Cursor):
+    # one entry per normalized name, first spelling and first gif win. The
+    # exercises keep their own gifs: one only shows the entry's gif when its
+    # catalog_gif flag is set, and no existing row has it
+    cur.execute("""
+        CREATE TABLE exercise_catalog (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            name_key TEXT NOT NULL UNIQUE,
+            gif TEXT
+        )
+    """)
+    cur.execute("ALTER TABLE exercises ADD COLUMN catalog_id INTEGER REFERENCES exercise_catalog(id)")
+    cur.execute("ALTER TABLE exercises ADD COLUMN catalog_gif INTEGER NOT NULL DEFAULT 0")
+    entries: Dict[str, list] = {}
+    links = []
+    for exercise_id, name, gif in cur.execute("SELECT id, name, gif FROM exercises ORDER BY id").fetchall():
+        key = _catalog_key(name)
+        entry = entries.get(key)
+        if entry is None:
+            cur.execute("INSERT INTO exercise_catalog (name, name_key, gif) VALUES (?, ?, ?)", (name, key, gif))
+            entry = entries[key] = [cur.lastrowid, gif]
+        elif entry[1] is None and gif:
+            cur.execute("UPDATE exercise_catalog SET gif = ? WHERE id = ?", (gif, entry[0]))
+            entry[1] = gif
+        links.append((entry[0], exercise_id))
+    cur.executemany("UPDATE exercises SET catalog_id = ? WHERE id = ?", links)
+
+
+# (version, description, migration); append new migrations at the end
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = [
+    (1, "baseline tables", _baseline),
+    (2, "foreign keys with ON DELETE CASCADE and lookup indexes", _foreign_keys_and_indexes),
+    (3, "session exercise snapshots and one open session per user", _session_snapshots),
+    (4, "user_data and conversation persistence", _persistence_tables),
+    (5, "media file_id cache", _media_cache),
+    (6, "workout reminders", _reminders),
+    (7, "workout log and stats aggregates", _workout_log),
+    (8, "program versions", _program_versions),
+    (9, "copy-on-write exercise versions and one program per user and day", _copy_on_write_exercises),
+    (10, "gapped exercise positions", _gapped_positions),
+    (11, "shared exercise catalog", _exercise_catalog),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection, target: Optional[int] = None) -> int:
+    """Apply every migration newer than the stored version up to ``target``."""
+    target = LATEST_VERSION if target is None else target
+    current = get_version(conn)
+    if current >= target:
+        return current
+    # foreign keys must be off while tables are rebuilt
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        for version, description, func in MIGRATIONS:
+            if version <= current or version > target:
+                continue
+            cur = conn.cursor()
+            # IMMEDIATE takes the write lock up front; another process may have
+            # applied this migration while we waited for it
+            cur.execute("BEGIN IMMEDIATE")
+            if get_version(conn) >= version:
+                conn.rollback()
+                current = version
+                continue
+            logger.info("Applying schema migration %d: %s", version, description)
+            try:
+                func(cur)
+                cur.execute(f"PRAGMA user_version = {version}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            current = version
+    finally:
+        conn.execute("PRAGMA foreign_keys = ON")
+    return current
@@ -0,0 +1,266 @@
+"""
+Outbound scheduler for Bot API calls.
+
+Plugged in as the bot's rate limiter (``ApplicationBuilder.rate_limiter``), so
+every reply_text / edit_message_text / send_animation goes through it:
+
+- a global token bucket (Telegram allows about 30 messages per second) and a
+  token bucket per chat (about one message per second);
+- a priority lane: waiting requests are released by the global bucket in
+  priority order, so rest-over notifications overtake menu edits;
+- edits of the same message that are still waiting are coalesced, only the
+  newest text is sent and every caller gets its result;
+- 429 responses are retried after ``retry_after`` and pause that chat.
+
+Pass ``**priority_kwargs(bot, PRIORITY_HIGH)`` to a method of the bot (e.g.
+``bot.send_message``) to use the fast lane; the Message and CallbackQuery
+shortcuts such as ``reply_text`` do not take ``rate_limit_args``. Menu edits
+default to PRIORITY_LOW, everything else to PRIORITY_NORMAL.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Coroutine, Dict, Optional, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from metrics import observe_api
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', '30'))
+OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', '1'))
+OUTBOUND_CHAT_BURST = float(os.getenv('OUTBOUND_CHAT_BURST', '3'))
+OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', '3'))
+
+# endpoints that count against Telegram's message limits
+LIMITED_ENDPOINTS = frozenset({
+    'sendMessage', 'sendAnimation', 'sendPhoto', 'sendDocument', 'sendVideo',
+    'editMessageText', 'editMessageCaption', 'editMessageReplyMarkup', 'copyMessage', 'forwardMessage',
+})
+EDIT_ENDPOINTS = frozenset({'editMessageText', 'editMessageCaption', 'editMessageReplyMarkup'})
+
+_MAX_CHAT_BUCKETS = 50000
+
+
+def priority_kwargs(bot, priority: int) -> Dict[str, Any]:
+    """``rate_limit_args`` for a call of an ExtBot method; empty when no rate limiter is configured."""
+    return {'rate_limit_args': {'priority': priority}} if getattr(bot, 'rate_limiter', None) is not None else {}
+
+
+class TokenBucket:
+    """Token bucket that hands out send slots in call order (GCRA)."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.interval = 1.0 / rate
+        # how far ahead of the steady rate a burst may run
+        self.tolerance = (max(capacity, 1.0) - 1) * self.interval
+        self.tat = 0.0
+        self.blocked_until = 0.0
+
+    def reserve(self) -> float:
+        """Take the next slot and return the seconds to wait for it."""
+        now = time.monotonic()
+        send_at = max(now, self.tat - self.tolerance, self.blocked_until)
+        self.tat = max(self.tat, send_at) + self.interval
+        return send_at - now
+
+    def block(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class _PendingEdit:
+    __slots__ = ('result', 'superseded_by')
+
+    def __init__(self, loop):
+        self.result = loop.create_future()
+        self.superseded_by: Optional['_PendingEdit'] = None
+
+
+async def _timed_call(callback, args, kwargs, endpoint: str):
+    start = time.perf_counter()
+    failed = True
+    try:
+        result = await callback(*args, **kwargs)
+        failed = False
+        return result
+    finally:
+        observe_api(endpoint, time.perf_counter() - start, failed)
+
+
+class OutboundScheduler(BaseRateLimiter[Dict[str, Any]]):
+    def __init__(self, global_rate: float = OUTBOUND_GLOBAL_RATE, chat_rate: float = OUTBOUND_CHAT_RATE,
+                 chat_burst: float = OUTBOUND_CHAT_BURST, max_retries: int = OUTBOUND_MAX_RETRIES):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._chats: "OrderedDict[Any, TokenBucket]" = OrderedDict()
+        self._heap = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._edits: Dict[tuple, _PendingEdit] = {}
+        self._queue_latency = {p: deque(maxlen=1024) for p in (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW)}
+        self.sent = 0
+        self.coalesced = 0
+        self.retries = 0
+
+    async def initialize(self) -> None:
+        # the Application and its Updater both initialize the bot, and with it the limiter
+        if self._dispatcher is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+        for _, _, future in self._heap:
+            if not future.done():
+                future.cancel()
+        self._heap.clear()
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            if len(self._chats) > _MAX_CHAT_BUCKETS:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def _dispatch(self) -> None:
+        # releases waiting requests one global token at a time, highest priority first
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            wait = self.global_bucket.reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            # the slot goes to whoever has the highest priority once it arrives
+            while self._heap:
+                _, _, future = heapq.heappop(self._heap)
+                if not future.done():
+                    future.set_result(None)
+                    break
+
+    async def _acquire_global(self, priority: int) -> None:
+        if self._dispatcher is None:
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), future))
+        self._wakeup.set()
+        await future
+
+    async def _acquire_chat(self, chat_id) -> None:
+        wait = self._chat_bucket(chat_id).reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], None]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[Dict[str, Any]],
+    ) -> Union[bool, Dict[str, Any], None]:
+        if endpoint not in LIMITED_ENDPOINTS:
+            return await _timed_call(callback, args, kwargs, endpoint)
+
+        default = PRIORITY_LOW if endpoint in EDIT_ENDPOINTS else PRIORITY_NORMAL
+        priority = (rate_limit_args or {}).get('priority', default)
+        chat_id = data.get('chat_id')
+        edit_key = None
+        pending = None
+        if endpoint in EDIT_ENDPOINTS and data.get('message_id') is not None:
+            edit_key = (endpoint, chat_id, data['message_id'])
+            pending = _PendingEdit(asyncio.get_running_loop())
+            previous = self._edits.get(edit_key)
+            if previous is not None:
+                previous.superseded_by = pending
+            self._edits[edit_key] = pending
+
+        queued_at = time.monotonic()
+        try:
+            if chat_id is not None:
+                if pending is not None and pending.superseded_by is not None:
+                    return await self._coalesce(pending)
+                await self._acquire_chat(chat_id)
+            if pending is not None and pending.superseded_by is not None:
+                return await self._coalesce(pending)
+            await self._acquire_global(priority)
+            self._queue_latency[priority].append(time.monotonic() - queued_at)
+            result = await self._send(callback, args, kwargs, endpoint, chat_id)
+            if pending is not None:
+                pending.result.set_result(result)
+            return result
+        except BaseException as exc:
+            if pending is not None and not pending.result.done():
+                if isinstance(exc, asyncio.CancelledError):
+                    pending.result.cancel()
+                else:
+                    pending.result.set_exception(exc)
+                    # mark it retrieved; whoever coalesced into it re-raises it
+                    pending.result.exception()
+            raise
+        finally:
+            if edit_key is not None and self._edits.get(edit_key) is pending:
+                del self._edits[edit_key]
+
+    async def _coalesce(self, pending: _PendingEdit):
+        # a newer edit of the same message is queued; its result is ours too
+        self.coalesced += 1
+        result = await asyncio.shield(pending.superseded_by.result)
+        pending.result.set_result(result)
+        return result
+
+    async def _send(self, callback, args, kwargs, endpoint: str, chat_id):
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = await _timed_call(callback, args, kwargs, endpoint)
+                self.sent += 1
+                return result
+            except RetryAfter as exc:
+                if attempt >= self.max_retries:
+                    logger.error("%s to chat %s still flood-limited after %d retries", endpoint, chat_id, attempt)
+                    raise
+                delay = exc.retry_after.total_seconds() if hasattr(exc.retry_after, 'total_seconds') else float(exc.retry_after)
+                self.retries += 1
+                logger.warning("Flood limit on %s to chat %s, retrying in %.1fs", endpoint, chat_id, delay)
+                if chat_id is not None:
+                    self._chat_bucket(chat_id).block(delay)
+                await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, float]:
+        stats = {
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'retries': self.retries,
+            'queued': len(self._heap),
+        }
+        for priority, name in ((PRIORITY_HIGH, 'high'), (PRIORITY_NORMAL, 'normal'), (PRIORITY_LOW, 'low')):
+            values = sorted(self._queue_latency[priority])
+            stats[f'queue_p50_{name}'] = values[len(values) // 2] if values else 0.0
+            stats[f'queue_p99_{name}'] = values[int(len(values) * 0.99)] if values else 0.0
+        return stats
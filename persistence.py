@@ -0,0 +1,189 @@
+"""
+SQLite persistence for user_data and ConversationHandler states.
+
+Unlike PicklePersistence nothing is pickled wholesale:
+- user_data is stored as one JSON row per user, and only rows whose JSON
+  actually changed are written, batched into a single transaction;
+- user_data is loaded lazily the first time a user sends an update after a
+  restart (``refresh_user_data``), never all at once;
+- users idle for PERSISTENCE_IDLE_SECONDS are evicted from memory once their
+  data is on disk and reloaded on their next update.
+
+chat_data, bot_data and callback_data are not used by the bot and not stored.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from database import AsyncDatabase, is_memory
+from storage import database_path
+
+logger = logging.getLogger(__name__)
+
+# defaults to the bot's database (this shard's, in sharded mode); with in-memory
+# storage it gets a private one, since a shared-cache database allows one writer at a time
+PERSISTENCE_PATH = os.getenv('PERSISTENCE_PATH') or (':memory:' if is_memory(database_path()) else database_path())
+PERSISTENCE_INTERVAL = float(os.getenv('PERSISTENCE_INTERVAL', '5'))
+PERSISTENCE_IDLE_SECONDS = float(os.getenv('PERSISTENCE_IDLE_SECONDS', '1800'))
+
+# give update_persistence a moment to hand over every dirty user before writing
+_BATCH_DELAY = 0.05
+
+
+def _dumps(data) -> str:
+    return json.dumps(data, ensure_ascii=False, sort_keys=True)
+
+
+class SQLitePersistence(BasePersistence):
+    def __init__(self, path: str = PERSISTENCE_PATH, update_interval: float = PERSISTENCE_INTERVAL,
+                 idle_seconds: float = PERSISTENCE_IDLE_SECONDS):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.db = AsyncDatabase(path, readers=0)
+        self.idle_seconds = idle_seconds
+        # live user_data dicts loaded into the application, oldest activity first
+        self._live: "OrderedDict[int, dict]" = OrderedDict()
+        self._last_seen: Dict[int, float] = {}
+        # JSON last written per live user, to skip rewriting unchanged data
+        self._written: Dict[int, str] = {}
+        self._dirty_users: Dict[int, str] = {}
+        self._dirty_conversations: Dict[Tuple[str, str], Optional[str]] = {}
+        self._write_task: Optional[asyncio.Task] = None
+        self.writes = 0
+        self.skipped = 0
+        self.evictions = 0
+
+    # --- user_data ---
+
+    async def get_user_data(self) -> Dict[int, dict]:
+        # loaded per user on demand, see refresh_user_data
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        if user_id not in self._live:
+            stored = await self.db.get_persisted_user_data(user_id)
+            if stored is not None:
+                user_data.clear()
+                user_data.update(json.loads(stored))
+            self._written[user_id] = stored if stored is not None else _dumps(user_data)
+            self._live[user_id] = user_data
+        else:
+            self._live.move_to_end(user_id)
+        self._last_seen[user_id] = time.monotonic()
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        serialized = _dumps(data)
+        if self._written.get(user_id) == serialized:
+            self.skipped += 1
+            return
+        self._dirty_users[user_id] = serialized
+        self._schedule_write()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._dirty_users.pop(user_id, None)
+        self._forget(user_id)
+        await self.db.delete_persisted_user_data(user_id)
+
+    def _forget(self, user_id: int) -> None:
+        self._live.pop(user_id, None)
+        self._last_seen.pop(user_id, None)
+        self._written.pop(user_id, None)
+
+    def _evict_idle(self) -> None:
+        cutoff = time.monotonic() - self.idle_seconds
+        while self._live:
+            user_id, user_data = next(iter(self._live.items()))
+            if self._last_seen.get(user_id, 0) > cutoff or user_id in self._dirty_users:
+                break
+            # emptied in place: the application keeps an empty dict and the next
+            # update of this user reloads it through refresh_user_data
+            user_data.clear()
+            self._forget(user_id)
+            self.evictions += 1
+
+    # --- conversations ---
+
+    async def get_conversations(self, name: str) -> Dict[tuple, object]:
+        rows = await self.db.get_persisted_conversations(name)
+        return {tuple(json.loads(r['key'])): json.loads(r['state']) for r in rows}
+
+    async def update_conversation(self, name: str, key: Tuple[int, ...], new_state: Optional[object]) -> None:
+        state = json.dumps(new_state) if new_state is not None else None
+        self._dirty_conversations[(name, json.dumps(list(key)))] = state
+        self._schedule_write()
+
+    # --- batching ---
+
+    def _schedule_write(self) -> None:
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self._write_soon())
+
+    async def _write_soon(self) -> None:
+        await asyncio.sleep(_BATCH_DELAY)
+        await self._write_pending()
+
+    async def _write_pending(self) -> None:
+        users, self._dirty_users = self._dirty_users, {}
+        conversations, self._dirty_conversations = self._dirty_conversations, {}
+        if users:
+            await self.db.save_persisted_user_data(list(users.items()))
+            for user_id, serialized in users.items():
+                if user_id in self._live:
+                    self._written[user_id] = serialized
+            self.writes += len(users)
+        if conversations:
+            await self.db.save_persisted_conversations(
+                [(name, key, state) for (name, key), state in conversations.items()])
+        self._evict_idle()
+
+    async def flush(self) -> None:
+        if self._write_task is not None and not self._write_task.done():
+            await self._write_task
+        await self._write_pending()
+        await self.db.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'live_users': len(self._live),
+            'writes': self.writes,
+            'skipped': self.skipped,
+            'evictions': self.evictions,
+        }
+
+    # --- data the bot does not use ---
+
+    async def get_chat_data(self) -> Dict[int, dict]:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
@@ -0,0 +1,146 @@
+"""
+Bulk import/export of workout programs.
+
+Exercise lines are read by exercise_parser, the same grammar as the
+add-exercise flow (``name reps sets weight [gif]``, ``name 3x12 [weight]``).
+
+Bulk imports come as a multi-line message (``/import <day>`` followed by one
+exercise per line, a line holding only a day name switches the day) or as a
+CSV/JSON document with the columns of EXPORT_FIELDS. Documents are read row
+by row; every bad line is reported with its line number and nothing is
+imported until the whole batch is valid.
+"""
+
+import csv
+import io
+import json
+import os
+from dataclasses import dataclass, field
+from typing import IO, Iterable, List, Optional, Tuple
+
+from exercise_parser import (
+    FORMAT_ERROR, MAX_REPS, MAX_SETS, VALUE_ERROR, ParsedExercise, parse_line, read_count, read_weight
+)
+from ui import DAYS_PERSIAN
+
+IMPORT_MAX_BYTES = int(os.getenv('IMPORT_MAX_BYTES', str(1024 * 1024)))
+IMPORT_MAX_ROWS = int(os.getenv('IMPORT_MAX_ROWS', '1000'))
+
+EXPORT_FIELDS = ('day', 'name', 'reps', 'sets', 'weight', 'gif')
+
+# day names compared without spaces / zero-width non-joiners ("سه شنبه" == "سه‌شنبه")
+_DAYS = {d.replace('\u200c', '').replace(' ', ''): d for d in DAYS_PERSIAN}
+
+
+def normalize_day(text: str) -> Optional[str]:
+    return _DAYS.get(text.strip().rstrip(':').replace('\u200c', '').replace(' ', ''))
+
+
+@dataclass
+class ImportBatch:
+    # (day_name, name, reps, sets, weight, gif), ready for Database.import_exercises
+    rows: List[tuple] = field(default_factory=list)
+    # (line number, message)
+    errors: List[Tuple[int, str]] = field(default_factory=list)
+    truncated: bool = False
+
+    def add(self, lineno: int, day: Optional[str], parse) -> None:
+        if len(self.rows) >= IMPORT_MAX_ROWS:
+            if not self.truncated:
+                self.truncated = True
+                self.errors.append((lineno, f"بیش از {IMPORT_MAX_ROWS} حرکت"))
+            return
+        if day is None:
+            self.errors.append((lineno, "روز مشخص نیست"))
+            return
+        try:
+            self.rows.append((day, *parse()))
+        except ValueError as exc:
+            self.errors.append((lineno, str(exc)))
+
+
+def parse_text_lines(lines: Iterable[str], day: Optional[str] = None, first_lineno: int = 1) -> ImportBatch:
+    batch = ImportBatch()
+    current = normalize_day(day) if day else None
+    if day and current is None:
+        batch.errors.append((first_lineno - 1, f"روز نامعتبر: {day}"))
+    for lineno, line in enumerate(lines, first_lineno):
+        line = line.strip()
+        if not line:
+            continue
+        switched = normalize_day(line)
+        if switched is not None:
+            current = switched
+            continue
+        batch.add(lineno, current, lambda: parse_line(line))
+    return batch
+
+
+def _parse_record(record: dict) -> ParsedExercise:
+    name = str(record.get('name') or '').strip()
+    if not name:
+        raise ValueError(FORMAT_ERROR)
+    # the cells take the same numbers as a typed line (Persian digits, decimal comma)
+    reps = read_count(record.get('reps'), MAX_REPS)
+    sets = read_count(record.get('sets'), MAX_SETS)
+    weight = read_weight(record.get('weight'))
+    gif = str(record.get('gif') or '').strip() or None
+    return ParsedExercise(name, reps, sets, weight, gif)
+
+
+def _record_day(record: dict) -> Optional[str]:
+    return normalize_day(str(record.get('day') or ''))
+
+
+def parse_csv(stream: IO[str]) -> ImportBatch:
+    """Read a CSV with a header row (see EXPORT_FIELDS) one row at a time."""
+    batch = ImportBatch()
+    reader = csv.DictReader(stream)
+    missing = {'day', 'name', 'reps', 'sets'} - set(reader.fieldnames or ())
+    if missing:
+        batch.errors.append((1, "ستون‌های لازم: " + ", ".join(sorted(missing))))
+        return batch
+    for record in reader:
+        batch.add(reader.line_num, _record_day(record), lambda: _parse_record(record))
+    return batch
+
+
+def parse_json(stream: IO[str]) -> ImportBatch:
+    """A JSON list of objects with the EXPORT_FIELDS keys; errors are numbered by item."""
+    batch = ImportBatch()
+    try:
+        records = json.load(stream)
+    except ValueError:
+        batch.errors.append((1, "JSON نامعتبر"))
+        return batch
+    if not isinstance(records, list):
+        batch.errors.append((1, "JSON باید یک لیست باشد"))
+        return batch
+    for index, record in enumerate(records, 1):
+        if not isinstance(record, dict):
+            batch.errors.append((index, FORMAT_ERROR))
+            continue
+        batch.add(index, _record_day(record), lambda: _parse_record(record))
+    return batch
+
+
+async def export_csv(db, user_id: int, out: IO[bytes], page_size: int = 500) -> int:
+    """Write the user's programs to ``out`` as CSV, one database page at a time; returns the row count."""
+    # utf-8-sig so spreadsheet apps recognise the Persian text
+    text = io.TextIOWrapper(out, encoding='utf-8-sig', newline='', write_through=True)
+    writer = csv.writer(text)
+    writer.writerow(EXPORT_FIELDS)
+    count = 0
+    after = None
+    while True:
+        page = await db.get_export_page(user_id, after, page_size)
+        for r in page:
+            writer.writerow((r['day_name'], r['name'], r['reps'], r['sets'], r['weight'], r['gif'] or ''))
+        count += len(page)
+        if len(page) < page_size:
+            break
+        last = page[-1]
+        after = (last['program_id'], last['position'], last['id'])
+    # hand ``out`` back to the caller open
+    text.detach()
+    return count
@@ -0,0 +1,152 @@
+"""
+Daily workout reminders.
+
+Each user may pick a time of day; on days that have a program the bot sends
+"today is <day>" with a one-tap button that starts that program.
+
+The ``reminders`` table is the schedule: ``next_fire_at`` is indexed, so the
+scheduler only ever looks at the head of the queue (the earliest reminder)
+and sleeps until it is due, whatever the number of users. Due rows are
+claimed, i.e. moved on to their next fire time, before anything is sent, so
+a crash or restart can skip a reminder but never send it twice.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import date, datetime, time as dtime, timedelta
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import Forbidden
+
+from callbacks import encode
+from ui import DAYS_PERSIAN
+
+logger = logging.getLogger(__name__)
+
+REMINDER_TIMEZONE = os.getenv('REMINDER_TIMEZONE', 'Asia/Tehran')
+# reminders that are this late (e.g. the bot was down) are skipped instead of sent
+REMINDER_MAX_LATE = float(os.getenv('REMINDER_MAX_LATE', '7200'))
+REMINDER_BATCH_SIZE = int(os.getenv('REMINDER_BATCH_SIZE', '500'))
+
+# upper bound on one sleep, in case the clock jumps
+_MAX_SLEEP = 300.0
+
+
+def persian_day(day: date) -> str:
+    # DAYS_PERSIAN starts on Saturday, date.weekday() on Monday
+    return DAYS_PERSIAN[(day.weekday() + 2) % 7]
+
+
+def next_fire_time(minute_of_day: int, tz: str, after: float) -> float:
+    """First timestamp later than ``after`` that is ``minute_of_day`` local time in ``tz``."""
+    zone = ZoneInfo(tz)
+    at = dtime(minute_of_day // 60, minute_of_day % 60)
+    day = datetime.fromtimestamp(after, zone).date()
+    while True:
+        candidate = datetime.combine(day, at, tzinfo=zone).timestamp()
+        if candidate > after:
+            return candidate
+        day += timedelta(days=1)
+
+
+def format_minute(minute_of_day: int) -> str:
+    return f"{minute_of_day // 60:02d}:{minute_of_day % 60:02d}"
+
+
+class ReminderScheduler:
+    def __init__(self, db, batch_size: int = REMINDER_BATCH_SIZE, max_late: float = REMINDER_MAX_LATE):
+        self.db = db
+        self.batch_size = batch_size
+        self.max_late = max_late
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.sent = 0
+        self.skipped = 0
+
+    async def set(self, user_id: int, chat_id: int, minute_of_day: int, tz: str = REMINDER_TIMEZONE) -> float:
+        next_fire_at = next_fire_time(minute_of_day, tz, time.time())
+        await self.db.set_reminder(user_id, chat_id, minute_of_day, tz, next_fire_at)
+        self.wake()
+        return next_fire_at
+
+    async def clear(self, user_id: int) -> None:
+        await self.db.delete_reminder(user_id)
+
+    def wake(self) -> None:
+        """Re-read the head of the queue; a new reminder may be due earlier."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self, bot) -> None:
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run(bot))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, bot) -> None:
+        while True:
+            try:
+                if await self.run_due(bot) >= self.batch_size:
+                    continue
+                next_at = await self.db.next_reminder_at()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Reminder scheduler iteration failed")
+                next_at = None
+            delay = _MAX_SLEEP if next_at is None else min(_MAX_SLEEP, max(0.0, next_at - time.time()))
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_due(self, bot, now: Optional[float] = None) -> int:
+        """Claim and send one batch of due reminders; returns how many were due."""
+        now = time.time() if now is None else now
+        due = await self.db.get_due_reminders(now, self.batch_size)
+        if not due:
+            return 0
+        claims = [(r['user_id'], r['next_fire_at'], next_fire_time(r['minute_of_day'], r['tz'], max(now, r['next_fire_at'])))
+                  for r in due]
+        claimed = set(await self.db.claim_reminders(claims, now))
+        # sent concurrently; the outbound scheduler paces them
+        await asyncio.gather(*(self._send(bot, r, now) for r in due if r['user_id'] in claimed))
+        return len(due)
+
+    async def _send(self, bot, reminder: dict, now: float) -> None:
+        if now - reminder['next_fire_at'] > self.max_late:
+            self.skipped += 1
+            return
+        # the day the reminder was meant for, even if it fires a little late
+        day = persian_day(datetime.fromtimestamp(reminder['next_fire_at'], ZoneInfo(reminder['tz'])).date())
+        program = await self.db.get_program_by_user_day(reminder['user_id'], day)
+        if program is None:
+            self.skipped += 1
+            return
+        keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("▶️ شروع تمرین", callback_data=encode('start', program['id'], user_id=reminder['user_id']))]])
+        try:
+            await bot.send_message(chat_id=reminder['chat_id'], text=f"🔔 امروز {day} است — تمرین را شروع کنیم؟",
+                                   reply_markup=keyboard)
+            self.sent += 1
+        except Forbidden:
+            # the user blocked the bot
+            logger.info("Dropping reminder of user %s, bot was blocked", reminder['user_id'])
+            await self.db.delete_reminder(reminder['user_id'])
+        except Exception:
+            logger.warning("Reminder for user %s failed", reminder['user_id'], exc_info=True)
+
+    def stats(self):
+        return {'sent': self.sent, 'skipped': self.skipped}
@@ -0,0 +1,145 @@
+"""
+Cache of rendered program views.
+
+Program summaries, edit keyboards and workout step messages only depend on a
+program's exercises, so they are rendered once per (program_id, version) and
+reused until an exercise of that program changes. ``programs.version`` is
+bumped by every edit of the program (see database.py); CachedDatabase keeps
+the current version in memory, so a cache hit costs no database round trip.
+"""
+
+import os
+from typing import Dict, List, Optional, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from cache import LRUCache
+from callbacks import encode
+from ui import WORKOUT_STEP_KEYBOARD
+
+RENDER_CACHE_SIZE = int(os.getenv('RENDER_CACHE_SIZE', '20000'))
+
+EMPTY_PROGRAM = "این برنامه هنوز حرکتی ندارد."
+
+
+def _weight_text(ex: Dict) -> str:
+    return f"{ex.get('weight', 0)} کیلوگرم" if ex.get('weight') and ex.get('weight') > 0 else "بدون وزنه"
+
+
+def render_summary(exercises: List[Dict]) -> str:
+    if not exercises:
+        return EMPTY_PROGRAM
+    lines = []
+    for i, ex in enumerate(exercises, 1):
+        lines.append(f"{i}. {ex['name']} — {ex.get('reps','?')} تکرار × {ex.get('sets','?')} ست — {_weight_text(ex)}")
+    return "\n".join(lines)
+
+
+def render_view_keyboard(program_id: int, user_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("✏️ ویرایش", callback_data=encode('program_edit', program_id, user_id=user_id))],
+        [InlineKeyboardButton("🔁 بازنویسی", callback_data=encode('program_overwrite', program_id, user_id=user_id))],
+        [InlineKeyboardButton("بازگشت", callback_data=encode('menu_back'))]
+    ])
+
+
+def render_edit_keyboard(program_id: int, exercises: List[Dict], user_id: int) -> InlineKeyboardMarkup:
+    keyboard = []
+    last = len(exercises) - 1
+    for i, ex in enumerate(exercises):
+        keyboard.append([InlineKeyboardButton(f"✏️ ویرایش: {ex['name']}",
+                                              callback_data=encode('ex_edit', ex['id'], user_id=user_id))])
+        row = []
+        if i > 0:
+            row.append(InlineKeyboardButton("⬆️", callback_data=encode('ex_place', ex['id'], i - 1, user_id=user_id)))
+        if i < last:
+            row.append(InlineKeyboardButton("⬇️", callback_data=encode('ex_place', ex['id'], i + 1, user_id=user_id)))
+        if last > 1:
+            row.append(InlineKeyboardButton("↕️", callback_data=encode('ex_move', ex['id'], user_id=user_id)))
+        row.append(InlineKeyboardButton("🗑 حذف", callback_data=encode('ex_delete', ex['id'], user_id=user_id)))
+        keyboard.append(row)
+    keyboard.append([InlineKeyboardButton("➕ اضافه کردن حرکت جدید",
+                                          callback_data=encode('ex_add', program_id, user_id=user_id))])
+    keyboard.append([InlineKeyboardButton("بازگشت", callback_data=encode('menu_back'))])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def render_move_keyboard(program_id: int, exercise_id: int, count: int, user_id: int) -> InlineKeyboardMarkup:
+    """Position picker for one exercise: a button per place in the program, five to a row."""
+    places = [InlineKeyboardButton(str(i + 1), callback_data=encode('ex_place', exercise_id, i, user_id=user_id))
+              for i in range(count)]
+    keyboard = [places[i:i + 5] for i in range(0, count, 5)]
+    keyboard.append([InlineKeyboardButton("بازگشت", callback_data=encode('program_edit', program_id, user_id=user_id))])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def render_suggestions(exercise_id: int, suggestions: List[Tuple[int, str]], user_id: int,
+                       menu: InlineKeyboardMarkup) -> InlineKeyboardMarkup:
+    """"Did you mean" buttons renaming the exercise to a catalog entry, above ``menu``."""
+    keyboard = [[InlineKeyboardButton(f"🔤 منظورت «{name}» بود؟",
+                                      callback_data=encode('ex_rename', exercise_id, catalog_id, user_id=user_id))]
+                for catalog_id, name in suggestions]
+    return InlineKeyboardMarkup(keyboard + [list(row) for row in menu.inline_keyboard])
+
+
+def render_step(exercises: List[Dict], idx: int) -> str:
+    ex = exercises[idx]
+    return (
+        f"💪 حرکت {idx+1} از {len(exercises)}\n\n"
+        f"📌 {ex['name']}\n"
+        f"🔁 {ex.get('reps','?')} تکرار\n"
+        f"🔢 ست: {ex.get('sets','?')}\n"
+        f"⚖️ {_weight_text(ex)}\n\n"
+        "بعد از انجام حرکت، «✅ انجام شد» را بزن."
+    )
+
+
+class ProgramRenderer:
+    def __init__(self, db, maxsize: int = RENDER_CACHE_SIZE):
+        self.db = db
+        # entries of old versions are never hit again and age out of the LRU
+        self._cache = LRUCache(maxsize, ttl=float('inf'))
+
+    async def _cached(self, kind: str, program_id: int, render, user_id: Optional[int] = None):
+        version = await self.db.get_program_version(program_id)
+        key = (kind, program_id, version, user_id)
+        value = self._cache.get(key)
+        if value is None:
+            value = render(await self.db.get_exercises(program_id))
+            self._cache.set(key, value)
+        return value
+
+    async def summary(self, program_id: int) -> str:
+        return await self._cached('summary', program_id, render_summary)
+
+    async def view_keyboard(self, program_id: int, user_id: int) -> InlineKeyboardMarkup:
+        # depends on the ids only; buttons are signed for the program's owner
+        key = ('view', program_id, user_id)
+        markup = self._cache.get(key)
+        if markup is None:
+            markup = render_view_keyboard(program_id, user_id)
+            self._cache.set(key, markup)
+        return markup
+
+    async def edit_keyboard(self, program_id: int, user_id: int) -> InlineKeyboardMarkup:
+        return await self._cached('edit', program_id,
+                                  lambda exercises: render_edit_keyboard(program_id, exercises, user_id), user_id)
+
+    def step(self, session: Dict, idx: Optional[int] = None) -> Tuple[str, InlineKeyboardMarkup]:
+        """Message and keyboard for a workout step of ``session``'s exercises."""
+        idx = session['current_index'] if idx is None else idx
+        # sessions pin their program version; only those started before versions were
+        # pinned carry their own copy of the exercises and are rendered per session
+        version = session.get('version')
+        if version is not None:
+            key = ('step', session['program_id'], version, idx)
+        else:
+            key = ('step-session', session['session_id'], idx)
+        text = self._cache.get(key)
+        if text is None:
+            text = render_step(session['exercises'], idx)
+            self._cache.set(key, text)
+        return text, WORKOUT_STEP_KEYBOARD
+
+    def stats(self) -> Dict[str, int]:
+        return self._cache.stats()
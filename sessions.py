@@ -0,0 +1,152 @@
+"""
+Workout session store.
+
+The active session of a user (program, pinned program version and current
+index) lives in the ``sessions`` table and is mirrored in a bounded in-memory
+map. Nothing is loaded at startup: a session is rehydrated from the database
+the first time its user taps a button, so restarts lose no workouts and cost
+nothing up front.
+
+A session keeps the program version it started on: edits made meanwhile
+create new versions and leave the pinned one readable. ``VersionCollector``
+deletes the exercise rows that no open session can see any more, and
+respaces the positions of programs whose exercises were moved too often
+between the same neighbours.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional
+
+from cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+SESSION_CACHE_SIZE = int(os.getenv('SESSION_CACHE_SIZE', '50000'))
+SESSION_CACHE_TTL = float(os.getenv('SESSION_CACHE_TTL', '7200'))
+# how often superseded exercise rows are collected, and how many per statement
+VERSION_GC_INTERVAL = float(os.getenv('VERSION_GC_INTERVAL', '300'))
+VERSION_GC_BATCH = int(os.getenv('VERSION_GC_BATCH', '1000'))
+
+# marks a user known to have no open session
+_NO_SESSION = {}
+
+
+class SessionStore:
+    def __init__(self, db, maxsize: int = SESSION_CACHE_SIZE, ttl: float = SESSION_CACHE_TTL):
+        self.db = db
+        self._sessions = LRUCache(maxsize, ttl)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def active_count(self) -> int:
+        """Open sessions held in memory (users known to have none are cached too)."""
+        return sum(1 for session in self._sessions.values() if session is not _NO_SESSION)
+
+    async def get(self, user_id: int) -> Optional[Dict]:
+        """The open session of ``user_id``, loading it from the database if needed."""
+        session = self._sessions.get(user_id)
+        if session is None:
+            session = await self._load(user_id)
+            self._sessions.set(user_id, session)
+        return session if session is not _NO_SESSION else None
+
+    async def _load(self, user_id: int) -> Dict:
+        row = await self.db.get_active_session(user_id)
+        if row is None:
+            return _NO_SESSION
+        exercises = row['exercises']
+        version = row['version']
+        if exercises is None:
+            # a pinned version is shared by every session on it (and by the render cache);
+            # the oldest sessions pinned nothing and follow the current program
+            exercises = await self.db.get_exercises(row['program_id'], version)
+        else:
+            version = None
+        return {
+            'user_id': user_id,
+            'session_id': row['session_id'],
+            'program_id': row['program_id'],
+            'exercises': exercises,
+            'current_index': row['current_exercise_index'],
+            'version': version,
+        }
+
+    async def start(self, user_id: int, program_id: int, exercises: List[Dict],
+                    version: Optional[int] = None) -> Dict:
+        """Open a session on ``exercises``, which are ``version`` of the program (default: current)."""
+        session_id = await self.db.create_workout_session(user_id, program_id, version)
+        session = {
+            'user_id': user_id,
+            'session_id': session_id,
+            'program_id': program_id,
+            'exercises': exercises,
+            'current_index': 0,
+            # program version the exercises are, if known (see render.py)
+            'version': version,
+        }
+        self._sessions.set(user_id, session)
+        return session
+
+    async def set_index(self, session: Dict, index: int) -> None:
+        session['current_index'] = index
+        await self.db.update_session_exercise_index(session['session_id'], index)
+
+    async def close(self, session: Dict) -> None:
+        await self.db.close_session(session['session_id'])
+        self._sessions.set(session['user_id'], _NO_SESSION)
+
+
+class VersionCollector:
+    """Background upkeep of exercise rows: superseded versions and crowded positions."""
+
+    def __init__(self, db, interval: float = VERSION_GC_INTERVAL, batch_size: int = VERSION_GC_BATCH):
+        self.db = db
+        self.interval = interval
+        self.batch_size = batch_size
+        self.collected = 0
+        self.respaced = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self) -> int:
+        total = 0
+        while True:
+            deleted = await self.db.collect_exercise_versions(self.batch_size)
+            total += deleted
+            if deleted < self.batch_size:
+                break
+            # let updates in between batches
+            await asyncio.sleep(0)
+        self.collected += total
+        self.respaced += await self.db.respace_exercises()
+        return total
+
+    def start(self) -> None:
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                deleted = await self.run_once()
+                if deleted:
+                    logger.info("Collected %d superseded exercise rows", deleted)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Exercise version collection failed")
+
+    def stats(self) -> Dict[str, int]:
+        return {'collected': self.collected, 'respaced': self.respaced}
@@ -0,0 +1,315 @@
+"""
+Sharded multi-process runtime (BOT_MODE=sharded).
+
+A front dispatcher process receives every update and forwards it to one of
+SHARD_COUNT worker processes, picked by ``shard_for(user_id)``. Each worker
+is a full bot (Application, handlers, caches, timers) running the webhook
+runtime on a loopback port, so all updates of a user are handled by one
+process, in order, and the in-memory state of that user never has to be
+shared.
+
+    Telegram ──► front (WEBHOOK_PORT or getUpdates) ──► worker i on 127.0.0.1:SHARD_BASE_PORT+i
+
+Workers answer 503 when they are saturated or draining; the front passes
+that status on, so Telegram redelivers the update later. Dead workers are
+restarted. Storage is selected with STORAGE_URL (see storage.py): one
+SQLite file per shard or one shared database.
+"""
+
+import asyncio
+import hmac
+import json
+import logging
+import multiprocessing
+import os
+import secrets
+import signal
+from typing import Dict, List, Optional
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector, web
+
+from webhook import SECRET_HEADER, WebhookConfig
+
+logger = logging.getLogger(__name__)
+
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '0')) or os.cpu_count() or 1
+SHARD_BASE_PORT = int(os.getenv('SHARD_BASE_PORT', '18500'))
+# pause before a polled update is offered again to a busy shard
+_RETRY_SECONDS = 0.5
+
+# update fields whose object carries the sender in "from"
+_SENDER_FIELDS = (
+    'message', 'edited_message', 'callback_query', 'inline_query', 'chosen_inline_result',
+    'shipping_query', 'pre_checkout_query', 'poll_answer', 'my_chat_member', 'chat_member',
+    'chat_join_request', 'message_reaction',
+)
+# updates without a sender are routed by chat
+_CHAT_FIELDS = ('channel_post', 'edited_channel_post', 'message_reaction_count', 'chat_boost', 'removed_chat_boost')
+
+
+def routing_key(update: dict) -> int:
+    """The user id of an update (chat id when there is no user), as sent by Telegram."""
+    for name in _SENDER_FIELDS:
+        obj = update.get(name)
+        if isinstance(obj, dict):
+            sender = obj.get('from') or obj.get('user')
+            if sender and 'id' in sender:
+                return int(sender['id'])
+            if 'chat' in obj:
+                return int(obj['chat']['id'])
+    for name in _CHAT_FIELDS:
+        obj = update.get(name)
+        if isinstance(obj, dict) and 'chat' in obj:
+            return int(obj['chat']['id'])
+    # nothing to route by; any shard will do
+    return int(update.get('update_id', 0))
+
+
+def shard_for(key: int, shards: int) -> int:
+    return key % shards
+
+
+class ShardRouter:
+    """The front dispatcher's HTTP side: validates updates and forwards them to their shard."""
+
+    def __init__(self, worker_urls: List[str], worker_secret: str, secret: Optional[str] = None,
+                 path: str = "/telegram", timeout: float = 30.0):
+        self.worker_urls = worker_urls
+        self.worker_secret = worker_secret
+        self.secret = secret
+        self.timeout = timeout
+        self.forwarded = [0] * len(worker_urls)
+        self.failed = 0
+        self.web_app = web.Application()
+        self.web_app.router.add_post(path, self.handle_update)
+        self.web_app.router.add_get("/healthz", self.handle_health)
+        self.web_app.router.add_get("/readyz", self.handle_ready)
+        self._session: Optional[ClientSession] = None
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _client(self) -> ClientSession:
+        if self._session is None:
+            self._session = ClientSession(connector=TCPConnector(limit_per_host=256),
+                                          timeout=ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def forward(self, update: dict) -> int:
+        """Send one update to its shard and return the worker's HTTP status."""
+        shard = shard_for(routing_key(update), len(self.worker_urls))
+        session = await self._client()
+        try:
+            async with session.post(self.worker_urls[shard], data=json.dumps(update),
+                                    headers={"Content-Type": "application/json",
+                                             SECRET_HEADER: self.worker_secret}) as resp:
+                status = resp.status
+        except (ClientError, asyncio.TimeoutError):
+            logger.warning("Shard %d unreachable", shard)
+            self.failed += 1
+            return 503
+        if status == 200:
+            self.forwarded[shard] += 1
+        return status
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if self.secret is not None:
+            token = request.headers.get(SECRET_HEADER, "")
+            if not hmac.compare_digest(token, self.secret):
+                return web.Response(status=403)
+        try:
+            update = await request.json(loads=json.loads)
+        except ValueError:
+            return web.Response(status=400)
+        if not isinstance(update, dict):
+            return web.Response(status=400)
+        return web.Response(status=await self.forward(update))
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    async def handle_ready(self, request: web.Request) -> web.Response:
+        session = await self._client()
+        for url in self.worker_urls:
+            ready_url = url.rsplit('/', 1)[0] + "/readyz"
+            try:
+                async with session.get(ready_url) as resp:
+                    if resp.status != 200:
+                        return web.Response(status=503, text="not ready")
+            except (ClientError, asyncio.TimeoutError):
+                return web.Response(status=503, text="not ready")
+        return web.Response(text="ready")
+
+    async def start(self, listen: str, port: int) -> None:
+        self._runner = web.AppRunner(self.web_app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, listen, port).start()
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def stats(self) -> Dict[str, object]:
+        return {'forwarded': list(self.forwarded), 'failed': self.failed}
+
+
+def worker_main(index: int, shards: int, port: int, worker_secret: str, token: str) -> None:
+    """Entry point of a worker process."""
+    # read by storage.py and persistence.py when they are first imported below
+    os.environ['SHARD_INDEX'] = str(index)
+    os.environ['SHARD_COUNT'] = str(shards)
+    from logging_setup import setup_logging
+    setup_logging()
+    import bot
+    from webhook import run_webhook
+    application = bot.build_application(token)
+    logger.info("Shard %d/%d listening on 127.0.0.1:%d", index, shards, port)
+    run_webhook(application, WebhookConfig(listen="127.0.0.1", port=port, path="/telegram",
+                                           secret=worker_secret, url=None))
+
+
+class ShardSupervisor:
+    """Starts the worker processes and restarts any that exit."""
+
+    def __init__(self, token: str, shards: int = SHARD_COUNT, base_port: int = SHARD_BASE_PORT):
+        self.token = token
+        self.shards = shards
+        self.base_port = base_port
+        # only the front knows it; the workers' ports do not accept updates from anywhere else
+        self.worker_secret = secrets.token_urlsafe(32)
+        self._ctx = multiprocessing.get_context("spawn")
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * shards
+        self.restarts = 0
+
+    @property
+    def worker_urls(self) -> List[str]:
+        return [f"http://127.0.0.1:{self.base_port + i}/telegram" for i in range(self.shards)]
+
+    def _spawn(self, index: int) -> None:
+        process = self._ctx.Process(
+            target=worker_main, name=f"shard-{index}",
+            args=(index, self.shards, self.base_port + index, self.worker_secret, self.token))
+        process.start()
+        self.processes[index] = process
+
+    def start(self) -> None:
+        for index in range(self.shards):
+            self._spawn(index)
+
+    def check(self) -> None:
+        for index, process in enumerate(self.processes):
+            if process is not None and not process.is_alive():
+                logger.error("Shard %d exited with %s, restarting", index, process.exitcode)
+                self.restarts += 1
+                self._spawn(index)
+
+    def stop(self, timeout: float = 30.0) -> None:
+        # SIGTERM makes each worker drain its queue before exiting
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                process.join(timeout)
+                if process.is_alive():
+                    process.kill()
+
+
+def prepare_storage(shards: int) -> None:
+    """Create or migrate every database once, before the workers race to do it."""
+    from database import Database
+    from storage import database_path, is_per_shard
+    for shard in range(shards if is_per_shard() else 1):
+        Database(database_path(shard=shard)).close()
+
+
+async def _poll(token: str, router: ShardRouter, stop_event: asyncio.Event, request=None) -> None:
+    """Long-poll getUpdates and forward every batch; ``request`` replaces the HTTP client (tests)."""
+    from telegram import Bot, Update
+    from telegram.error import TelegramError
+    async with Bot(token, request=request, get_updates_request=request) as bot:
+        await bot.delete_webhook()
+        offset = None
+        while not stop_event.is_set():
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=10, allowed_updates=Update.ALL_TYPES)
+            except TelegramError:
+                logger.warning("getUpdates failed", exc_info=True)
+                await asyncio.sleep(1)
+                continue
+            if not updates:
+                continue
+            # users are forwarded concurrently, each user's updates one after another
+            chains: Dict[int, List[dict]] = {}
+            for update in updates:
+                data = update.to_dict()
+                chains.setdefault(routing_key(data), []).append(data)
+            await asyncio.gather(*(_forward_in_order(router, chain, stop_event) for chain in chains.values()))
+            offset = updates[-1].update_id + 1
+
+
+async def _forward_in_order(router: ShardRouter, chain: List[dict], stop_event: asyncio.Event) -> None:
+    for data in chain:
+        while not stop_event.is_set():
+            status = await router.forward(data)
+            if status == 200:
+                break
+            if status != 503:
+                # a permanent answer such as 400 or 403: redelivering cannot help, and
+                # waiting for it would hold back polling for every user
+                logger.error("Shard rejected update %s with HTTP %d, dropping it", data.get('update_id'), status)
+                router.failed += 1
+                break
+            # the shard is busy, restarting or unreachable (forward reports all of them as 503)
+            await asyncio.sleep(_RETRY_SECONDS)
+
+
+async def serve_front(token: str, supervisor: ShardSupervisor, config: WebhookConfig, mode: str,
+                      stop_event: Optional[asyncio.Event] = None) -> None:
+    stop_event = stop_event or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    router = ShardRouter(supervisor.worker_urls, supervisor.worker_secret, config.secret, config.path)
+    poller = None
+    try:
+        if mode == "polling":
+            poller = asyncio.create_task(_poll(token, router, stop_event))
+        else:
+            await router.start(config.listen, config.port)
+            if config.url:
+                from telegram import Bot, Update
+                async with Bot(token) as bot:
+                    await bot.set_webhook(url=config.url.rstrip("/") + config.path, secret_token=config.secret,
+                                          allowed_updates=Update.ALL_TYPES)
+        while not stop_event.is_set():
+            supervisor.check()
+            try:
+                await asyncio.wait_for(stop_event.wait(), 1.0)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        if poller is not None:
+            poller.cancel()
+            try:
+                await poller
+            except asyncio.CancelledError:
+                pass
+        await router.stop()
+        logger.info("Front dispatcher stopped: %s", router.stats())
+
+
+def run_sharded(token: str, shards: int = SHARD_COUNT, ingress: str = "webhook") -> None:
+    """Run the front dispatcher in this process and ``shards`` worker processes."""
+    prepare_storage(shards)
+    supervisor = ShardSupervisor(token, shards)
+    supervisor.start()
+    try:
+        asyncio.run(serve_front(token, supervisor, WebhookConfig.from_env(), ingress))
+    finally:
+        supervisor.stop()
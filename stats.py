@@ -0,0 +1,80 @@
+"""
+Workout history and /stats.
+
+Every exercise finished in a workout is appended to ``workout_log``. In the
+same transaction it is folded into small per-user aggregates (volume per
+week, best weight per exercise, training days and weekly streak), so /stats
+reads a handful of primary-key rows no matter how long the history is.
+
+Weeks follow the Persian calendar week (Saturday to Friday). Days and weeks
+are counted in the time zone of the user's reminder, so a workout falls on the
+same day for the reminder and for /stats; users without a reminder use
+STATS_TIMEZONE.
+"""
+
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+from zoneinfo import ZoneInfo
+
+from reminders import REMINDER_TIMEZONE
+
+STATS_TIMEZONE = os.getenv('STATS_TIMEZONE', REMINDER_TIMEZONE)
+
+
+def week_start(day: date) -> date:
+    # Saturday on or before ``day``
+    return day - timedelta(days=(day.weekday() + 2) % 7)
+
+
+def local_day(ts: float, tz: str = STATS_TIMEZONE) -> date:
+    return datetime.fromtimestamp(ts, ZoneInfo(tz)).date()
+
+
+async def user_timezone(db, user_id: int) -> str:
+    """The zone of the user's reminder, or STATS_TIMEZONE."""
+    reminder = await db.get_reminder(user_id)
+    return reminder['tz'] if reminder and reminder.get('tz') else STATS_TIMEZONE
+
+
+async def log_exercise(db, user_id: int, session_id: Optional[int], exercise: Dict, now: Optional[float] = None):
+    now = time.time() if now is None else now
+    day = local_day(now, await user_timezone(db, user_id))
+    week = week_start(day)
+    return await db.log_exercise(
+        user_id, session_id, exercise['name'], exercise.get('reps'), exercise.get('sets'), exercise.get('weight'),
+        now, day.isoformat(), week.isoformat(), (week - timedelta(days=7)).isoformat())
+
+
+def _number(value: float) -> str:
+    return f"{value:,.0f}" if value == int(value) else f"{value:,.1f}"
+
+
+async def format_stats(db, user_id: int, now: Optional[float] = None) -> str:
+    streak = await db.get_streak(user_id)
+    if streak is None:
+        return "هنوز تمرینی ثبت نشده. بعد از هر حرکت «✅ انجام شد» را بزن تا آمار ساخته شود."
+    weeks = await db.get_weekly_volume(user_id, 4)
+    records = await db.get_personal_records(user_id, 5)
+
+    this_week = week_start(local_day(time.time() if now is None else now, await user_timezone(db, user_id)))
+    # the streak is only current if the user trained this week or last week
+    current = streak['current_weeks']
+    if streak['last_week'] < (this_week - timedelta(days=7)).isoformat():
+        current = 0
+
+    lines = ["📊 آمار تمرین", ""]
+    lines.append(f"🔥 هفته‌های پیاپی: {current} (بیشترین: {streak['longest_weeks']})")
+    lines.append(f"📅 روزهای تمرین: {streak['days']}")
+    lines.append("")
+    lines.append("🏋️ حجم هفتگی (تکرار × ست × وزن):")
+    for w in weeks:
+        marker = " ← این هفته" if w['week_start'] == this_week.isoformat() else ""
+        lines.append(f"• {w['week_start']}: {_number(w['volume'])} کیلوگرم — {w['sets']} ست{marker}")
+    if records:
+        lines.append("")
+        lines.append("🏆 رکوردها:")
+        for r in records:
+            lines.append(f"• {r['exercise_name']}: {_number(r['weight'])} کیلوگرم × {r['reps']}")
+    return "\n".join(lines)
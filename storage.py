@@ -0,0 +1,73 @@
+"""
+Where the bot's data lives.
+
+STORAGE_URL selects the backend:
+
+    (empty)                          gym.db next to the code
+    sqlite:///data/gym.db            one database file shared by every worker
+                                     process (WAL lets them write concurrently)
+    sqlite:///data/gym-{shard}.db    one database file per shard
+    memory://                        a private in-memory database (tests, benchmarks)
+    memory://name                    an in-memory database shared by every
+                                     connection of this process to "name"
+
+``sqlite:////abs/path.db`` is an absolute path. In sharded mode every worker
+process is started with SHARD_INDEX set, and each user is always handled by
+the same shard, so the per-process caches in front of a shared database
+never see another process change that user's rows.
+
+Opening is lazy: ``open_database()`` only builds the handle, and the file is
+created or migrated by the first query.
+
+A networked database server would plug in here as another scheme; the shared
+SQLite file is the stand-in used until one is needed.
+"""
+
+import os
+from typing import Optional
+
+from cache import CachedDatabase
+from database import DB_PATH, AsyncDatabase
+
+STORAGE_URL = os.getenv('STORAGE_URL', '')
+
+SUPPORTED_SCHEMES = ('sqlite', 'memory')
+
+
+def shard_index() -> Optional[int]:
+    value = os.getenv('SHARD_INDEX')
+    return int(value) if value not in (None, '') else None
+
+
+def is_per_shard(url: Optional[str] = None) -> bool:
+    return '{shard}' in (STORAGE_URL if url is None else url)
+
+
+def database_path(url: Optional[str] = None, shard: Optional[int] = None) -> str:
+    """The SQLite path for ``url`` (default STORAGE_URL) as seen by ``shard`` (default SHARD_INDEX)."""
+    url = STORAGE_URL if url is None else url
+    if not url:
+        return DB_PATH
+    scheme, sep, rest = url.partition('://')
+    if not sep or scheme not in SUPPORTED_SCHEMES:
+        raise ValueError(f"Unsupported STORAGE_URL {url!r}; expected sqlite:///path, memory:// or memory://name")
+    if scheme == 'memory':
+        if not rest:
+            return ':memory:'
+        if '{shard}' in rest:
+            rest = rest.replace('{shard}', str(shard if shard is not None else shard_index() or 0))
+        return f"file:{rest}?mode=memory&cache=shared"
+    # sqlite:///relative.db and sqlite:////absolute.db, as in SQLAlchemy
+    path = rest[1:] if rest.startswith('/') else rest
+    if not path:
+        raise ValueError(f"STORAGE_URL {url!r} has no database path")
+    if '{shard}' in path:
+        if shard is None:
+            shard = shard_index() or 0
+        path = path.replace('{shard}', str(shard))
+    return path
+
+
+def open_database(url: Optional[str] = None, shard: Optional[int] = None):
+    """The cached async database handle the handlers use."""
+    return CachedDatabase(AsyncDatabase(database_path(url, shard)))
@@ -0,0 +1,193 @@
+"""
+Tests for the async database front-end.
+"""
+
+import asyncio
+import os
+import sqlite3
+
+from database import AsyncDatabase
+
+
+def test_reads_and_writes_run_off_the_loop(tmp_path):
+    async def scenario():
+        db = AsyncDatabase(str(tmp_path / "gym.db"), readers=2)
+        try:
+            pid = await db.create_workout_program(1, "شنبه")
+            await db.add_exercise(pid, "پرس سینه", 12, 3, 60.0, None, 0)
+            await db.add_exercise(pid, "اسکات", 10, 4, 80.0, None, 1)
+            exercises, programs = await asyncio.gather(db.get_exercises(pid), db.get_user_programs(1))
+            assert [ex["name"] for ex in exercises] == ["پرس سینه", "اسکات"]
+            assert programs == [{"id": pid, "day_name": "شنبه"}]
+            assert await db.get_rest_seconds(1) == 60
+            await db.set_rest_seconds(1, 90)
+            assert await db.get_rest_seconds(1) == 90
+            await db.delete_program(pid)
+            assert await db.get_program(pid) is None
+            assert await db.get_exercises(pid) == []
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_memory_database_uses_writer_for_reads():
+    async def scenario():
+        db = AsyncDatabase(":memory:")
+        try:
+            pid = await db.create_workout_program(2, "یکشنبه")
+            assert (await db.get_program(pid))["user_id"] == 2
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_database_is_opened_on_first_call(tmp_path):
+    path = tmp_path / "gym.db"
+
+    async def scenario():
+        db = AsyncDatabase(str(path), readers=2)
+        assert not db.is_open and not path.exists()
+        # a read opens and migrates the file on the writer before the read-only readers see it
+        assert await db.get_user_programs(1) == []
+        assert db.is_open
+        await db.close()
+        # closing a handle that was never used opens nothing
+        await AsyncDatabase(str(tmp_path / "unused.db")).close()
+
+    asyncio.run(scenario())
+    assert path.exists() and not (tmp_path / "unused.db").exists()
+
+
+def test_shared_memory_database_is_seen_by_every_handle():
+    uri = "file:test-shared?mode=memory&cache=shared"
+
+    async def scenario():
+        first, second = AsyncDatabase(uri), AsyncDatabase(uri)
+        try:
+            pid = await first.create_workout_program(3, "دوشنبه")
+            assert (await second.get_program(pid))["day_name"] == "دوشنبه"
+        finally:
+            await second.close()
+            await first.close()
+        # gone with its last connection
+        fresh = AsyncDatabase(uri)
+        assert await fresh.get_program(pid) is None
+        await fresh.close()
+
+    asyncio.run(scenario())
+    assert not os.path.exists("file:test-shared")
+
+
+def test_batched_durability_groups_commits(tmp_path):
+    path = str(tmp_path / "gym.db")
+
+    async def scenario():
+        db = AsyncDatabase(path, readers=2, durability="batched")
+        db.db.commit_interval = 60  # only the statement count or an explicit flush commits
+        try:
+            pid = await db.create_workout_program(1, "شنبه")
+            sid = await db.create_workout_session(1, pid)
+            for i in range(1, 4):
+                await db.update_session_exercise_index(sid, i)
+            assert db.db.pending == 5
+            # pending writes are read back through the writer connection
+            assert (await db.get_program(pid))["day_name"] == "شنبه"
+            other = sqlite3.connect(path)
+            assert other.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] == 0
+            await db.flush()
+            assert db.db.pending == 0
+            assert other.execute("SELECT current_index FROM sessions").fetchone()[0] == 3
+            other.close()
+            await db.update_session_exercise_index(sid, 5)
+        finally:
+            await db.close()
+        conn = sqlite3.connect(path)
+        assert conn.execute("SELECT current_index FROM sessions").fetchone()[0] == 5
+        conn.close()
+
+    asyncio.run(scenario())
+
+
+def test_batched_flushes_after_interval(tmp_path):
+    path = str(tmp_path / "gym.db")
+
+    async def scenario():
+        db = AsyncDatabase(path, durability="batched")
+        db.db.commit_interval = 0.02
+        try:
+            await db.add_user(1, "a")
+            assert db.db.pending == 1
+            await asyncio.sleep(0.1)
+            assert db.db.pending == 0
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_moves_rewrite_one_position():
+    async def scenario():
+        db = AsyncDatabase(":memory:")
+        try:
+            pid = await db.create_workout_program(1, "شنبه")
+            ids = [await db.add_exercise(pid, name, 10, 3) for name in ("a", "b", "c", "d")]
+            before = {ex["id"]: ex["position"] for ex in await db.get_exercises(pid)}
+            assert await db.move_exercise(ids[3], 0) == pid
+            after = await db.get_exercises(pid)
+            assert [ex["name"] for ex in after] == ["d", "a", "b", "c"]
+            assert [ex["id"] for ex in after if ex["position"] != before[ex["id"]]] == [ids[3]]
+
+            # a workout on the old order keeps it
+            version = await db.get_program_version(pid)
+            await db.create_workout_session(1, pid)
+            # moving back and forth between the same neighbours uses up the gap, then respaces
+            for _ in range(12):
+                await db.move_exercise(ids[2], 1)
+                await db.move_exercise(ids[0], 1)
+            assert [ex["name"] for ex in await db.get_exercises(pid)] == ["d", "a", "c", "b"]
+            assert [ex["name"] for ex in await db.get_exercises(pid, version)] == ["d", "a", "b", "c"]
+            assert await db.move_exercise(ids[1], 99) == pid
+            assert [ex["name"] for ex in await db.get_exercises(pid)] == ["d", "a", "c", "b"]
+            assert await db.move_exercise(12345, 0) is None
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_several_exercises_are_one_version():
+    async def scenario():
+        db = AsyncDatabase(":memory:")
+        try:
+            pid = await db.create_workout_program(1, "شنبه")
+            await db.add_exercise(pid, "a", 10, 3)
+            version = await db.get_program_version(pid)
+            ids = await db.add_exercises(pid, [("b", 10, 3, 0.0, None), ("c", 8, 4, 50.0, "c.gif")])
+            assert await db.get_program_version(pid) == version + 1
+            exercises = await db.get_exercises(pid)
+            assert [(ex["id"], ex["name"]) for ex in exercises[1:]] == list(zip(ids, ["b", "c"]))
+            assert [ex["name"] for ex in await db.get_exercises(pid, version)] == ["a"]
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_crowded_programs_are_respaced():
+    async def scenario():
+        db = AsyncDatabase(":memory:")
+        try:
+            crowded = await db.create_workout_program(1, "شنبه")
+            spaced = await db.create_workout_program(1, "یکشنبه")
+            for i in range(3):
+                await db.add_exercise(crowded, f"c{i}", 10, 3, 0.0, None, i)
+                await db.add_exercise(spaced, f"s{i}", 10, 3)
+            assert await db.respace_exercises() == 1
+            assert [ex["position"] for ex in await db.get_exercises(crowded)] == [1024, 2048, 3072]
+            assert await db.respace_exercises() == 0
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,54 @@
+"""
+Tests for the read-through database cache.
+"""
+
+import asyncio
+
+from cache import CachedDatabase, LRUCache
+from database import AsyncDatabase
+
+
+def test_lru_bound_and_ttl():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)  # evicts 'b', the least recently used
+    assert cache.get('b') is None
+    assert cache.stats() == {'entries': 2, 'hits': 1, 'misses': 1, 'evictions': 1}
+
+    expired = LRUCache(ttl=0)
+    expired.set('a', 1)
+    assert expired.get('a') is None
+
+
+def test_reads_are_cached_and_mutators_invalidate():
+    async def scenario():
+        db = CachedDatabase(AsyncDatabase(":memory:"))
+        try:
+            pid = await db.create_workout_program(1, "شنبه")
+            ex_id = await db.add_exercise(pid, "پرس سینه", 12, 3, 60.0, None, 0)
+            assert len(await db.get_exercises(pid)) == 1
+            assert len(await db.get_exercises(pid)) == 1
+            assert db.stats()['hits'] == 1
+
+            await db.update_exercise(ex_id, "پرس بالا سینه", 10, 3, 50.0, None)
+            assert (await db.get_exercises(pid))[0]['name'] == "پرس بالا سینه"
+            await db.delete_exercise_by_id(ex_id)
+            assert await db.get_exercises(pid) == []
+
+            assert await db.get_rest_seconds(1) == 60
+            await db.set_rest_seconds(1, 90)
+            assert await db.get_rest_seconds(1) == 90
+
+            assert len(await db.get_user_programs(1)) == 1
+            assert (await db.get_program_by_user_day(1, "شنبه"))['id'] == pid
+            await db.create_workout_program(1, "یکشنبه")
+            assert len(await db.get_user_programs(1)) == 2
+            await db.delete_program(pid)
+            assert await db.get_program_by_user_day(1, "شنبه") is None
+            assert len(await db.get_user_programs(1)) == 1
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
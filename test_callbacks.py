@@ -0,0 +1,98 @@
+"""
+Tests for the callback-data codec and router.
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import callbacks
+from callbacks import (
+    CallbackRouter, InvalidCallbackData, StaleCallbackData, decode, encode, pattern,
+)
+
+
+def test_round_trip_and_size():
+    assert decode(encode('menu_back'), 1) == ('menu_back', ())
+    assert decode(encode('set_rest', 90), 1) == ('set_rest', (90,))
+    data = encode('program_delete', 123456789, user_id=42)
+    assert decode(data, 42) == ('program_delete', (123456789,))
+    # Telegram allows 64 bytes of callback_data
+    assert len(encode('ex_edit', 2 ** 63, user_id=2 ** 40).encode()) <= 64
+    with pytest.raises(ValueError):
+        encode('program_view', 1)
+    with pytest.raises(ValueError):
+        encode('day')
+
+
+def test_signed_buttons_are_bound_to_their_user():
+    data = encode('program_delete', 12, user_id=42)
+    with pytest.raises(InvalidCallbackData):
+        decode(data, 43)
+    body, _, tag = data.rpartition(':')
+    forged = body.replace(':12', ':13') + ':' + tag
+    with pytest.raises(InvalidCallbackData):
+        decode(forged, 42)
+    for garbage in ('1zz', '1pd:12', '1sr:x', '1mb:1'):
+        with pytest.raises(InvalidCallbackData):
+            decode(garbage, 42)
+
+
+def test_arguments_outside_their_values_are_rejected():
+    assert decode(encode('set_remind', 21 * 60), 1) == ('set_remind', (1260,))
+    assert decode(encode('day', 6), 1) == ('day', (6,))
+    # signs, other digits and values no button offers
+    for forged in ('1sr:-5', '1sr:+60', '1sr:45', '1sr:۶۰', '1sr: 60', '1sm:99999', '1sm:-1', '1sm:1440',
+                   '1d:7', '1d:-1', '1d:٣'):
+        with pytest.raises(InvalidCallbackData):
+            decode(forged, 1)
+    # a correctly signed negative id is still not an id
+    with pytest.raises(InvalidCallbackData):
+        decode('1pd:-12:' + callbacks._tag('1pd:-12', 42), 42)
+
+
+def test_legacy_payloads_are_stale():
+    for legacy in ('menu_back', 'start_12', 'delete_12', '', None):
+        with pytest.raises(StaleCallbackData):
+            decode(legacy, 1)
+
+
+def test_pattern_matches_only_its_action():
+    assert pattern('menu_new')(encode('menu_new'))
+    assert not pattern('menu_new')(encode('menu_new_add'))
+    assert pattern('day')(encode('day', 3))
+    assert not pattern('day')(encode('menu_back'))
+    assert not pattern('day')('شنبه')
+
+
+def _update(data, user_id=7):
+    return SimpleNamespace(callback_query=SimpleNamespace(data=data, from_user=SimpleNamespace(id=user_id)))
+
+
+def test_router_sets_args_and_rejects_invalid_data():
+    calls = []
+
+    async def view(update, context):
+        calls.append(('view', context.args))
+        return 'viewed'
+
+    async def invalid(update, context):
+        calls.append(('invalid', update.callback_query.data))
+
+    router = CallbackRouter({'program_view': view}, on_invalid=invalid)
+    with pytest.raises(ValueError):
+        CallbackRouter({'no_such_action': view}, on_invalid=invalid)
+
+    async def scenario():
+        context = SimpleNamespace(args=None)
+        assert await router.dispatch(_update(encode('program_view', 5, user_id=7)), context) == 'viewed'
+        await router.dispatch(_update(encode('program_view', 5, user_id=8)), context)
+        await router.dispatch(_update('view_5'), context)
+        # a valid action without a route
+        await router.dispatch(_update(encode('menu_back')), context)
+
+    asyncio.run(scenario())
+    assert calls[0] == ('view', [5])
+    assert [kind for kind, _ in calls[1:]] == ['invalid'] * 3
+    assert router.stats() == {'routes': 1, 'rejected': 3}
@@ -0,0 +1,137 @@
+"""
+Tests for the exercise catalog: name normalization, the in-memory index and
+the catalog table the exercises reference.
+"""
+
+import asyncio
+import sqlite3
+
+import migrations
+from catalog import CatalogIndex, ExerciseCatalog, normalize
+from database import AsyncDatabase, Database
+
+
+def test_normalize_folds_letter_forms_and_spacing():
+    # Arabic yeh and kaf, a ZWNJ, a diacritic, tatweel and extra spaces
+    assert normalize("پرس  سينه") == normalize("پرس سینه") == "پرس سینه"
+    assert normalize("كشش‌زیر بغل") == "کشش زیر بغل"
+    # a zero-width non-joiner separates words, a joiner is dropped
+    assert normalize("پرس\u200cسینه") == normalize("پرس سینه") != normalize("پرسسینه")
+    assert normalize("پرس\u200dسینه") == normalize("پرسسینه")
+    assert normalize("اسکواتَ") == normalize("اسـکوات") == "اسکوات"
+    assert normalize("Bench-Press ۲") == "bench press 2"
+    assert normalize("!!") == "!!"
+
+
+def test_index_prefix_and_similar():
+    index = CatalogIndex()
+    index.load([(1, "پرس سینه"), (2, "پرس سینه دمبل"), (3, "پرس پا"), (4, "اسکوات")])
+    index.add(5, "پرس سرشانه")
+    index.add(5, "duplicate id is ignored")
+
+    assert index.lookup("پرس سينه") == 1
+    assert index.prefix("سی") == [1, 2]
+    assert index.prefix("پرس س") == [1, 5, 2]
+    assert index.prefix("دمبل پر") == [2]
+    assert index.prefix("") == []
+    # a misspelling still finds the entry
+    assert index.similar("پرس سینع")[0][0] == 1
+    assert index.similar("ددد") == []
+
+
+def test_exercises_share_a_catalog_entry_and_its_gif():
+    db = Database(":memory:")
+    p1 = db.create_workout_program(1, "شنبه")
+    p2 = db.create_workout_program(2, "شنبه")
+    db.add_exercise(p1, "پرس سینه", 10, 3, 60, "chest.gif")
+    db.add_exercise(p2, "پرس سينه", 12, 4, 50)
+    db.add_exercise(p2, "اسکوات", 8, 3, 90, "own.gif")
+
+    catalog = db.conn.execute("SELECT name, name_key, gif FROM exercise_catalog ORDER BY id").fetchall()
+    assert [tuple(r) for r in catalog] == [("پرس سینه", "پرس سینه", "chest.gif"), ("اسکوات", "اسکوات", "own.gif")]
+    # stored once, on the entry, and only shown to the exercises that set it
+    assert db.conn.execute("SELECT COUNT(*) FROM exercises WHERE gif IS NOT NULL").fetchone()[0] == 0
+    assert [ex["gif"] for ex in db.get_exercises(p1)] == ["chest.gif"]
+    assert [ex["gif"] for ex in db.get_exercises(p2)] == [None, "own.gif"]
+    db.add_exercise(p2, "پرس  سینه", 8, 3, 40, "chest.gif")
+    assert db.get_exercises(p2)[-1]["gif"] == "chest.gif"
+
+    # a different gif stays on the exercise
+    ex_id = db.get_exercises(p1)[0]["id"]
+    db.update_exercise(ex_id, "پرس سینه", 10, 3, 60, "other.gif")
+    assert db.get_exercises(p1)[0]["gif"] == "other.gif"
+
+    db.import_exercises(1, [("یکشنبه", "اسكوات", 5, 5, 100, None)])
+    assert db.get_catalog_page(after_id=1) == [{"id": 2, "name": "اسکوات"}]
+
+    # renamed to the catalog's spelling, keeping the gif shared with the old entry
+    squat = db.get_exercises(p2)[1]["id"]
+    db.update_exercise(squat, "اسکوت", 8, 3, 90, "squat.gif")
+    assert db.rename_exercise(squat, 2)
+    assert db.get_exercises(p2)[1]["name"] == "اسکوات"
+    assert db.get_exercises(p2)[1]["gif"] == "squat.gif"
+    assert not db.rename_exercise(squat, 99)
+    db.close()
+
+
+def test_a_gif_is_not_shown_to_other_users():
+    db = Database(":memory:")
+    p1 = db.create_workout_program(1, "شنبه")
+    p2 = db.create_workout_program(2, "شنبه")
+    db.add_exercise(p1, "پرس سینه", 10, 3, 60)
+    db.add_exercise(p2, "پرس  سینه", 10, 3, 60, "https://evil.example/x.gif")
+    assert [ex["gif"] for ex in db.get_exercises(p1)] == [None]
+    assert [ex["gif"] for ex in db.get_export_page(1)] == [None]
+    db.close()
+
+
+def test_migration_key_matches_normalize():
+    # the migration keeps its own copy; a change to normalize needs a new migration that re-keys the catalog
+    for name in ("پرس  سينه", "كشش‌زیر بغل", "اسـکواتَ", "Bench-Press ۲", "!!", "پرس\u200dسینه"):
+        assert migrations._catalog_key(name) == normalize(name)
+
+
+def test_migration_builds_the_catalog_from_existing_exercises(tmp_path):
+    path = str(tmp_path / "gym.db")
+    conn = sqlite3.connect(path)
+    migrations.migrate(conn, target=10)
+    conn.execute("INSERT INTO programs (id, user_id, day_name) VALUES (1, 10, 'شنبه'), (2, 11, 'شنبه')")
+    conn.execute("""
+        INSERT INTO exercises (program_id, name, gif, position) VALUES
+            (1, 'پرس سينه', NULL, 1024), (2, 'پرس سینه', 'a.gif', 1024), (2, 'پرس  سینه', 'b.gif', 2048)
+    """)
+    conn.commit()
+    conn.close()
+
+    db = Database(path)
+    assert db.get_catalog_page() == [{"id": 1, "name": "پرس سينه"}]
+    # the exercises keep their own gifs; the first one is the entry's
+    rows = db.conn.execute("SELECT catalog_id, gif, catalog_gif FROM exercises ORDER BY id").fetchall()
+    assert [tuple(r) for r in rows] == [(1, None, 0), (1, "a.gif", 0), (1, "b.gif", 0)]
+    assert db.conn.execute("SELECT gif FROM exercise_catalog").fetchone()[0] == "a.gif"
+    assert [ex["gif"] for ex in db.get_exercises(1)] == [None]
+    db.close()
+
+
+def test_exercise_catalog_loads_new_entries_and_suggests():
+    async def scenario():
+        db = AsyncDatabase(":memory:")
+        pid = await db.create_workout_program(1, "شنبه")
+        await db.add_exercise(pid, "پرس سینه", 10, 3)
+        catalog = ExerciseCatalog(db, refresh_interval=3600, page_size=1)
+
+        assert await catalog.search("پرس") == [(1, "پرس سینه")]
+        assert await catalog.suggest("پرس سینع") == [(1, "پرس سینه")]
+        assert await catalog.suggest("پرس سينه") == []
+
+        await db.add_exercise(pid, "پرس پا", 10, 3)
+        # not reloaded until something was written through the bot, or the interval passed
+        assert await catalog.lookup("پرس پا") is None
+        catalog.note_added()
+        assert await catalog.lookup("پرس پا") == (2, "پرس پا")
+        assert await catalog.search("پرس", limit=5) == [(2, "پرس پا"), (1, "پرس سینه")]
+        assert await catalog.name_of(2) == "پرس پا"
+        assert catalog.stats() == {"entries": 2}
+        await db.close()
+
+    asyncio.run(scenario())
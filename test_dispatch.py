@@ -0,0 +1,65 @@
+"""
+Tests for per-user ordered concurrent update processing.
+"""
+
+import asyncio
+
+from telegram import Chat, Message, Update, User
+
+from dispatch import PerUserUpdateProcessor
+
+
+def _update(update_id, user_id):
+    user = User(user_id, "u", False)
+    message = Message(update_id, None, Chat(user_id, "private"), from_user=user, text="x")
+    return Update(update_id, message=message)
+
+
+def test_same_user_in_order_other_users_concurrent():
+    log = []
+
+    async def handle(uid, n, delay):
+        log.append(("start", uid, n))
+        await asyncio.sleep(delay)
+        log.append(("end", uid, n))
+
+    async def scenario():
+        processor = PerUserUpdateProcessor(workers=4, max_pending=16)
+        tasks = [
+            asyncio.create_task(processor.process_update(_update(1, 1), handle(1, 1, 0.05))),
+            asyncio.create_task(processor.process_update(_update(2, 1), handle(1, 2, 0.0))),
+            asyncio.create_task(processor.process_update(_update(3, 2), handle(2, 1, 0.0))),
+        ]
+        await asyncio.sleep(0.01)
+        assert processor.stats()["waiting_users"] == 1
+        await asyncio.gather(*tasks)
+        assert processor.pending == 0 and processor.processed == 3
+        assert processor.stats()["queue_depth"] == 0
+
+    asyncio.run(scenario())
+    user1 = [entry for entry in log if entry[1] == 1]
+    assert user1 == [("start", 1, 1), ("end", 1, 1), ("start", 1, 2), ("end", 1, 2)]
+    # user 2 did not wait for user 1's slow update
+    assert log.index(("end", 2, 1)) < log.index(("end", 1, 1))
+
+
+def test_worker_bound_and_saturation():
+    running = []
+    peak = []
+
+    async def handle():
+        running.append(1)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+
+    async def scenario():
+        processor = PerUserUpdateProcessor(workers=2, max_pending=4)
+        tasks = [asyncio.create_task(processor.process_update(_update(i, i), handle())) for i in range(4)]
+        await asyncio.sleep(0)
+        assert processor.saturated
+        await asyncio.gather(*tasks)
+        assert not processor.saturated
+
+    asyncio.run(scenario())
+    assert max(peak) == 2
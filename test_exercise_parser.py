@@ -0,0 +1,104 @@
+"""
+Tests for the exercise line parser, including a seeded fuzz test.
+"""
+
+import random
+
+import pytest
+
+from exercise_parser import (
+    FORMAT_ERROR, MAX_LINE_LENGTH, MAX_REPS, MAX_SETS, MAX_WEIGHT, VALUE_ERROR,
+    ExerciseParseError, ParsedExercise, parse_line, parse_lines, read_count, read_weight,
+)
+
+
+def test_digits_decimal_commas_and_sets_by_reps():
+    assert parse_line("پرس سینه ۱۲ ۳ ۶۲٫۵") == ("پرس سینه", 12, 3, 62.5, None)
+    assert parse_line("پرس سینه ١٢ ٣ 62,5") == ("پرس سینه", 12, 3, 62.5, None)
+    # sets x reps, the weight optional
+    assert parse_line("اسکوات 4x10 80kg") == ("اسکوات", 10, 4, 80.0, None)
+    assert parse_line("اسکوات ۴×۱۰") == ("اسکوات", 10, 4, 0.0, None)
+    assert parse_line("Row 3 * 12 40 کیلو https://x/۱.gif") == ("Row", 12, 3, 40.0, "https://x/۱.gif")
+    # a name ending in a number keeps it; spacing inside the name is collapsed
+    assert parse_line("  ساق   ۲  12 3 60 ") == ParsedExercise("ساق ۲", 12, 3, 60.0, None)
+
+
+def test_errors_point_at_the_token():
+    with pytest.raises(ExerciseParseError) as info:
+        parse_line("Squat ten 3 60")
+    assert (info.value.column, info.value.token) == (6, "ten")
+    assert str(info.value) == f"{VALUE_ERROR}: «ten»"
+
+    with pytest.raises(ExerciseParseError) as info:
+        parse_line("پرس سینه 12 ۳ 6o")
+    assert (info.value.column, info.value.token) == (14, "6o")
+
+    with pytest.raises(ExerciseParseError) as info:
+        parse_line("پرس 0 3 60")
+    assert (info.value.column, info.value.token) == (4, "0")
+
+    with pytest.raises(ExerciseParseError, match=FORMAT_ERROR) as info:
+        parse_line("Squat 10")
+    assert info.value.column == 8
+    with pytest.raises(ExerciseParseError, match="نام حرکت"):
+        parse_line("12 3 60")
+    with pytest.raises(ExerciseParseError, match=FORMAT_ERROR):
+        parse_line("Squat " + "1 " * MAX_LINE_LENGTH)
+
+
+def test_parse_lines_numbers_results_and_errors():
+    results = parse_lines("پرس سینه 12 3 60\n\nبد\nاسکوات 4x10", first_lineno=2)
+    assert [(r.lineno, r.exercise and r.exercise.name, r.error and r.error.message) for r in results] == [
+        (2, "پرس سینه", None), (4, None, FORMAT_ERROR), (5, "اسکوات", None)]
+    assert results[1].error.lineno == 4
+
+
+def test_document_cells():
+    assert read_count("۱۲", MAX_REPS) == 12 and read_count(3.0, MAX_SETS) == 3
+    assert read_weight("62,5") == 62.5 and read_weight("") == 0.0 and read_weight(None) == 0.0
+    for bad in ("nan", "1e3", "-1", "0", "2.5", "x"):
+        with pytest.raises(ValueError, match=VALUE_ERROR):
+            read_count(bad, MAX_SETS)
+    with pytest.raises(ValueError):
+        read_weight(str(MAX_WEIGHT + 1))
+
+
+_DIGIT_SCRIPTS = ("0123456789", "۰۱۲۳۴۵۶۷۸۹", "٠١٢٣٤٥٦٧٨٩")
+_NAMES = ("پرس سینه", "Squat", "زیر بغل سیم‌کش", "ساق ۲", "Row-45", "جلو بازو دمبل")
+
+
+def _digits(number: int, rng: random.Random) -> str:
+    script = rng.choice(_DIGIT_SCRIPTS)
+    return ''.join(script[int(d)] for d in str(number))
+
+
+def test_fuzz_round_trip():
+    rng = random.Random(2024)
+    for _ in range(3000):
+        name = rng.choice(_NAMES)
+        reps, sets = rng.randint(1, MAX_REPS), rng.randint(1, MAX_SETS)
+        whole, tenths = rng.randint(0, int(MAX_WEIGHT) - 1), rng.randint(0, 9)
+        weight_text = _digits(whole, rng) + (rng.choice(",.٫") + _digits(tenths, rng) if tenths else "")
+        gif = rng.choice([None, "https://example.com/a.gif", "clip.gif"])
+        if rng.random() < 0.5:
+            line = f"{name} {_digits(reps, rng)} {_digits(sets, rng)} {weight_text}"
+        else:
+            line = f"{name} {_digits(sets, rng)}{rng.choice(['x', ' × ', '*'])}{_digits(reps, rng)} {weight_text}"
+        line += rng.choice(["", "kg", " کیلو"]) + (f" {gif}" if gif else "")
+        assert parse_line(line) == (name, reps, sets, whole + tenths / 10, gif), line
+
+
+def test_fuzz_random_lines_parse_or_fail_cleanly():
+    rng = random.Random(7)
+    alphabet = "ab پرسی 0123۴۵۶٧٨ x×*.,٫-‌\t" + "http:/.gif kg"
+    for _ in range(20000):
+        line = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        try:
+            exercise = parse_line(line)
+        except ExerciseParseError as exc:
+            assert exc.message and 0 <= exc.column <= len(line)
+            assert exc.token == line[exc.column:exc.column + len(exc.token)]
+        else:
+            assert exercise.name and exercise.name == exercise.name.strip()
+            assert 1 <= exercise.reps <= MAX_REPS and 1 <= exercise.sets <= MAX_SETS
+            assert 0 <= exercise.weight <= MAX_WEIGHT
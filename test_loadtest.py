@@ -0,0 +1,24 @@
+"""
+Smoke run of the offline load test: a few synthetic users through every flow.
+"""
+
+import asyncio
+import tempfile
+
+from benchmarks.loadtest import LoadTest
+
+
+def test_synthetic_users_complete_their_workouts():
+    async def scenario():
+        test = LoadTest(users=12, concurrency=6, exercises=3, seed=7)
+        with tempfile.TemporaryDirectory() as workdir:
+            return await test.run(workdir)
+
+    result = asyncio.run(scenario())
+    assert result['handler_errors'] == 0
+    assert result['flow_errors'] == {}
+    assert result['completed'] == 12
+    # /start, menu_new, day, 3 exercises, finish, save, menu_start, program, 3 × done
+    assert result['updates'] == 12 * 13
+    assert result['db']['calls'] > 0 and result['latency']['count'] == result['updates']
+    assert result['api_calls']['answerCallbackQuery'] == 12 * 7
@@ -0,0 +1,86 @@
+"""
+Tests for the queue-based structured logging pipeline.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import queue
+import tempfile
+
+from telegram import Update
+
+import logging_setup
+from logging_setup import (
+    ContextFilter, JsonFormatter, NonBlockingQueueHandler, SamplingFilter, bind, bind_update, make_writer,
+    parse_sample
+)
+
+
+def _record(name="bot", level=logging.INFO, msg="hello %s", args=("world",)):
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+
+def test_sampling_keeps_one_in_n_and_every_warning():
+    sampler = SamplingFilter(parse_sample("httpx=10, telegram.ext=2,bad"))
+    assert sampler.rates == {'httpx': 10, 'telegram.ext': 2}
+    kept = sum(sampler.filter(_record("httpx")) for _ in range(100))
+    assert kept == 10 and sampler.sampled_out == 90
+    assert all(sampler.filter(_record("httpx", logging.WARNING)) for _ in range(5))
+    assert sum(sampler.filter(_record("telegram.ext.Application")) for _ in range(10)) == 5
+    # other loggers and look-alike names are not sampled
+    assert all(sampler.filter(_record("httpxtra")) for _ in range(5))
+    assert all(sampler.filter(_record("handlers")) for _ in range(5))
+
+
+def test_records_carry_the_update_context_as_json():
+    async def handle(update):
+        bind_update(update)
+        bind(handler="menu_callback")
+        record = _record()
+        ContextFilter().filter(record)
+        return record
+
+    update = Update.de_json({"update_id": 77, "callback_query": {
+        "id": "1", "chat_instance": "1", "data": "menu_my",
+        "from": {"id": 5, "is_bot": False, "first_name": "a"},
+        "message": {"message_id": 3, "date": 0, "chat": {"id": 5, "type": "private"}}}}, None)
+    record = asyncio.run(handle(update))
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry['msg'] == "hello world" and entry['level'] == "INFO"
+    assert (entry['update_id'], entry['user_id'], entry['chat_id']) == (77, 5, 5)
+    assert entry['callback_data'] == "menu_my" and entry['handler'] == "menu_callback"
+
+    # outside an update there is no context
+    record = _record()
+    ContextFilter().filter(record)
+    assert 'update_id' not in json.loads(JsonFormatter().format(record))
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = NonBlockingQueueHandler(queue.Queue(2))
+    for _ in range(5):
+        handler.handle(_record())
+    assert handler.queue.qsize() == 2 and handler.dropped == 3
+    queued = handler.queue.get_nowait()
+    assert queued.msg == "hello world" and queued.args is None
+
+
+def test_pipeline_writes_exceptions_to_a_rotating_file():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "logs", "bot-{shard}.log")
+        writer = make_writer(path, "json", shard=2)
+        logging_setup.setup_logging("INFO", writer=writer, sample="")
+        try:
+            try:
+                raise ValueError("broken")
+            except ValueError:
+                logging.getLogger("handlers").exception("handler failed for %d", 5)
+        finally:
+            logging_setup.stop_logging()
+            writer.close()
+        with open(os.path.join(tmp, "logs", "bot-2.log"), encoding="utf-8") as f:
+            entry = json.loads(f.readline())
+        assert entry['msg'] == "handler failed for 5" and entry['logger'] == "handlers"
+        assert "ValueError: broken" in entry['exc']
@@ -0,0 +1,68 @@
+"""
+Tests for the GIF file_id cache.
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+from telegram.error import BadRequest
+
+from database import AsyncDatabase
+from media import MediaCache
+
+URL = "https://example.com/bench-press.gif"
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+        self.reject = set()
+
+    async def send_animation(self, chat_id, animation, **kwargs):
+        self.sent.append((chat_id, animation))
+        if animation in self.reject:
+            raise BadRequest("wrong file identifier")
+        file_id = animation if not animation.startswith("http") else f"file-{len(self.sent)}"
+        return SimpleNamespace(message_id=len(self.sent), animation=SimpleNamespace(file_id=file_id), document=None)
+
+    async def delete_message(self, chat_id, message_id):
+        pass
+
+
+def test_url_uploaded_once_and_shared_across_users():
+    async def scenario():
+        db = AsyncDatabase(":memory:")
+        bot = FakeBot()
+        media = MediaCache(db)
+        await media.send_animation(bot, 1, URL, caption="a")
+        await media.send_animation(bot, 2, URL, caption="b")
+        assert bot.sent == [(1, URL), (2, "file-1")]
+        assert media.stats()["misses"] == 1 and media.stats()["hits"] == 1
+
+        # a fresh process finds the file_id in the database
+        other = MediaCache(db)
+        await other.send_animation(bot, 3, URL)
+        assert bot.sent[-1] == (3, "file-1")
+
+        # a rejected file_id is dropped and the URL uploaded again
+        bot.reject.add("file-1")
+        await other.send_animation(bot, 4, URL)
+        assert bot.sent[-2:] == [(4, "file-1"), (4, URL)]
+        assert await db.get_media_file_ids([URL]) == {URL: "file-5"}
+        await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_prewarm_uploads_to_warmup_chat():
+    async def scenario():
+        db = AsyncDatabase(":memory:")
+        bot = FakeBot()
+        media = MediaCache(db, warmup_chat_id="-100")
+        await media.prewarm(bot, [URL, URL, None, "AgADfileid"])
+        assert bot.sent == [("-100", URL)]
+        await media.send_animation(bot, 1, URL)
+        assert bot.sent[-1] == (1, "file-1")
+        await db.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,100 @@
+"""
+Tests for the metrics registry, handler instrumentation and /metrics.
+"""
+
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, ConversationHandler
+
+import metrics
+from database import AsyncDatabase
+from metrics import MetricsServer, Registry, instrument, instrument_application, observe_api
+
+
+def test_histogram_and_counter_exposition():
+    registry = Registry()
+    latency = registry.histogram('t_seconds', 'latency', ('handler',), buckets=(0.1, 1.0))
+    errors = registry.counter('t_errors_total', 'errors', ('handler',))
+    registry.gauge('t_queue', 'queue', lambda: 3)
+    registry.stats('t_cache', 'cache', lambda: {'hits': 5, 'name': 'x', 'ok': True})
+    for value in (0.05, 0.5, 0.5, 7):
+        latency.observe(value, 'start')
+    errors.inc('say "hi"')
+    text = registry.render()
+    assert '# TYPE t_seconds histogram' in text
+    assert 't_seconds_bucket{handler="start",le="0.1"} 1' in text
+    assert 't_seconds_bucket{handler="start",le="1.0"} 3' in text
+    assert 't_seconds_bucket{handler="start",le="+Inf"} 4' in text
+    assert 't_seconds_count{handler="start"} 4' in text
+    assert 't_errors_total{handler="say \\"hi\\""} 1' in text
+    assert 't_queue 3' in text
+    assert 't_cache{stat="hits"} 5' in text and 'stat="name"' not in text and 'stat="ok"' not in text
+
+
+def test_handler_time_is_split_into_db_and_api():
+    async def scenario():
+        db = AsyncDatabase(":memory:")
+
+        async def menu(update, context):
+            await db.get_rest_seconds(1)
+            observe_api('sendMessage', 0.25)
+
+        async def broken(update, context):
+            raise RuntimeError("boom")
+
+        wrapped = instrument(menu)
+        assert instrument(wrapped) is wrapped
+        before = metrics.HANDLER_SECONDS.count('menu')
+        await wrapped(None, None)
+        try:
+            await instrument(broken)(None, None)
+        except RuntimeError:
+            pass
+        # outside any handler nothing is attributed
+        observe_api('sendMessage', 1.0)
+        await db.close()
+        assert metrics.HANDLER_SECONDS.count('menu') == before + 1
+        assert metrics.HANDLER_API_SECONDS.value('menu') >= 0.25
+        assert metrics.HANDLER_API_SECONDS.value('menu') < 1.0
+        assert metrics.HANDLER_DB_SECONDS.value('menu') > 0
+        assert metrics.DB_SECONDS.count('get_rest_seconds') >= 1
+        assert metrics.HANDLER_ERRORS.value('broken') == 1
+
+    asyncio.run(scenario())
+
+
+def test_instrument_application_reaches_conversation_states():
+    async def start(update, context):
+        pass
+
+    async def day_selected(update, context):
+        return ConversationHandler.END
+
+    application = Application.builder().token("123:TEST").build()
+    conversation = ConversationHandler(
+        entry_points=[CommandHandler('new', start)],
+        states={0: [CallbackQueryHandler(day_selected)]},
+        fallbacks=[CommandHandler('cancel', start)],
+    )
+    application.add_handler(CommandHandler('start', start))
+    application.add_handler(conversation)
+    assert instrument_application(application) == 4
+    assert instrument_application(application) == 0
+    assert conversation.states[0][0].callback._metrics_name == 'day_selected'
+
+
+def test_metrics_endpoint():
+    async def scenario():
+        registry = Registry()
+        registry.gauge('t_up', 'up', lambda: 1)
+        registry.gauge('t_broken', 'raises', lambda: 1 / 0)
+        server = MetricsServer(registry)
+        async with TestClient(TestServer(server.web_app)) as client:
+            resp = await client.get('/metrics')
+            assert resp.status == 200
+            assert resp.content_type == 'text/plain'
+            text = await resp.text()
+        assert 't_up 1' in text and 't_broken' not in text
+
+    asyncio.run(scenario())
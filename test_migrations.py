@@ -0,0 +1,88 @@
+"""
+Tests for the versioned schema migrations.
+"""
+
+import sqlite3
+
+import pytest
+
+import migrations
+from database import Database
+
+
+def _legacy_db(path):
+    # a gym.db as created before migrations existed (user_version 0)
+    conn = sqlite3.connect(path)
+    cur = conn.cursor()
+    migrations._baseline(cur)
+    cur.execute("INSERT INTO programs (id, user_id, day_name) VALUES (1, 10, 'شنبه')")
+    cur.execute("INSERT INTO exercises (program_id, name, position) VALUES (1, 'پرس سینه', 0)")
+    cur.execute("INSERT INTO exercises (program_id, name, position) VALUES (99, 'orphan', 0)")
+    cur.execute("INSERT INTO sessions (user_id, program_id) VALUES (10, 1)")
+    conn.commit()
+    conn.close()
+
+
+def test_upgrades_legacy_database_in_place(tmp_path):
+    path = str(tmp_path / "gym.db")
+    _legacy_db(path)
+
+    db = Database(path)
+    assert migrations.get_version(db.conn) == migrations.LATEST_VERSION
+    assert [ex["name"] for ex in db.get_exercises(1)] == ["پرس سینه"]
+    assert db.conn.execute("SELECT COUNT(*) FROM exercises").fetchone()[0] == 1
+    indexes = {r[0] for r in db.conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"idx_programs_user_day", "idx_exercises_program_position", "idx_sessions_user_open"} <= indexes
+    assert db.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    # deleting a program cascades to its exercises and sessions
+    db.conn.execute("DELETE FROM programs WHERE id = 1")
+    db.conn.commit()
+    assert db.conn.execute("SELECT COUNT(*) FROM exercises").fetchone()[0] == 0
+    assert db.conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] == 0
+    db.close()
+
+
+def test_duplicate_days_are_merged(tmp_path):
+    path = str(tmp_path / "gym.db")
+    conn = sqlite3.connect(path)
+    migrations.migrate(conn, target=8)
+    # what "overwrite" used to leave behind: two programs for one day
+    conn.execute("INSERT INTO programs (id, user_id, day_name) VALUES (1, 10, 'شنبه'), (2, 10, 'شنبه')")
+    conn.execute("INSERT INTO exercises (program_id, name, position) VALUES (1, 'پرس سینه', 0), (2, 'اسکات', 0)")
+    conn.execute("INSERT INTO sessions (user_id, program_id, closed) VALUES (10, 2, 0)")
+    conn.commit()
+    conn.close()
+
+    db = Database(path)
+    assert db.get_user_programs(10) == [{"id": 1, "day_name": "شنبه"}]
+    assert [(ex["name"], ex["position"]) for ex in db.get_exercises(1)] == [("پرس سینه", 1024), ("اسکات", 2048)]
+    assert db.get_active_session(10)["program_id"] == 1
+    # one program per day from now on
+    assert db.create_workout_program(10, "شنبه") == 1
+    with pytest.raises(sqlite3.IntegrityError):
+        db.conn.execute("INSERT INTO programs (user_id, day_name) VALUES (10, 'شنبه')")
+    db.close()
+
+
+def test_current_database_is_not_migrated_again(tmp_path):
+    path = str(tmp_path / "gym.db")
+    Database(path).close()
+    conn = sqlite3.connect(path)
+    assert migrations.migrate(conn) == migrations.LATEST_VERSION
+    conn.close()
+
+
+def test_lookups_use_indexes():
+    db = Database(":memory:")
+    plan = " ".join(r[3] for r in db.conn.execute(
+        "EXPLAIN QUERY PLAN SELECT id, name FROM exercises WHERE program_id = ? ORDER BY position ASC, id ASC", (1,)))
+    assert "idx_exercises_program_position" in plan
+    assert "TEMP B-TREE" not in plan
+    # the current version, as get_exercises reads it
+    plan = " ".join(r[3] for r in db.conn.execute(
+        "EXPLAIN QUERY PLAN SELECT id, name FROM exercises WHERE program_id = ? AND valid_to IS NULL "
+        "ORDER BY position ASC, id ASC", (1,)))
+    assert "idx_exercises_program_position" in plan
+    assert "TEMP B-TREE" not in plan
+    db.close()
@@ -0,0 +1,142 @@
+"""
+Tests for the outbound scheduler (rate limits, priority lane, edit coalescing, retries).
+"""
+
+import asyncio
+import time
+
+from telegram.error import RetryAfter
+
+from outbound import PRIORITY_HIGH, OutboundScheduler
+
+
+def _call(scheduler, log, endpoint, data, priority=None, fail=None):
+    async def callback():
+        if fail:
+            fail.pop()
+            raise RetryAfter(0.05)
+        log.append((endpoint, data.get('text')))
+        return {'text': data.get('text')}
+
+    args = {'priority': priority} if priority is not None else None
+    return scheduler.process_request(callback, (), {}, endpoint, data, args)
+
+
+def test_per_chat_bucket_spaces_messages():
+    async def scenario():
+        scheduler = OutboundScheduler(global_rate=1000, chat_rate=20, chat_burst=1)
+        await scheduler.initialize()
+        log = []
+        start = time.monotonic()
+        await asyncio.gather(*(_call(scheduler, log, 'sendMessage', {'chat_id': 1, 'text': str(i)})
+                               for i in range(5)))
+        elapsed = time.monotonic() - start
+        await scheduler.shutdown()
+        assert [t for _, t in log] == ['0', '1', '2', '3', '4']
+        # one immediately, then four more at 20/s
+        assert elapsed >= 0.18
+
+    asyncio.run(scenario())
+
+
+def test_high_priority_overtakes_queued_edits():
+    async def scenario():
+        scheduler = OutboundScheduler(global_rate=10, chat_rate=1000, chat_burst=1000)
+        scheduler.global_bucket.block(0.1)
+        await scheduler.initialize()
+        log = []
+        edits = [asyncio.create_task(_call(scheduler, log, 'editMessageText',
+                                           {'chat_id': i, 'message_id': 1, 'text': f'menu{i}'}))
+                 for i in range(3)]
+        await asyncio.sleep(0)
+        urgent = asyncio.create_task(_call(scheduler, log, 'sendMessage', {'chat_id': 9, 'text': 'rest over'},
+                                           priority=PRIORITY_HIGH))
+        await asyncio.gather(urgent, *edits)
+        await scheduler.shutdown()
+        assert log[0] == ('sendMessage', 'rest over')
+
+    asyncio.run(scenario())
+
+
+def test_edits_of_same_message_are_coalesced():
+    async def scenario():
+        scheduler = OutboundScheduler(global_rate=1000, chat_rate=10, chat_burst=1)
+        await scheduler.initialize()
+        log = []
+        await _call(scheduler, log, 'sendMessage', {'chat_id': 1, 'text': 'hi'})
+        results = await asyncio.gather(*(_call(scheduler, log, 'editMessageText',
+                                               {'chat_id': 1, 'message_id': 5, 'text': f'v{i}'})
+                                          for i in range(4)))
+        await scheduler.shutdown()
+        assert log == [('sendMessage', 'hi'), ('editMessageText', 'v3')]
+        assert results == [{'text': 'v3'}] * 4
+        assert scheduler.stats()['coalesced'] == 3
+
+    asyncio.run(scenario())
+
+
+def test_retry_after_is_retried():
+    async def scenario():
+        scheduler = OutboundScheduler(global_rate=1000, chat_rate=1000, chat_burst=1000)
+        await scheduler.initialize()
+        log = []
+        result = await _call(scheduler, log, 'sendMessage', {'chat_id': 1, 'text': 'x'}, fail=[1, 1])
+        stats = scheduler.stats()
+        await scheduler.shutdown()
+        assert result == {'text': 'x'}
+        assert stats['retries'] == 2 and stats['sent'] == 1
+
+    asyncio.run(scenario())
+
+
+def test_unlimited_endpoints_pass_through():
+    async def scenario():
+        scheduler = OutboundScheduler(global_rate=1, chat_rate=1, chat_burst=1)
+        await scheduler.initialize()
+        log = []
+        for _ in range(5):
+            await _call(scheduler, log, 'answerCallbackQuery', {'callback_query_id': '1'})
+        await scheduler.shutdown()
+        assert len(log) == 5 and scheduler.stats()['sent'] == 0
+
+    asyncio.run(scenario())
+
+
+def test_initialize_twice_keeps_one_dispatcher():
+    async def scenario():
+        scheduler = OutboundScheduler()
+        # Application.initialize and Updater.initialize both initialize the bot
+        await scheduler.initialize()
+        dispatcher = scheduler._dispatcher
+        await scheduler.initialize()
+        assert scheduler._dispatcher is dispatcher
+        await scheduler.shutdown()
+        assert dispatcher.cancelled()
+
+    asyncio.run(scenario())
+
+
+def test_rest_over_notice_through_a_real_bot():
+    from telegram import Message
+    from telegram.ext import ExtBot
+
+    from benchmarks.loadtest import BOT_TOKEN, FakeBotRequest
+    from handlers import send_rest_over
+
+    async def scenario():
+        api = FakeBotRequest()
+        scheduler = OutboundScheduler(global_rate=1000, chat_rate=1000, chat_burst=1000)
+        bot = ExtBot(BOT_TOKEN, request=api, get_updates_request=api, rate_limiter=scheduler)
+        await bot.initialize()
+        message = Message.de_json({"message_id": 1, "date": 0, "chat": {"id": 5, "type": "private"},
+                                   "text": "rest"}, bot)
+        await send_rest_over(bot, message.chat_id, 60)
+        # a shortcut goes through the scheduler too, in the normal lane
+        await message.reply_text("menu")
+        high, normal = len(scheduler._queue_latency[PRIORITY_HIGH]), len(scheduler._queue_latency[1])
+        await bot.shutdown()
+        return api, high, normal
+
+    api, high, normal = asyncio.run(scenario())
+    assert api.calls['sendMessage'] == 2 and api.chats[5]['text'] == "menu"
+    assert (high, normal) == (1, 1)
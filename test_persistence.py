@@ -0,0 +1,48 @@
+"""
+Tests for the SQLite user_data / conversation persistence.
+"""
+
+import asyncio
+import copy
+
+from persistence import SQLitePersistence
+
+
+def test_user_data_round_trip_with_dirty_tracking_and_eviction(tmp_path):
+    path = str(tmp_path / "gym.db")
+
+    async def first_run():
+        persistence = SQLitePersistence(path, idle_seconds=3600)
+        user_data = {}
+        await persistence.refresh_user_data(1, user_data)
+        user_data.update({'current_program_id': 5, 'current_day': 'شنبه', 'exercise_count': 2})
+        await persistence.update_user_data(1, copy.deepcopy(user_data))
+        await persistence.update_conversation('program_builder', (1, 1), 1)
+        await persistence.update_conversation('program_builder', (2, 2), 1)
+        await persistence.update_conversation('program_builder', (2, 2), None)
+        await persistence.flush()
+        assert persistence.stats()['writes'] == 1
+
+    async def second_run():
+        persistence = SQLitePersistence(path, idle_seconds=0)
+        assert await persistence.get_user_data() == {}
+        assert await persistence.get_conversations('program_builder') == {(1, 1): 1}
+        user_data = {}
+        await persistence.refresh_user_data(1, user_data)
+        assert user_data == {'current_program_id': 5, 'current_day': 'شنبه', 'exercise_count': 2}
+
+        # unchanged data is not written again
+        await persistence.update_user_data(1, copy.deepcopy(user_data))
+        assert persistence.stats()['skipped'] == 1
+
+        user_data['exercise_count'] = 3
+        await persistence.update_user_data(1, copy.deepcopy(user_data))
+        await persistence._write_pending()
+        # idle users are evicted once written and reloaded on their next update
+        assert user_data == {} and persistence.stats()['evictions'] == 1
+        await persistence.refresh_user_data(1, user_data)
+        assert user_data['exercise_count'] == 3
+        await persistence.flush()
+
+    asyncio.run(first_run())
+    asyncio.run(second_run())
@@ -0,0 +1,85 @@
+"""
+Tests for bulk import/export of programs.
+"""
+
+import asyncio
+import io
+import json
+
+import pytest
+
+from cache import CachedDatabase
+from database import POSITION_GAP, AsyncDatabase
+from exercise_parser import parse_line
+from program_io import (
+    FORMAT_ERROR, VALUE_ERROR, export_csv, parse_csv, parse_json, parse_text_lines
+)
+
+
+def test_exercise_line_grammar():
+    assert parse_line("پرس سینه 12 3 60") == ("پرس سینه", 12, 3, 60.0, None)
+    assert parse_line("Squat 10 4 82.5 https://x/y.gif") == ("Squat", 10, 4, 82.5, "https://x/y.gif")
+    with pytest.raises(ValueError, match=FORMAT_ERROR):
+        parse_line("Squat 10")
+    with pytest.raises(ValueError, match=VALUE_ERROR):
+        parse_line("12 3 60")
+    with pytest.raises(ValueError, match=VALUE_ERROR):
+        parse_line("Squat ten 3 60")
+
+
+def test_text_import_reports_errors_per_line():
+    batch = parse_text_lines(["Bench 12 3 60", "", "Bad line", "سه شنبه", "Squat 10 4 80"], "شنبه", first_lineno=2)
+    assert batch.rows == [("شنبه", "Bench", 12, 3, 60.0, None), ("سه‌شنبه", "Squat", 10, 4, 80.0, None)]
+    assert batch.errors == [(4, FORMAT_ERROR)]
+    # no day at all
+    assert parse_text_lines(["Bench 12 3 60"]).errors == [(1, "روز مشخص نیست")]
+
+
+def test_csv_and_json_documents():
+    csv_batch = parse_csv(io.StringIO("day,name,reps,sets,weight,gif\nشنبه,Bench,12,3,60,\nشنبه,Row,x,3,,\n"))
+    assert csv_batch.rows == [("شنبه", "Bench", 12, 3, 60.0, None)]
+    assert csv_batch.errors == [(3, VALUE_ERROR)]
+    # the same numbers as a typed line
+    persian = parse_csv(io.StringIO('day,name,reps,sets,weight,gif\nشنبه,Row,۱۰,3,"62,5",\n'))
+    assert persian.rows == [("شنبه", "Row", 10, 3, 62.5, None)]
+
+    json_batch = parse_json(io.StringIO(json.dumps([{"day": "جمعه", "name": "Run", "reps": 1, "sets": 1}])))
+    assert json_batch.rows == [("جمعه", "Run", 1, 1, 0.0, None)] and not json_batch.errors
+
+
+def test_import_then_export_round_trip():
+    async def scenario():
+        db = CachedDatabase(AsyncDatabase(":memory:"))
+        pid = await db.create_workout_program(7, "شنبه")
+        await db.add_exercise(pid, "Warmup", 1, 1, 0, None, 0)
+        assert len(await db.get_exercises(pid)) == 1  # cached
+
+        rows = [("شنبه", f"Ex{i}", 10, 3, 20.0, None) for i in range(5)] + [("دوشنبه", "Squat", 8, 5, 100.0, "f1")]
+        result = await db.import_exercises(7, rows)
+        assert result["شنبه"] == {"program_id": pid, "added": 5}
+        # appended after the existing exercise and visible through the cache
+        exercises = await db.get_exercises(pid)
+        assert [e["name"] for e in exercises] == ["Warmup"] + [f"Ex{i}" for i in range(5)]
+        assert [e["position"] for e in exercises] == [i * POSITION_GAP for i in range(6)]
+        assert (await db.get_program_by_user_day(7, "دوشنبه"))["id"] == result["دوشنبه"]["program_id"]
+
+        out = io.BytesIO()
+        assert await export_csv(db, 7, out, page_size=2) == 7
+        exported = parse_csv(io.StringIO(out.getvalue().decode("utf-8-sig")))
+        assert not exported.errors
+        assert exported.rows[1:] == rows
+        await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_import_is_atomic():
+    async def scenario():
+        db = AsyncDatabase(":memory:")
+        with pytest.raises(Exception):
+            # the second row has an extra column, so the insert fails after the program was created
+            await db.import_exercises(1, [("شنبه", "A", 1, 1, 0.0, None), ("شنبه", "B", 1, 1, 0.0, None, "extra")])
+        assert await db.get_user_programs(1) == []
+        await db.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,72 @@
+"""
+Tests for the workout reminder scheduler.
+"""
+
+import asyncio
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+from callbacks import encode
+from database import AsyncDatabase
+from reminders import ReminderScheduler, next_fire_time, persian_day
+
+TEHRAN = ZoneInfo("Asia/Tehran")
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        self.sent.append((chat_id, text, reply_markup.inline_keyboard[0][0].callback_data))
+
+
+def _ts(*args) -> float:
+    return datetime(*args, tzinfo=TEHRAN).timestamp()
+
+
+def test_persian_day_and_next_fire_time():
+    # 2024-03-09 was a Saturday
+    assert persian_day(date(2024, 3, 9)) == 'شنبه'
+    assert persian_day(date(2024, 3, 15)) == 'جمعه'
+    # before 08:00 local time: fires the same day, after: the next day
+    assert next_fire_time(8 * 60, "Asia/Tehran", _ts(2024, 3, 9, 7, 0)) == _ts(2024, 3, 9, 8, 0)
+    assert next_fire_time(8 * 60, "Asia/Tehran", _ts(2024, 3, 9, 8, 0)) == _ts(2024, 3, 10, 8, 0)
+    # the same wall-clock time in another timezone is a different instant
+    assert next_fire_time(8 * 60, "UTC", _ts(2024, 3, 9, 7, 0)) == _ts(2024, 3, 9, 11, 30)
+
+
+def test_due_reminder_sent_once_across_restarts():
+    async def scenario():
+        db = AsyncDatabase(":memory:")
+        saturday = await db.create_workout_program(1, 'شنبه')
+        await db.set_reminder(1, 100, 8 * 60, "Asia/Tehran", _ts(2024, 3, 9, 8, 0))
+        await db.set_reminder(2, 200, 8 * 60, "Asia/Tehran", _ts(2024, 3, 9, 8, 0))  # no program that day
+        bot = FakeBot()
+
+        assert await ReminderScheduler(db).run_due(bot, now=_ts(2024, 3, 9, 8, 0, 1)) == 2
+        assert bot.sent == [(100, "🔔 امروز شنبه است — تمرین را شروع کنیم؟", encode('start', saturday, user_id=1))]
+        # a restarted scheduler sees both reminders already moved to the next day
+        assert await ReminderScheduler(db).run_due(bot, now=_ts(2024, 3, 9, 8, 0, 2)) == 0
+        assert (await db.get_reminder(1))['next_fire_at'] == _ts(2024, 3, 10, 8, 0)
+        assert await db.next_reminder_at() == _ts(2024, 3, 10, 8, 0)
+        assert len(bot.sent) == 1
+        await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_stale_reminders_are_skipped_not_sent():
+    async def scenario():
+        db = AsyncDatabase(":memory:")
+        await db.create_workout_program(1, 'شنبه')
+        await db.set_reminder(1, 100, 8 * 60, "Asia/Tehran", _ts(2024, 3, 9, 8, 0))
+        bot = FakeBot()
+        scheduler = ReminderScheduler(db, max_late=3600)
+        # the bot was down for a day and a half
+        await scheduler.run_due(bot, now=_ts(2024, 3, 10, 20, 0))
+        assert bot.sent == [] and scheduler.stats()['skipped'] == 1
+        assert (await db.get_reminder(1))['next_fire_at'] == _ts(2024, 3, 11, 8, 0)
+        await db.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,72 @@
+"""
+Tests for the rendered-view cache and the shared keyboards.
+"""
+
+import asyncio
+
+from cache import CachedDatabase
+from callbacks import decode, encode
+from database import AsyncDatabase
+from render import ProgramRenderer
+from ui import MAIN_MENU, MAIN_MENU_RESUME, WORKOUT_STEP_KEYBOARD, days_keyboard, dynamic_main_menu
+
+
+def test_static_keyboards_are_shared():
+    assert dynamic_main_menu() is MAIN_MENU
+    assert dynamic_main_menu(resume=True) is MAIN_MENU_RESUME
+    assert days_keyboard() is days_keyboard()
+    assert MAIN_MENU_RESUME.inline_keyboard[0][0].callback_data == encode("session_resume")
+
+
+def test_views_are_rerendered_only_after_exercise_changes():
+    async def scenario():
+        db = CachedDatabase(AsyncDatabase(":memory:"))
+        renderer = ProgramRenderer(db)
+        pid = await db.create_workout_program(1, "شنبه")
+        assert await db.get_program_version(pid) == 0
+        ex_id = await db.add_exercise(pid, "Bench", 12, 3, 60.0, None, 0)
+        assert await db.get_program_version(pid) == 1
+
+        summary = await renderer.summary(pid)
+        assert summary == "1. Bench — 12 تکرار × 3 ست — 60.0 کیلوگرم"
+        keyboard = await renderer.edit_keyboard(pid, 1)
+        assert await renderer.summary(pid) is summary
+        assert await renderer.edit_keyboard(pid, 1) is keyboard
+        # buttons are signed for their recipient, so each user gets their own keyboard
+        other = await renderer.edit_keyboard(pid, 2)
+        assert other is not keyboard
+        assert decode(keyboard.inline_keyboard[0][0].callback_data, 1) == ('ex_edit', (ex_id,))
+        # a single exercise cannot move; the second one can move up to index 0
+        assert [decode(b.callback_data, 1).action for b in keyboard.inline_keyboard[1]] == ['ex_delete']
+        second = await db.add_exercise(pid, "Row", 10, 3, 40.0, None)
+        rows = (await renderer.edit_keyboard(pid, 1)).inline_keyboard
+        assert decode(rows[1][0].callback_data, 1) == ('ex_place', (ex_id, 1))
+        assert decode(rows[3][0].callback_data, 1) == ('ex_place', (second, 0))
+        await db.delete_exercise_by_id(second)
+
+        # every kind of exercise mutation bumps the version
+        await db.update_exercise(ex_id, "Incline", 10, 3, 50.0, None)
+        assert (await renderer.summary(pid)).startswith("1. Incline")
+        await db.import_exercises(1, [("شنبه", "Squat", 5, 5, 100.0, None)])
+        assert "2. Squat" in await renderer.summary(pid)
+        await db.delete_exercise_by_id(ex_id)
+        assert (await renderer.summary(pid)).startswith("1. Squat")
+        assert (await renderer.edit_keyboard(pid, 1)) is not keyboard
+        await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_workout_steps_cached_per_version():
+    renderer = ProgramRenderer(db=None)
+    exercises = [{'name': 'Bench', 'reps': 12, 'sets': 3, 'weight': 0}, {'name': 'Row', 'reps': 10, 'sets': 3}]
+    session = {'session_id': 1, 'program_id': 5, 'version': 2, 'exercises': exercises, 'current_index': 1}
+    text, markup = renderer.step(session)
+    assert text.startswith("💪 حرکت 2 از 2") and "بدون وزنه" in text
+    assert markup is WORKOUT_STEP_KEYBOARD
+    # another user's session of the same program version shares the rendering
+    other = dict(session, session_id=2)
+    assert renderer.step(other)[0] is text
+    # a resumed session without a known version is keyed by session
+    resumed = dict(session, session_id=3, version=None, exercises=[exercises[0], dict(exercises[1], name='Pull')])
+    assert "Pull" in renderer.step(resumed)[0]
@@ -0,0 +1,90 @@
+"""
+Tests for the persistent workout session store.
+"""
+
+import asyncio
+
+from database import AsyncDatabase
+from sessions import SessionStore, VersionCollector
+
+
+def test_session_survives_restart(tmp_path):
+    path = str(tmp_path / "gym.db")
+
+    async def first_run():
+        db = AsyncDatabase(path)
+        store = SessionStore(db)
+        pid = await db.create_workout_program(1, "شنبه")
+        await db.add_exercise(pid, "پرس سینه", 12, 3, 60.0, None, 0)
+        await db.add_exercise(pid, "اسکات", 10, 4, 80.0, None, 1)
+        session = await store.start(1, pid, await db.get_exercises(pid))
+        await store.set_index(session, 1)
+        # the program changes after the session started; the session's version does not
+        await db.delete_exercises(pid)
+        await db.add_exercise(pid, "ددلیفت", 5, 5, 100.0, None, 0)
+        await db.close()
+
+    async def second_run():
+        db = AsyncDatabase(path)
+        store = SessionStore(db)
+        assert len(store) == 0  # nothing loaded eagerly
+        session = await store.get(1)
+        assert session["current_index"] == 1
+        assert [ex["name"] for ex in session["exercises"]] == ["پرس سینه", "اسکات"]
+        assert await store.get(2) is None
+        await store.close(session)
+        assert await store.get(1) is None
+        await db.close()
+
+    asyncio.run(first_run())
+    asyncio.run(second_run())
+
+
+def test_one_open_session_per_user():
+    async def scenario():
+        db = AsyncDatabase(":memory:")
+        store = SessionStore(db)
+        pid = await db.create_workout_program(1, "شنبه")
+        first = await store.start(1, pid, [])
+        second = await store.start(1, pid, [])
+        assert (await db.get_active_session(1))["session_id"] == second["session_id"]
+        assert first["session_id"] != second["session_id"]
+        await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_pinned_version_survives_edits_until_collected():
+    async def scenario():
+        db = AsyncDatabase(":memory:")
+        store = SessionStore(db)
+        collector = VersionCollector(db, batch_size=1)
+        pid = await db.create_workout_program(1, "شنبه")
+        bench = await db.add_exercise(pid, "پرس سینه", 12, 3, 60.0, None)
+        squat = await db.add_exercise(pid, "اسکات", 10, 4, 80.0, None)
+        version = await db.get_program_version(pid)
+        session = await store.start(1, pid, await db.get_exercises(pid), version)
+
+        await db.update_exercise(bench, "پرس بالا سینه", 10, 3, 50.0, None)
+        await db.delete_exercise_by_id(squat)
+        await db.add_exercise(pid, "ددلیفت", 5, 5, 100.0, None)
+        current = await db.get_exercises(pid)
+        assert [(ex["id"], ex["name"]) for ex in current][0] == (bench, "پرس بالا سینه")
+        assert [ex["name"] for ex in current] == ["پرس بالا سینه", "ددلیفت"]
+        assert [ex["name"] for ex in await db.get_exercises(pid, version)] == ["پرس سینه", "اسکات"]
+        # reloaded after a restart, the session still reads its version
+        assert (await db.get_active_session(1))["version"] == version
+        assert [ex["name"] for ex in (await SessionStore(db).get(1))["exercises"]] == ["پرس سینه", "اسکات"]
+
+        assert await collector.run_once() == 0
+        await store.close(session)
+        assert await collector.run_once() == 2
+        assert collector.stats() == {'collected': 2, 'respaced': 0}
+        # with no session on the program, edits are made in place
+        await db.update_exercise(bench, "پرس سینه", 12, 3, 60.0, None)
+        await db.delete_exercises(pid)
+        assert await collector.run_once() == 0
+        assert await db.get_exercises(pid) == []
+        await db.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,177 @@
+"""
+Tests for shard routing, the front dispatcher and storage URLs.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+
+import pytest
+from aiohttp import ClientSession, web
+
+import migrations
+from sharding import ShardRouter, routing_key, shard_for
+from storage import database_path
+from webhook import SECRET_HEADER
+
+USER = {"id": 42, "is_bot": False, "first_name": "a"}
+
+
+def test_routing_key_prefers_the_user():
+    message = {"update_id": 1, "message": {"message_id": 1, "from": USER, "chat": {"id": -100}}}
+    callback = {"update_id": 2, "callback_query": {"id": "1", "from": USER, "message": {"chat": {"id": -100}}}}
+    channel = {"update_id": 3, "channel_post": {"message_id": 1, "chat": {"id": -100}}}
+    assert routing_key(message) == 42
+    assert routing_key(callback) == 42
+    assert routing_key(channel) == -100
+    assert routing_key({"update_id": 9}) == 9
+    assert {shard_for(uid, 4) for uid in range(100)} == {0, 1, 2, 3}
+    assert shard_for(42, 4) == shard_for(42, 4)
+
+
+def test_storage_urls():
+    assert database_path("sqlite:///data/gym.db") == "data/gym.db"
+    assert database_path("sqlite:////var/lib/gym.db", shard=3) == "/var/lib/gym.db"
+    assert database_path("sqlite:///data/gym-{shard}.db", shard=3) == "data/gym-3.db"
+    assert database_path("memory://") == ":memory:"
+    assert database_path("memory://gym-{shard}", shard=2) == "file:gym-2?mode=memory&cache=shared"
+    with pytest.raises(ValueError):
+        database_path("postgresql://db/gym")
+
+
+def test_router_forwards_to_the_users_shard():
+    async def scenario():
+        received = {0: [], 1: []}
+        runners = []
+
+        def worker(index):
+            async def handle(request):
+                if request.headers.get(SECRET_HEADER) != "internal":
+                    return web.Response(status=403)
+                update = await request.json()
+                received[index].append(update["update_id"])
+                # shard 1 is saturated for update 7
+                return web.Response(status=503 if update["update_id"] == 7 else 200)
+            app = web.Application()
+            app.router.add_post("/telegram", handle)
+            return app
+
+        for index in range(2):
+            runner = web.AppRunner(worker(index), access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, "127.0.0.1", 18610 + index).start()
+            runners.append(runner)
+
+        router = ShardRouter([f"http://127.0.0.1:{18610 + i}/telegram" for i in range(2)], "internal",
+                             secret="front")
+        await router.start("127.0.0.1", 18620)
+        try:
+            async with ClientSession() as session:
+                async def post(update, secret="front"):
+                    async with session.post("http://127.0.0.1:18620/telegram", json=update,
+                                            headers={SECRET_HEADER: secret}) as resp:
+                        return resp.status
+
+                statuses = [await post({"update_id": i, "message": {"from": dict(USER, id=uid), "chat": {"id": uid}}})
+                            for i, uid in enumerate([10, 11, 12, 13, 14, 15, 16, 17])]
+                assert await post({"update_id": 99}, secret="wrong") == 403
+        finally:
+            await router.stop()
+            for runner in runners:
+                await runner.cleanup()
+
+        assert received == {0: [0, 2, 4, 6], 1: [1, 3, 5, 7]}
+        # the worker's backpressure reaches Telegram unchanged
+        assert statuses == [200] * 7 + [503]
+        assert router.stats() == {"forwarded": [4, 3], "failed": 0}
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_migrations_of_a_shared_file():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "shared.db")
+        barrier = threading.Barrier(4)
+        errors = []
+
+        def run():
+            conn = sqlite3.connect(path, timeout=30)
+            try:
+                barrier.wait()
+                migrations.migrate(conn)
+            except Exception as exc:  # collected for the assertion below
+                errors.append(exc)
+            finally:
+                conn.close()
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert errors == []
+        conn = sqlite3.connect(path)
+        assert migrations.get_version(conn) == migrations.LATEST_VERSION
+        conn.close()
+
+
+def test_poller_drops_rejected_updates_and_advances():
+    from benchmarks.loadtest import BOT_TOKEN, FakeBotRequest
+    from sharding import _poll
+
+    def message(update_id, uid):
+        return {"update_id": update_id, "message": {"message_id": update_id, "date": 0, "text": "x",
+                                                    "from": dict(USER, id=uid), "chat": {"id": uid, "type": "private"}}}
+
+    class Telegram(FakeBotRequest):
+        def __init__(self, stop_event):
+            super().__init__()
+            self.stop_event = stop_event
+            self.offsets = []
+
+        async def do_request(self, url, method, request_data=None, **kwargs):
+            if not url.endswith('/getUpdates'):
+                return await super().do_request(url, method, request_data, **kwargs)
+            offset = (request_data.parameters if request_data else {}).get('offset')
+            self.offsets.append(offset)
+            updates = [message(1, 10), message(2, 10), message(3, 11)] if offset is None else []
+            if offset is not None:
+                self.stop_event.set()
+            return 200, json.dumps({"ok": True, "result": updates}).encode()
+
+    async def scenario():
+        stop_event = asyncio.Event()
+        api = Telegram(stop_event)
+        received, busy = [], [True]
+
+        async def handle(request):
+            update_id = (await request.json())["update_id"]
+            received.append(update_id)
+            if update_id == 1:
+                return web.Response(status=400)
+            if update_id == 3 and busy:
+                busy.pop()
+                return web.Response(status=503)
+            return web.Response()
+
+        app = web.Application()
+        app.router.add_post("/telegram", handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", 18630).start()
+        router = ShardRouter(["http://127.0.0.1:18630/telegram"], "internal")
+        try:
+            await asyncio.wait_for(_poll(BOT_TOKEN, router, stop_event, request=api), 10)
+        finally:
+            await router.stop()
+            await runner.cleanup()
+        return api.offsets, sorted(received), router.stats()
+
+    offsets, received, stats = asyncio.run(scenario())
+    # the 400 is not retried, the 503 is, and polling moves past the batch
+    assert offsets == [None, 4]
+    assert received == [1, 2, 3, 3]
+    assert stats == {"forwarded": [2], "failed": 1}
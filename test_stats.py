@@ -0,0 +1,89 @@
+"""
+Tests for the workout log and its aggregates.
+"""
+
+import asyncio
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+from database import AsyncDatabase
+from stats import format_stats, log_exercise, week_start
+
+TEHRAN = ZoneInfo("Asia/Tehran")
+
+
+def _ts(*args) -> float:
+    return datetime(*args, tzinfo=TEHRAN).timestamp()
+
+
+BENCH = {'name': 'Bench', 'reps': 10, 'sets': 3, 'weight': 60}
+SQUAT = {'name': 'Squat', 'reps': 5, 'sets': 5, 'weight': 100}
+
+
+def test_week_starts_on_saturday():
+    assert week_start(date(2024, 3, 9)) == date(2024, 3, 9)    # Saturday
+    assert week_start(date(2024, 3, 15)) == date(2024, 3, 9)   # Friday
+    assert week_start(date(2024, 3, 16)) == date(2024, 3, 16)
+
+
+def test_aggregates_follow_the_log():
+    async def scenario():
+        db = AsyncDatabase(":memory:")
+        # week of 2024-03-09: two days
+        await log_exercise(db, 2, None, BENCH, now=_ts(2024, 3, 1, 18))
+        assert await log_exercise(db, 1, None, BENCH, now=_ts(2024, 3, 9, 18)) == 2
+        assert await log_exercise(db, 1, None, SQUAT, now=_ts(2024, 3, 9, 18, 20)) == 3
+        await log_exercise(db, 1, None, dict(BENCH, weight=65, reps=8), now=_ts(2024, 3, 12, 18))
+        # next week
+        await log_exercise(db, 1, None, dict(BENCH, weight=55), now=_ts(2024, 3, 17, 18))
+
+        weeks = await db.get_weekly_volume(1)
+        assert [(w['week_start'], w['volume'], w['sets']) for w in weeks] == [
+            ('2024-03-16', 1650.0, 3),
+            ('2024-03-09', 1800.0 + 2500.0 + 1560.0, 11),
+        ]
+        records = {r['exercise_name']: (r['weight'], r['reps']) for r in await db.get_personal_records(1)}
+        assert records == {'Bench': (65.0, 8), 'Squat': (100.0, 5)}
+        streak = await db.get_streak(1)
+        assert (streak['days'], streak['current_weeks'], streak['longest_weeks']) == (3, 2, 2)
+
+        # a skipped week resets the streak but keeps the longest one
+        await log_exercise(db, 1, None, BENCH, now=_ts(2024, 3, 31, 18))
+        streak = await db.get_streak(1)
+        assert (streak['days'], streak['current_weeks'], streak['longest_weeks']) == (4, 1, 2)
+        assert len(await db.get_weekly_volume(1)) == 3
+        await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_format_stats():
+    async def scenario():
+        db = AsyncDatabase(":memory:")
+        assert "هنوز" in await format_stats(db, 1)
+        await log_exercise(db, 1, None, SQUAT, now=_ts(2024, 3, 9, 18))
+        text = await format_stats(db, 1, now=_ts(2024, 3, 10, 9))
+        assert "Squat: 100 کیلوگرم × 5" in text
+        assert "2,500 کیلوگرم" in text and "این هفته" in text
+        # a month later the streak is no longer current
+        assert "هفته‌های پیاپی: 0" in await format_stats(db, 1, now=_ts(2024, 4, 10, 9))
+        await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_days_follow_the_reminder_time_zone():
+    async def scenario():
+        db = AsyncDatabase(":memory:")
+        await db.set_reminder(2, 2, 8 * 60, "America/New_York", 0.0)
+        # early Saturday in Tehran is still Friday evening in New York
+        saturday_night = _ts(2024, 3, 16, 2)
+        await log_exercise(db, 1, None, BENCH, now=saturday_night)
+        await log_exercise(db, 2, None, BENCH, now=saturday_night)
+        tehran = [w['week_start'] for w in await db.get_weekly_volume(1)]
+        new_york = [w['week_start'] for w in await db.get_weekly_volume(2)]
+        assert (tehran, new_york) == (['2024-03-16'], ['2024-03-09'])
+        assert "این هفته" in await format_stats(db, 2, now=saturday_night)
+        await db.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,66 @@
+"""
+Tests for the non-blocking rest timers.
+"""
+
+import asyncio
+
+from timers import RestTimers
+
+
+def test_timer_fires_without_blocking():
+    fired = []
+
+    async def scenario():
+        timers = RestTimers()
+
+        async def done():
+            fired.append("rest")
+
+        timers.schedule(1, 0.01, done)
+        assert timers.is_pending(1)
+        fired.append("handler returned")
+        await asyncio.sleep(0.05)
+        assert not timers.is_pending(1)
+
+    asyncio.run(scenario())
+    assert fired == ["handler returned", "rest"]
+
+
+def test_cancel_and_replace():
+    fired = []
+
+    async def scenario():
+        timers = RestTimers()
+
+        async def first():
+            fired.append(1)
+
+        async def second():
+            fired.append(2)
+
+        timers.schedule(7, 0.01, first)
+        timers.schedule(7, 0.02, second)  # replaces the first timer
+        timers.schedule(8, 0.01, first)
+        assert timers.cancel(8)
+        assert not timers.cancel(8)
+        assert len(timers) == 1
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    assert fired == [2]
+
+
+def test_many_concurrent_timers():
+    fired = []
+
+    async def scenario():
+        timers = RestTimers()
+        for uid in range(5000):
+            async def cb(uid=uid):
+                fired.append(uid)
+            timers.schedule(uid, 0.01, cb)
+        assert len(timers) == 5000
+        await asyncio.sleep(0.2)
+
+    asyncio.run(scenario())
+    assert len(fired) == 5000
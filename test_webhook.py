@@ -0,0 +1,74 @@
+"""
+Tests for the webhook server endpoints.
+"""
+
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+from telegram import Update
+from telegram.ext import Application, MessageHandler, filters
+
+from benchmarks.loadtest import BOT_TOKEN, FakeBotRequest
+from dispatch import PerUserUpdateProcessor
+from webhook import SECRET_HEADER, WebhookConfig, WebhookServer
+
+UPDATE = {"update_id": 1, "message": {"message_id": 1, "date": 0, "chat": {"id": 5, "type": "private"},
+                                      "from": {"id": 5, "is_bot": False, "first_name": "a"}, "text": "/start"}}
+
+
+def test_secret_health_and_drain():
+    async def scenario():
+        application = Application.builder().token("123:TEST").build()
+        server = WebhookServer(application, WebhookConfig(path="/telegram", secret="s3cret"))
+        async with TestClient(TestServer(server.web_app)) as client:
+            resp = await client.post("/telegram", json=UPDATE)
+            assert resp.status == 403
+            resp = await client.post("/telegram", json=UPDATE, headers={SECRET_HEADER: "wrong"})
+            assert resp.status == 403
+            resp = await client.post("/telegram", data="not json", headers={SECRET_HEADER: "s3cret"})
+            assert resp.status == 400
+            resp = await client.post("/telegram", json=UPDATE, headers={SECRET_HEADER: "s3cret"})
+            assert resp.status == 200
+            update = application.update_queue.get_nowait()
+            assert update.message.text == "/start"
+            application.update_queue.task_done()
+
+            assert (await client.get("/healthz")).status == 200
+            assert (await client.get("/readyz")).status == 503  # application not started
+
+            server.config.drain_seconds = 0.1
+            await server.drain()
+            resp = await client.post("/telegram", json=UPDATE, headers={SECRET_HEADER: "s3cret"})
+            assert resp.status == 503
+        assert server.received == 1 and server.rejected == 3
+
+    asyncio.run(scenario())
+
+
+def test_drain_waits_for_running_handlers():
+    async def scenario():
+        api = FakeBotRequest()
+        application = (Application.builder().token(BOT_TOKEN).request(api).get_updates_request(api)
+                       .concurrent_updates(PerUserUpdateProcessor(workers=2)).build())
+        started, finished = asyncio.Event(), []
+
+        async def slow(update, context):
+            started.set()
+            await asyncio.sleep(0.2)
+            finished.append(update.message.text)
+
+        application.add_handler(MessageHandler(filters.ALL, slow))
+        await application.initialize()
+        await application.start()
+        try:
+            server = WebhookServer(application, WebhookConfig(drain_seconds=5))
+            await application.update_queue.put(Update.de_json(UPDATE, application.bot))
+            await started.wait()
+            await server.drain()
+            done = list(finished)
+        finally:
+            await application.stop()
+            await application.shutdown()
+        assert done == ["/start"]
+
+    asyncio.run(scenario())
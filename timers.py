@@ -0,0 +1,64 @@
+"""
+Rest timers for workout sessions.
+
+Instead of sleeping inside a callback handler, every rest period is scheduled on
+the event loop's own timer heap (``loop.call_later``) and the handler returns
+immediately. There is at most one pending timer per user; scheduling a new one
+replaces the old one and every timer can be cancelled by user id.
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RestTimers:
+    def __init__(self):
+        self._handles: Dict[int, asyncio.TimerHandle] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._handles)
+
+    def schedule(self, user_id: int, delay: float, callback: Callable[[], Awaitable[None]]) -> None:
+        """Run ``callback()`` after ``delay`` seconds, replacing any pending timer of the user."""
+        self.cancel(user_id)
+        loop = asyncio.get_running_loop()
+        self._handles[user_id] = loop.call_later(max(0.0, delay), self._fire, user_id, callback)
+
+    def cancel(self, user_id: int) -> bool:
+        """Cancel the pending timer of ``user_id``. Returns True if one was pending."""
+        handle = self._handles.pop(user_id, None)
+        if handle is None:
+            return False
+        handle.cancel()
+        return True
+
+    def is_pending(self, user_id: int) -> bool:
+        return user_id in self._handles
+
+    def cancel_all(self) -> None:
+        for user_id in list(self._handles):
+            self.cancel(user_id)
+        for task in list(self._tasks.values()):
+            task.cancel()
+
+    def _fire(self, user_id: int, callback: Callable[[], Awaitable[None]]) -> None:
+        self._handles.pop(user_id, None)
+        task = asyncio.ensure_future(callback())
+        self._tasks[user_id] = task
+        task.add_done_callback(lambda t, uid=user_id: self._done(uid, t))
+
+    def _done(self, user_id: int, task: asyncio.Task) -> None:
+        if self._tasks.get(user_id) is task:
+            del self._tasks[user_id]
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is not None:
+            logger.error("rest timer callback for user %s failed", user_id, exc_info=exc)
+
+
+rest_timers = RestTimers()
@@ -1,42 +1,77 @@
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
+from callbacks import REST_CHOICES, encode
+
 DAYS_PERSIAN = [
     'شنبه', 'یکشنبه', 'دوشنبه', 'سه‌شنبه', 'چهارشنبه', 'پنجشنبه', 'جمعه'
 ]
 
+# keyboards below never change, so they are built once and shared by every
+# update (telegram objects are frozen after construction)
+
 def main_menu_base():
     return [
-        [InlineKeyboardButton("➕ برنامه جدید", callback_data="menu_new")],
-        [InlineKeyboardButton("📋 برنامه‌ها", callback_data="menu_my")],
-        [InlineKeyboardButton("▶️ شروع تمرین", callback_data="menu_start")],
+        [InlineKeyboardButton("➕ برنامه جدید", callback_data=encode('menu_new'))],
+        [InlineKeyboardButton("📋 برنامه‌ها", callback_data=encode('menu_my'))],
+        [
+            InlineKeyboardButton("▶️ شروع تمرین", callback_data=encode('menu_start')),
+            InlineKeyboardButton("📊 آمار", callback_data=encode('menu_stats'))
+        ],
         [
-            InlineKeyboardButton("⚙️ تنظیمات", callback_data="menu_settings"),
-            InlineKeyboardButton("❓ راهنما", callback_data="menu_help")
+            InlineKeyboardButton("⚙️ تنظیمات", callback_data=encode('menu_settings')),
+            InlineKeyboardButton("❓ راهنما", callback_data=encode('menu_help'))
         ],
     ]
 
-def dynamic_main_menu(context=None) -> InlineKeyboardMarkup:
+MAIN_MENU = InlineKeyboardMarkup(main_menu_base())
+# جلسه تمرین نیمه‌تمام وجود دارد
+MAIN_MENU_RESUME = InlineKeyboardMarkup(
+    [[InlineKeyboardButton("⏯ ادامه تمرین", callback_data=encode('session_resume'))]] + main_menu_base()
+)
+# در حالت ساخت/ادیت برنامه، دکمه‌های کم‌تر و مربوط نمایش بده
+PROGRAM_BUILDER_MENU = InlineKeyboardMarkup([
+    [InlineKeyboardButton("➕ افزودن حرکت", callback_data=encode('menu_new_add'))],
+    [InlineKeyboardButton("✅ ذخیره و بازگشت", callback_data=encode('menu_back'))],
+])
+
+WORKOUT_STEP_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✅ انجام شد", callback_data=encode('exercise_done'))],
+    [InlineKeyboardButton("🔙 بازگشت", callback_data=encode('session_back'))]
+])
+
+# inline mode: typing after the bot's username lists matching exercise names
+CATALOG_SEARCH_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔎 جستجوی نام حرکت", switch_inline_query_current_chat="")]
+])
+
+SETTINGS_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton(f"⏱ {seconds}s", callback_data=encode('set_rest', seconds)) for seconds in REST_CHOICES],
+    [InlineKeyboardButton("⏰ یادآوری تمرین", callback_data=encode('menu_reminder'))],
+    [InlineKeyboardButton("بازگشت", callback_data=encode('menu_back'))]
+])
+
+def dynamic_main_menu(context=None, resume: bool = False) -> InlineKeyboardMarkup:
     # اگر در حال ادیت برنامه‌ای هستیم، منو را تغییر بده
     user_data = context.user_data if context else {}
     if user_data.get('current_program_id'):
-        # در حالت ساخت/ادیت برنامه، دکمه‌های کم‌تر و مربوط نمایش بده
-        menu = [
-            [InlineKeyboardButton("➕ افزودن حرکت", callback_data="menu_new_add")],
-            [InlineKeyboardButton("✅ ذخیره و بازگشت", callback_data="menu_back")],
-        ]
-        return InlineKeyboardMarkup(menu)
+        return PROGRAM_BUILDER_MENU
     # حالت عادی
-    return InlineKeyboardMarkup(main_menu_base())
+    return MAIN_MENU_RESUME if resume else MAIN_MENU
 
-def days_keyboard() -> InlineKeyboardMarkup:
+def _days_keyboard() -> InlineKeyboardMarkup:
     keyboard = []
     days = DAYS_PERSIAN
     for i in range(0, len(days), 2):
         row = []
         for j in range(i, min(i+2, len(days))):
-            row.append(InlineKeyboardButton(days[j], callback_data=days[j]))
+            row.append(InlineKeyboardButton(days[j], callback_data=encode('day', j)))
         keyboard.append(row)
     return InlineKeyboardMarkup(keyboard)
 
+DAYS_KEYBOARD = _days_keyboard()
+
+def days_keyboard() -> InlineKeyboardMarkup:
+    return DAYS_KEYBOARD
+
 # also export a constant for legacy code
-MAIN_MENU_INLINE = dynamic_main_menu()
\ No newline at end of file
+MAIN_MENU_INLINE = MAIN_MENU
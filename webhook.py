@@ -0,0 +1,158 @@
+"""
+Webhook runtime: an embedded aiohttp server that receives updates from
+Telegram and feeds them into the Application's update queue.
+
+Endpoints:
+    POST WEBHOOK_PATH   Telegram updates (checked against WEBHOOK_SECRET)
+    GET  /healthz       process is up
+    GET  /readyz        application is running and accepting updates
+
+On SIGINT/SIGTERM the server stops accepting updates (503), waits up to
+WEBHOOK_DRAIN_SECONDS for queued updates to finish and then shuts down. An
+update is only marked done in the queue once its handler has returned, also
+with concurrent_updates, so joining the queue waits for running handlers.
+"""
+
+import asyncio
+import hmac
+import json
+import logging
+import os
+import signal
+from dataclasses import dataclass
+from typing import Optional
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+@dataclass
+class WebhookConfig:
+    listen: str = "0.0.0.0"
+    port: int = 8443
+    path: str = "/telegram"
+    secret: Optional[str] = None
+    # public URL registered with setWebhook; leave empty when it is set up elsewhere
+    url: Optional[str] = None
+    drain_seconds: float = 10.0
+
+    @classmethod
+    def from_env(cls) -> "WebhookConfig":
+        return cls(
+            listen=os.getenv("WEBHOOK_LISTEN", cls.listen),
+            port=int(os.getenv("WEBHOOK_PORT", cls.port)),
+            path=os.getenv("WEBHOOK_PATH", cls.path),
+            secret=os.getenv("WEBHOOK_SECRET") or None,
+            url=os.getenv("WEBHOOK_URL") or None,
+            drain_seconds=float(os.getenv("WEBHOOK_DRAIN_SECONDS", cls.drain_seconds)),
+        )
+
+
+class WebhookServer:
+    def __init__(self, application: Application, config: WebhookConfig):
+        self.application = application
+        self.config = config
+        self.draining = False
+        self.received = 0
+        self.rejected = 0
+        self.web_app = web.Application()
+        self.web_app.router.add_post(config.path, self.handle_update)
+        self.web_app.router.add_get("/healthz", self.handle_health)
+        self.web_app.router.add_get("/readyz", self.handle_ready)
+        self._runner: Optional[web.AppRunner] = None
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if self.draining:
+            # Telegram retries non-2xx deliveries, so nothing is lost during a deploy
+            return web.Response(status=503)
+        if getattr(self.application.update_processor, "saturated", False):
+            # backpressure: let Telegram redeliver once the workers catch up
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        if self.config.secret is not None:
+            token = request.headers.get(SECRET_HEADER, "")
+            if not hmac.compare_digest(token, self.config.secret):
+                self.rejected += 1
+                return web.Response(status=403)
+        try:
+            data = await request.json(loads=json.loads)
+            update = Update.de_json(data, self.application.bot)
+        except Exception:
+            self.rejected += 1
+            logger.warning("Rejected malformed webhook payload")
+            return web.Response(status=400)
+        self.received += 1
+        await self.application.update_queue.put(update)
+        return web.Response()
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    async def handle_ready(self, request: web.Request) -> web.Response:
+        if self.application.running and not self.draining:
+            return web.Response(text="ready")
+        return web.Response(status=503, text="not ready")
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.web_app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.config.listen, self.config.port)
+        await site.start()
+        logger.info("Webhook listening on %s:%s%s", self.config.listen, self.config.port, self.config.path)
+
+    async def drain(self) -> None:
+        """Stop accepting updates and wait for the queued ones to be processed."""
+        self.draining = True
+        try:
+            await asyncio.wait_for(self.application.update_queue.join(), self.config.drain_seconds)
+        except asyncio.TimeoutError:
+            logger.warning("Drain timed out with %d updates still queued", self.application.update_queue.qsize())
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def serve(application: Application, config: WebhookConfig, stop_event: Optional[asyncio.Event] = None) -> None:
+    """Run the application behind the webhook server until ``stop_event`` is set or a signal arrives."""
+    stop_event = stop_event or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    server = WebhookServer(application, config)
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    try:
+        await server.start()
+        if config.url:
+            await application.bot.set_webhook(
+                url=config.url.rstrip("/") + config.path,
+                secret_token=config.secret,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        await stop_event.wait()
+        await server.drain()
+    finally:
+        await server.stop()
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+def run_webhook(application: Application, config: WebhookConfig) -> None:
+    asyncio.run(serve(application, config))